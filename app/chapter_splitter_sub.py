@@ -12,14 +12,23 @@ from app.storage import postgre
 from app.utils.create_mini_pdf import process_chapters_with_progress
 from app.utils.download_file_minio import download_file_from_minio
 from app.utils.extract_by_chapter import extract_chapter_smart, filter_real_chapters
+from app.utils.extract_by_chapter_md import (
+    chapter_content as extract_chapter_content_md,
+)
+from app.utils.extract_by_chapter_md import (
+    detect_chapters,
+    read_markdown_lines,
+)
 from app.utils.extract_by_chapter_md import (
     extract_chapter_smart as extract_chapter_smart_md,
 )
 from app.utils.extract_by_chapter_md import (
     filter_real_chapters as filter_real_chapters_md,
 )
+from app.utils.keyword_matcher import get_chapter_type_matcher
 from app.utils.logger import get_logger
-from app.utils.minio import upload_to_minio
+from app.utils.metrics import PipelineStep, start_metrics_server
+from app.utils.minio import upload_objects_to_minio
 
 logger = get_logger(__name__)
 
@@ -47,6 +56,15 @@ rabbit_mq = RabbitMQClient(
     password=RABBIT_MQ_PASS,
 )
 
+# Map keyword -> loại chương của HSMT; matcher được biên dịch một lần cho mỗi nội dung map
+CHAPTER_KEYWORD_TYPE_MAP = [
+    {"keyword": "tiêu chuẩn đánh giá", "type": "TCDG"},
+    {"keyword": ["đánh giá", "yêu cầu về kỹ thuật"],
+        # "type": "YCKT"}
+        # Tutda edit
+        "type": "HSKT"}
+]
+
 
 def extract_and_filter_chapters(file_path):
     """
@@ -98,66 +116,38 @@ def process_file_md(download_path, keyword_type_map):
         - download_path: đường dẫn đến file markdown được download từ minio
         - keyword_type_map: Dict hoặc List các Dict chứa keyword và type tương ứng
           Ví dụ: [{"keyword": "1", "type": "1type"}, {"keyword": ["2", "3"], "type": "23type"}]
+          So khớp không phân biệt hoa/thường, dấu, số La Mã/Ả Rập; nhiều mục khớp thì mục đầu tiên thắng
     - Output:
         - trả về một List[Dict] có:
             - name: tên chương
             - page_start: số dòng bắt đầu của chương
-            - path: đường dẫn của file chương trong thư mục Temp
+            - file_name: tên file markdown của chương (upload thẳng từ bộ nhớ, không ghi Temp)
+            - content: nội dung markdown của chương
             - type: loại của chương tương ứng với keyword matched
     """
-    # Lấy danh sách các chương
-    chapters = extract_and_filter_chapters_md(download_path)
-    results = []
+    # Đọc file một lần; phát hiện chương và cắt nội dung đều trên các dòng đã nạp
+    lines = read_markdown_lines(download_path)
+    if lines is None:
+        return []
+    chapters = detect_chapters(lines)
 
-    # Chuẩn hóa keyword_type_map thành list nếu đầu vào là dict đơn lẻ
-    if isinstance(keyword_type_map, dict):
-        keyword_type_map = [keyword_type_map]
-
-    # Duyệt qua từng chương
-    for idx, chapter in enumerate(chapters):
-        # Kiểm tra từng cặp keyword-type
-        for kw_type in keyword_type_map:
-            keywords = kw_type.get("keyword", "")
-            chapter_type = kw_type.get("type", "default_type")
-
-            # Kiểm tra nếu keywords là string đơn
-            if isinstance(keywords, str) and keywords.lower() in chapter.name.lower():
-                matched = True
-            # Kiểm tra nếu keywords là list
-            elif isinstance(keywords, list) and any(kw.lower() in chapter.name.lower() for kw in keywords):
-                matched = True
-            else:
-                matched = False
+    # Phân loại toàn bộ tiêu đề chương bằng matcher đã biên dịch (cache theo nội dung map)
+    chapter_types = get_chapter_type_matcher(keyword_type_map).classify_all(
+        [chapter["title"] for chapter in chapters])
 
-            if matched:
-                # Lấy chi tiết của chương đó
-                chapter_content = extract_chapter_smart_md(
-                    download_path,
-                    chapter_title=chapter.name
-                )
-
-                if chapter_content:
-                    # Tạo file tạm cho chương
-                    file_dir = os.path.dirname(download_path)
-                    file_name = os.path.basename(download_path).split(".")[0]
-                    temp_file_path = os.path.join(
-                        file_dir,
-                        f"{file_name}_chapter_{idx+1}.md"
-                    )
-
-                    # Ghi nội dung chương vào file
-                    with open(temp_file_path, "w", encoding="utf-8") as f:
-                        f.write(chapter_content["content"])
-
-                    results.append({
-                        "name": chapter.name,
-                        "page_start": chapter.page_start,
-                        "path": temp_file_path,
-                        "type": chapter_type
-                    })
-
-                # Break để không kiểm tra các keyword khác nếu đã match
-                break
+    file_name = os.path.basename(download_path).split(".")[0]
+    results = []
+    for idx, (chapter, chapter_type) in enumerate(zip(chapters, chapter_types)):
+        if chapter_type is None:
+            continue
+        chapter_content = extract_chapter_content_md(lines, chapters, idx)
+        results.append({
+            "name": chapter["title"],
+            "page_start": chapter["line"],
+            "file_name": f"{file_name}_chapter_{idx+1}.md",
+            "content": chapter_content["content"],
+            "type": chapter_type
+        })
 
     return results
 
@@ -191,8 +181,7 @@ def consume_callback(ch, method, properties, body):
         # 1. Query trong bảng email contents theo hs_id
         hs_id = message["id"]
         # Insert History SQL
-        inserted_step_chapter_splitter = postgre.insertHistorySQL(
-            hs_id=hs_id, step="CHAPTER_SPLITER")
+        step_chapter_splitter = PipelineStep(hs_id=hs_id, step="CHAPTER_SPLITER")
         query = """ 
             SELECT ec.id
             FROM email_contents ec
@@ -219,13 +208,6 @@ def consume_callback(ch, method, properties, body):
 
         print(" [x] Original file paths: ", original_file_paths)
         files_object = []
-        keyword_type_map = [
-            {"keyword": "tiêu chuẩn đánh giá", "type": "TCDG"},
-            {"keyword": ["đánh giá", "yêu cầu về kỹ thuật"],
-                # "type": "YCKT"}
-                # Tutda edit
-                "type": "HSKT"}
-        ]
         for f in files:
             email_content_id = f["email_content_id"]
             file_name = f["file_path"].split("/")[-1]
@@ -251,7 +233,7 @@ def consume_callback(ch, method, properties, body):
                         "\\", "/")
                     # Chia thành các file nhỏ hơn và lưu vào Temp
                     results_processed_chapter = process_file_md(
-                        download_path, keyword_type_map)
+                        download_path, CHAPTER_KEYWORD_TYPE_MAP)
                 # ✅ Chuyển tiếp dữ liệu sang bước tiếp theo: Markdown Queue
                 if len(results_processed_chapter) == 0:
                     # Get sender
@@ -288,24 +270,24 @@ def consume_callback(ch, method, properties, body):
                     )
                     return
 
-                for rpc in results_processed_chapter:
-                    # file_path_fixed = result["path"].replace("\\", "/").split("/")[-1]
-                    uploaded_files = upload_to_minio(
-                        file_paths=rpc["path"],
-                        bucket_name=MINIO_BUCKET,
-                        minio_endpoint=f"http://{MINIO_API_ENDPOINT}",
-                        access_key=MINIO_ACCESS_KEY,
-                        secret_key=MINIO_SECRET_KEY,
-                    )
-                    if uploaded_files:
+                # Upload song song tất cả các chương từ bộ nhớ, dùng chung một client
+                uploaded_links = upload_objects_to_minio(
+                    [(rpc["file_name"], rpc["content"].encode("utf-8")) for rpc in results_processed_chapter],
+                    bucket_name=MINIO_BUCKET,
+                    minio_endpoint=f"http://{MINIO_API_ENDPOINT}",
+                    access_key=MINIO_ACCESS_KEY,
+                    secret_key=MINIO_SECRET_KEY,
+                )
+                for rpc, uploaded_link in zip(results_processed_chapter, uploaded_links):
+                    if uploaded_link:
                         files_object.append(
                             {
-                                "file_name": uploaded_files[0].split("/")[-1],
+                                "file_name": uploaded_link.split("/")[-1],
                                 "file_type": file_type,
                                 "file_path": file_path,
                                 "document_detail_id": None,
                                 "classify_type": classify_type,
-                                "markdown_link": uploaded_files[0],
+                                "markdown_link": uploaded_link,
                                 "chapter_name": rpc["type"],
                             }
                         )
@@ -326,25 +308,27 @@ def consume_callback(ch, method, properties, body):
                     }
                 )
 
-        for file in files_object:
-            email_content_id = original_file_paths.get(file["file_type"], None)
-            sql = """
-                INSERT INTO document_detail (email_content_id, file_name, link,link_md,chapter_name)
-                VALUES (%s, %s, %s,%s,%s) 
-                RETURNING id;
-            """
-            params = (email_content_id,
-                      file["file_name"], file["file_path"], file["markdown_link"], file["chapter_name"])
-            inserted_id = postgre.executeSQL(sql, params)
-            if inserted_id:
-                # Gán ID vào files_object
-                file["document_detail_id"] = inserted_id
+        # Một câu INSERT nhiều dòng cho mọi document_detail, id trả về theo đúng thứ tự files_object
+        sql = """
+            INSERT INTO document_detail (email_content_id, file_name, link,link_md,chapter_name)
+            VALUES %s
+            RETURNING id;
+        """
+        params_list = [
+            (original_file_paths.get(file["file_type"], None),
+             file["file_name"], file["file_path"], file["markdown_link"], file["chapter_name"])
+            for file in files_object
+        ]
+        inserted_rows = postgre.executeValuesSQL(sql, params_list)
+        for file, row in zip(files_object, inserted_rows):
+            # Gán ID vào files_object
+            file["document_detail_id"] = row[0]
 
         # files_object = [
         #     {k: v for k, v in file.items() if k != "file_type"} for file in files_object
         # ]
         # Update Hisotry End Date SQL
-        postgre.updateHistoryEndDateSQL(inserted_step_chapter_splitter)
+        step_chapter_splitter.finish()
         if files_object:
             next_queue = RABBIT_MQ_EXTRACTION_QUEUE
             next_message = {"id": hs_id, "files": files_object}
@@ -369,6 +353,7 @@ def chapter_splitter_sub():
     signal.signal(signal.SIGINT, signal_handler)
 
     queue = RABBIT_MQ_CHPATER_SPLITER_QUEUE
+    start_metrics_server(default_port=9102)
     rabbit_mq.start_consumer(queue, consume_callback)
 
 
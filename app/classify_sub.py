@@ -6,9 +6,10 @@ from datetime import datetime
 from zoneinfo import ZoneInfo
 from app.config.env import EnvSettings
 from app.mq.rabbit_mq import RabbitMQClient
-from app.storage.postgre import insertHistorySQL, updateHistoryEndDateSQL
+from app.utils import dossier_fingerprint
 from app.utils.classify import check_hsmt_file_type, classify
 from app.utils.logger import get_logger
+from app.utils.metrics import PipelineStep, start_metrics_server
 from app.utils.smtp_mail import send_email_with_attachments
 
 logger = get_logger(__name__)
@@ -27,6 +28,7 @@ RABBIT_MQ_PASS = EnvSettings().RABBIT_MQ_PASS
 RABBIT_MQ_CLASSIFY_QUEUE = EnvSettings().RABBIT_MQ_CLASSIFY_QUEUE
 RABBIT_MQ_MARKDOWN_QUEUE = EnvSettings().RABBIT_MQ_MARKDOWN_QUEUE
 RABBIT_MQ_SEND_MAIL_QUEUE = EnvSettings().RABBIT_MQ_SEND_MAIL_QUEUE
+RABBIT_MQ_SQL_ANSWER_QUEUE = EnvSettings().RABBIT_MQ_SQL_ANSWER_QUEUE
 
 # Khởi tạo RabbitMQClient dùng chung
 rabbit_mq = RabbitMQClient(
@@ -68,7 +70,7 @@ def consume_callback(ch, method, properties, body):
     hs_id = message["id"]
     email = message["email"]
     # Insert History SQL
-    inserted_step_classify = insertHistorySQL(hs_id=hs_id, step="CLASSIFY")
+    step_classify = PipelineStep(hs_id=hs_id, step="CLASSIFY")
     result = classify(hs_id, email)
     result_check_hsmt = check_hsmt_file_type(result["message"])
     status = result_check_hsmt["status"]
@@ -76,11 +78,14 @@ def consume_callback(ch, method, properties, body):
     if status == "success":
         print(f" [x] Classify success: {message}")
         # Update history end date with inserted_step_classify
-        updateHistoryEndDateSQL(inserted_step_classify)
+        step_classify.finish()
+        if reuse_previous_extraction(hs_id):
+            return
         next_queue = RABBIT_MQ_MARKDOWN_QUEUE
         rabbit_mq.publish(next_queue, message)
     else:
         print(f" [x] Classify failed: {message}")
+        step_classify.close()
         """ next_queue = RABBIT_MQ_SEND_MAIL_QUEUE
         message = {
             "email_content_id": "",
@@ -111,6 +116,29 @@ def consume_callback(ch, method, properties, body):
             f"Email sent to {email} regarding hs_id {hs_id} with result: {result}")
 
 
+def reuse_previous_extraction(hs_id: str) -> bool:
+    """Hồ sơ gửi lại y hệt một hồ sơ đã bóc tách: sao chép proposal cũ và chuyển thẳng sang bước SQL answer,
+    bỏ qua tách chương và bóc tách. Trả về False để chạy pipeline bình thường (kể cả khi là bản sửa đổi:
+    các mục không đổi được kho fingerprint mục trả lời trong bước bóc tách)."""
+    match = dossier_fingerprint.match_dossier(hs_id)
+    if not match or match.kind != "duplicate":
+        return False
+    step_extraction = PipelineStep(hs_id=hs_id, step="EXTRACTION")
+    try:
+        next_message = dossier_fingerprint.reuse_extraction(hs_id, match)
+        if not next_message:
+            step_extraction.close()
+            return False
+        step_extraction.finish()
+    except Exception as e:
+        step_extraction.close()
+        logger.error(f" [!] Could not reuse proposal {match.proposal_id} for hs_id {hs_id}: {e}", exc_info=True)
+        return False
+    logger.info(f" [x] hs_id {hs_id} is a resubmission of {match.hs_id}, extraction reused")
+    rabbit_mq.publish(RABBIT_MQ_SQL_ANSWER_QUEUE, next_message)
+    return True
+
+
 def classify_sub():
     """
         classify_queue
@@ -124,4 +152,5 @@ def classify_sub():
     signal.signal(signal.SIGINT, signal_handler)
 
     queue = RABBIT_MQ_CLASSIFY_QUEUE
+    start_metrics_server(default_port=9101)
     rabbit_mq.start_consumer(queue, consume_callback, auto_ack=True)
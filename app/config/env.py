@@ -29,6 +29,7 @@ class EnvSettings(BaseSettings, case_sensitive=True):
     RABBIT_MQ_SEND_MAIL_QUEUE: str = ""
     RABBIT_MQ_SQL_ANSWER_QUEUE: str = ""
     RABBIT_MQ_CLASSIFY_QUEUE: str = ""
+    RABBIT_MQ_OCR_QUEUE: str = ""
     RABBIT_MQ_AUTO_ACKNOWLEDGE: bool = True
     MINIO_API_ENDPOINT: str = ""
     MINIO_CONSOLE_ENDPOINT: str = ""
@@ -43,6 +44,42 @@ class EnvSettings(BaseSettings, case_sensitive=True):
     GMAIL_RECIPIENT: str = ""
     GOOGLE_AI_STUDIO_KEY: str = ""
     LOGGING_LEVEL: str = "DEBUG"
+    METRICS_ENABLED: bool = True
+    METRICS_PORT: int = 0
+    SECTION_ROUTER_ENABLED: bool = True
+    SECTION_STORE_ENABLED: bool = True
+    SECTION_STORE_MAX_DISTANCE: int = 3
+    SECTION_STORE_TTL_DAYS: int = 90
+    DOSSIER_DEDUP_ENABLED: bool = True
+    DOSSIER_AMENDMENT_MIN_SIMILARITY: float = 0.8
+    HR_MERGE_LLM_FALLBACK: bool = True
+    CASCADE_MODELS: str = ""
+    CASCADE_MAX_OUTPUT_TOKENS: int = 16000
+    CASCADE_MAX_CONTINUATIONS: int = 3
+    EXTRACTION_STREAMING_ENABLED: bool = True
+    STREAM_MAX_REPEATS: int = 3
+    CASCADE_REPAIR_ENABLED: bool = True
+    CASCADE_EMPTY_MIN_CONTENT_TOKENS: int = 800
+    CLASSIFY_SAMPLE_FIRST: bool = True
+    CLASSIFY_SAMPLE_PAGES: int = 3
+    CLASSIFY_SAMPLE_OCR_PAGES: int = 2
+    CLASSIFY_MAX_WORKERS: int = 4
+    CLASSIFY_MAX_PROCESSES: int = 2
+    TESSERACT_ENABLED: bool = True
+    TESSERACT_LANG: str = "vie"
+    TESSERACT_MIN_CONFIDENCE: float = 80.0
+    TESSERACT_MAX_WORKERS: int = 4
+    OCR_MAX_CONCURRENCY: int = 8
+    OCR_MAX_RETRIES: int = 4
+    OCR_TIMEOUT: float = 120.0
+    OCR_OUTPUT_TOKEN_BUDGET: int = 6000
+    OCR_MAX_PAGES_PER_BATCH: int = 4
+    OCR_DISTRIBUTED_MIN_PAGES: int = 80
+    OCR_PAGES_PER_JOB: int = 20
+    OCR_PART_TIMEOUT: float = 900.0
+    OCR_JOB_TIMEOUT: float = 3600.0
+    OCR_PARTS_BUCKET: str = "ocr-parts"
+    OCR_PARTS_EXPIRY_DAYS: int = 1
 
     model_config = SettingsConfigDict(env_file=".env", extra="allow")
 
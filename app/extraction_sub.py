@@ -17,6 +17,11 @@ from app.nodes.agentic_proposal_v2.proposal_md_team_v2_0_0 import (
 )
 from app.storage import pgdb, postgre
 from app.utils.logger import get_logger
+from app.utils.metrics import (
+    LLMMetricsCallbackHandler,
+    PipelineStep,
+    start_metrics_server,
+)
 
 logger = get_logger(__name__)
 
@@ -136,13 +141,14 @@ def consume_callback_v2(ch, method, properties, body):
         inputs = {"hs_id": hs_id, "document_file_md": files}
         try:
             # Insert History SQL
-            inserted_step_extraction = postgre.insertHistorySQL(
-                hs_id=hs_id, step="EXTRACTION"
-            )
+            step_extraction = PipelineStep(hs_id=hs_id, step="EXTRACTION")
             res = proposal_md_team_graph_v2_0_0_instance.invoke(
                 inputs,
                 config={
-                    "callbacks": [langfuse_handler.env_ai_proposal()],
+                    "callbacks": [
+                        langfuse_handler.env_ai_proposal(),
+                        LLMMetricsCallbackHandler(),
+                    ],
                     "metadata": {
                         "langfuse_user_id": f"extraction_sub_{hs_id}@hpt.vn",
                     },
@@ -150,8 +156,8 @@ def consume_callback_v2(ch, method, properties, body):
             )
             
             # Update Hisotry End Date SQL
-            postgre.updateHistoryEndDateSQL(inserted_step_extraction)
-            if not inserted_step_extraction:
+            step_extraction.finish()
+            if not step_extraction.history_id:
                 logger.error(
                     "Không insert được trạng thái 'EXTRACTION' vào history với hs_id: %s",
                     hs_id,
@@ -191,4 +197,5 @@ def extraction_sub():
     # Register the signal handler for SIGINT (Ctrl+C)
     signal.signal(signal.SIGINT, signal_handler)
     queue = RABBIT_MQ_EXTRACTION_QUEUE
+    start_metrics_server(default_port=9103)
     rabbit_mq.start_consumer(queue, consume_callback_v2)
@@ -0,0 +1,391 @@
+"""
+Model cascade for the extraction nodes.
+
+A call first runs the first (cheapest) model of ``CASCADE_MODELS`` (comma
+separated, cheapest first; empty = ``OPENAI_MODEL`` only) and validates the
+output against the node's Pydantic schema. It only escalates when the output
+cannot be accepted:
+
+- ``invalid`` (not JSON, or schema validation failed): one targeted repair
+  prompt on the same model, sending only the faulty output, the error and the
+  schema (not the document), then the next model;
+- ``truncated`` (``finish_reason == "length"``): when the node has a stitch
+  function, the complete elements are salvaged and the same model is asked
+  for the remaining ones only, up to ``CASCADE_MAX_CONTINUATIONS`` times
+  (see ``truncation``); otherwise, or if that fails, the same model again
+  with twice the output budget, up to ``CASCADE_MAX_OUTPUT_TOKENS``, then
+  the next model. A salvaged partial result is returned as a last resort,
+  flagged ``partial`` by ``run`` so callers do not cache it as complete;
+- ``empty`` (no item although the content has at least
+  ``CASCADE_EMPTY_MIN_CONTENT_TOKENS`` tokens): the next model; the empty
+  result is kept when no model finds anything;
+- ``runaway`` (streaming only, see ``json_stream``): the looping generation
+  is aborted, its complete distinct elements are kept as a partial result
+  and the next model is tried;
+- ``error`` (API error): the next model.
+
+With ``stream=True`` (JSON mode) the response is streamed and parsed
+incrementally: each array element is handed to ``on_item`` as soon as it
+closes, tagged with the id of the attempt that produced it, and the time to
+the first element is recorded in ``LLM_STREAM_FIRST_ITEM``. Attempts can
+still be rejected after streaming (invalid, truncated, runaway), so
+consumers keep the elements of each attempt apart and only use those of
+``CascadeResult.attempt``: the attempt whose elements are exactly the
+returned output. Repair and continuation calls do not stream elements.
+
+Every attempt is counted in ``LLM_CASCADE_ATTEMPTS`` and every call in
+``LLM_CASCADE_CALLS`` (first_try / escalated / partial / failed), from which the
+escalation rate of each node is derived. ``escalation_rates()`` gives the
+same figures for the current process; they are logged on each escalation.
+"""
+import functools
+import json
+import threading
+import time
+from contextlib import closing
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Type
+
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel, ValidationError
+
+from app.config.env import EnvSettings
+from app.model_ai import llm
+from app.model_ai.json_stream import IncrementalJSONParser, RunawayGenerationError, drop_repeated
+from app.model_ai.truncation import continuation_prompt, salvage_json
+from app.utils.logger import get_logger
+from app.utils.metrics import LLM_CASCADE_ATTEMPTS, LLM_CASCADE_CALLS, LLM_STREAM_ABORTS, LLM_STREAM_FIRST_ITEM
+
+logger = get_logger("model_cascade")
+
+# Độ dài tối đa của thông báo lỗi gửi kèm prompt sửa
+REPAIR_ERROR_MAX_CHARS = 2000
+
+REPAIR_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system",
+         "Bạn sửa lỗi định dạng JSON của kết quả bóc tách hồ sơ mời thầu. "
+         "Giữ nguyên toàn bộ nội dung, không thêm, bớt hay diễn đạt lại dữ liệu."),
+        ("user",
+         """
+            Kết quả dưới đây không đúng cấu trúc yêu cầu.
+            Lỗi: {error}
+            Cấu trúc JSON (JSON Schema): {schema}
+            Kết quả cần sửa:
+            {output}
+            Chỉ trả về JSON đã sửa đúng cấu trúc.
+         """),
+    ]
+)
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+class CascadeError(Exception):
+    """No model of the cascade returned an acceptable output."""
+
+
+class CascadeResult(NamedTuple):
+    value: Any
+    partial: bool  # chỉ gồm các phần tử cứu được từ kết quả bị cắt/bị dừng
+    attempt: Optional[int] = None  # lần gọi có các phần tử đã stream đúng bằng ``value``
+
+
+class Attempt(NamedTuple):
+    outcome: str  # accepted / invalid / empty / truncated / runaway / error
+    value: Any
+    output: str  # văn bản model trả về, dùng cho prompt sửa
+    error: Optional[BaseException]
+
+
+def cascade_models() -> List[str]:
+    settings = EnvSettings()
+    models = [m.strip() for m in settings.CASCADE_MODELS.split(",") if m.strip()]
+    return models or [settings.OPENAI_MODEL]
+
+
+def escalation_rates() -> Dict[str, float]:
+    """Share of calls of each node (this process) not answered by the first attempt."""
+    with _stats_lock:
+        return {
+            node: (sum(counts.values()) - counts.get("first_try", 0)) / sum(counts.values())
+            for node, counts in _stats.items() if sum(counts.values())
+        }
+
+
+def _record_call(node: str, result: str):
+    LLM_CASCADE_CALLS.labels(node=node, result=result).inc()
+    with _stats_lock:
+        counts = _stats.setdefault(node, {})
+        counts[result] = counts.get(result, 0) + 1
+    if result != "first_try":
+        logger.info(f"CASCADE node={node} result={result} escalation_rate={escalation_rates()[node]:.0%}")
+
+
+def _raw_output(raw) -> str:
+    """Văn bản model trả về: nội dung JSON mode hoặc tham số của tool call."""
+    if raw is None:
+        return ""
+    tool_calls = getattr(raw, "tool_calls", None)
+    if tool_calls:
+        return json.dumps(tool_calls[0].get("args", {}), ensure_ascii=False)
+    invalid_tool_calls = getattr(raw, "invalid_tool_calls", None)
+    if invalid_tool_calls:
+        return str(invalid_tool_calls[0].get("args") or "")
+    content = raw.content
+    return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+
+
+class _StreamingJSON:
+    """JSON mode qua stream, cùng kết quả với ``with_structured_output(..., include_raw=True)``."""
+
+    def __init__(self, node: str, chat_model, on_item: Optional[Callable[[tuple, Any], None]] = None):
+        self.node = node
+        self.chat_model = chat_model.bind(response_format={"type": "json_object"}, stream_usage=True)
+        self.on_item = on_item
+
+    def invoke(self, prompt) -> dict:
+        parser = IncrementalJSONParser(EnvSettings().STREAM_MAX_REPEATS)
+        start, first_item, metadata, error = time.perf_counter(), True, {}, None
+        try:
+            # closing(): dừng giữa chừng thì đóng hẳn generator, kéo theo kết nối HTTP của stream
+            with closing(self.chat_model.stream(prompt)) as stream:
+                for chunk in stream:
+                    metadata.update(chunk.response_metadata or {})
+                    if not isinstance(chunk.content, str) or not chunk.content:
+                        continue
+                    for path, item in parser.feed(chunk.content):
+                        if first_item:
+                            LLM_STREAM_FIRST_ITEM.labels(node=self.node).observe(time.perf_counter() - start)
+                            first_item = False
+                        if self.on_item is not None:
+                            self.on_item(path, item)
+        except RunawayGenerationError as e:
+            # Đóng stream ngay: model dừng sinh token
+            LLM_STREAM_ABORTS.labels(node=self.node, reason=e.reason).inc()
+            logger.warning(f"CASCADE node={self.node}: stream aborted after {len(parser.text)} chars: {e}")
+            error = e
+        raw = AIMessage(content=parser.text, response_metadata=metadata)
+        if error is None:
+            try:
+                return {"raw": raw, "parsed": json.loads(parser.text), "parsing_error": None}
+            except json.JSONDecodeError as e:
+                error = e
+        return {"raw": raw, "parsed": None, "parsing_error": error}
+
+
+class ModelCascade:
+    """
+    Cascade of one extraction node.
+
+    Args:
+        node: Node name (metric label).
+        schema: Pydantic schema of the output.
+        json_mode: Call the model in JSON mode and validate the parsed JSON
+            (an object, or a list of objects) with ``schema``; the JSON is
+            returned as before. Otherwise ``with_structured_output(schema)``
+            is used and the schema instance is returned.
+        count_items: Number of items of an accepted output; None disables the
+            emptiness check.
+        stitch: Appends the continuation of a truncated output to its salvaged
+            part (``truncation.concat_field`` / ``concat_results``); None
+            disables continuation.
+        stream: Stream and parse the response incrementally (JSON mode,
+            ``EXTRACTION_STREAMING_ENABLED``).
+        max_tokens, temperature: Output budget and temperature of the first attempt.
+    """
+
+    def __init__(self, node: str, schema: Type[BaseModel], json_mode: bool = False,
+                 count_items: Optional[Callable[[Any], int]] = None,
+                 stitch: Optional[Callable[[Any, Any], Any]] = None, stream: bool = False,
+                 max_tokens: int = 4000, temperature: float = 0.5):
+        self.node = node
+        self.schema = schema
+        self.json_mode = json_mode
+        self.count_items = count_items
+        self.stitch = stitch
+        self.stream = stream
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+
+    def _runnable(self, model: str, max_tokens: int, on_item: Optional[Callable[[tuple, Any], None]] = None):
+        chat_model = llm.chat_model(model, max_tokens, self.temperature)
+        if self.json_mode and self.stream and EnvSettings().EXTRACTION_STREAMING_ENABLED:
+            return _StreamingJSON(self.node, chat_model, on_item)
+        if self.json_mode:
+            return chat_model.with_structured_output(None, method="json_mode", include_raw=True)
+        return chat_model.with_structured_output(self.schema, include_raw=True)
+
+    def _validate(self, parsed):
+        if not self.json_mode:
+            return parsed  # đã là instance của schema
+        for item in parsed if isinstance(parsed, list) else [parsed]:
+            self.schema.model_validate(item)
+        return parsed
+
+    def _coerce(self, parsed):
+        """JSON đã cứu được -> kết quả cùng dạng với kết quả của model."""
+        return self._validate(parsed) if self.json_mode else self.schema.model_validate(parsed)
+
+    def _attempt(self, runnable, prompt, content_tokens: int) -> Attempt:
+        try:
+            result = runnable.invoke(prompt)
+        except Exception as e:
+            return Attempt("error", None, "", e)
+        raw = result.get("raw")
+        output = _raw_output(raw)
+        if isinstance(result.get("parsing_error"), RunawayGenerationError):
+            return Attempt("runaway", None, output, result["parsing_error"])
+        if (getattr(raw, "response_metadata", None) or {}).get("finish_reason") == "length":
+            return Attempt("truncated", None, output, ValueError("output stopped at max_tokens"))
+        error, parsed = result.get("parsing_error"), result.get("parsed")
+        if error is None and parsed is None:
+            error = ValueError("model returned no structured output")
+        if error is None:
+            try:
+                value = self._validate(parsed)
+            except ValidationError as e:
+                error = e
+        if error is not None:
+            return Attempt("invalid", None, output, error)
+        if self.count_items is not None and not self.count_items(value) \
+                and content_tokens >= EnvSettings().CASCADE_EMPTY_MIN_CONTENT_TOKENS:
+            return Attempt("empty", value, output, None)
+        return Attempt("accepted", value, output, None)
+
+    def _repair(self, model: str, max_tokens: int, failed: Attempt):
+        """Prompt sửa nhắm vào lỗi: chỉ gửi kết quả lỗi, không gửi lại tài liệu."""
+        prompt = REPAIR_PROMPT.invoke({
+            "error": str(failed.error)[:REPAIR_ERROR_MAX_CHARS],
+            "schema": json.dumps(self.schema.model_json_schema(), ensure_ascii=False),
+            "output": failed.output,
+        })
+        attempt = self._attempt(self._runnable(model, max_tokens), prompt, 0)
+        repaired = attempt.outcome == "accepted"
+        LLM_CASCADE_ATTEMPTS.labels(node=self.node, model=model,
+                                    outcome="repaired" if repaired else "repair_failed").inc()
+        return attempt.value if repaired else None
+
+    def _salvage(self, output: str):
+        """Các phần tử đầy đủ (không lặp) của một kết quả dở dang; None nếu không cứu được."""
+        salvaged = salvage_json(output)
+        if salvaged is None:
+            return None
+        try:
+            return self._coerce(drop_repeated(salvaged.value))
+        except ValidationError:
+            return None
+
+    def _continue(self, model: str, max_tokens: int, prompt, truncated: Attempt) -> Tuple[Any, bool, int]:
+        """
+        Giữ các phần tử đầy đủ của kết quả bị cắt rồi chỉ yêu cầu phần còn lại.
+
+        Returns:
+            (kết quả đã ghép hoặc None, đã đầy đủ hay chưa, số lần gọi model)
+        """
+        salvaged, value, calls = salvage_json(truncated.output), None, 0
+        while salvaged is not None:
+            try:
+                part = self._coerce(salvaged.value)
+            except ValidationError:
+                break
+            value = part if value is None else self.stitch(value, part)
+            if calls >= EnvSettings().CASCADE_MAX_CONTINUATIONS:
+                break
+            attempt = self._attempt(self._runnable(model, max_tokens),
+                                    continuation_prompt(prompt, salvaged.tail), 0)
+            calls += 1
+            LLM_CASCADE_ATTEMPTS.labels(node=self.node, model=model,
+                                        outcome=f"continuation_{attempt.outcome}").inc()
+            if attempt.outcome == "accepted":
+                return self.stitch(value, attempt.value), True, calls
+            if attempt.outcome == "runaway":
+                part = self._salvage(attempt.output)
+                value = value if part is None else self.stitch(value, part)
+                break
+            salvaged = salvage_json(attempt.output) if attempt.outcome == "truncated" else None
+        return value, False, calls
+
+    def invoke(self, prompt, content_tokens: int = 0):
+        """Output of ``run`` (complete or partial)."""
+        return self.run(prompt, content_tokens).value
+
+    def run(self, prompt, content_tokens: int = 0,
+            on_item: Optional[Callable[[int, tuple, Any], None]] = None) -> CascadeResult:
+        """
+        Run the cascade on ``prompt``.
+
+        Args:
+            prompt: Prompt of the node (prompt value or messages).
+            content_tokens: Tokens of the document content in the prompt, for
+                the emptiness check.
+            on_item: Called with ``(attempt, path, element)`` for every array
+                element as soon as it closes (streaming mode only).
+
+        Returns:
+            CascadeResult: The accepted output (schema instance, or JSON in
+            JSON mode); ``partial`` when it was salvaged from truncated or
+            aborted attempts only. ``attempt`` is the id passed to
+            ``on_item`` for the elements of the output, None when it was
+            repaired, stitched or salvaged (use ``value``).
+
+        Raises:
+            CascadeError: When no model returned an acceptable output.
+        """
+        settings = EnvSettings()
+        models = cascade_models()
+        tier, max_tokens, attempts = 0, self.max_tokens, 0
+        empty, empty_id, partial, last_error = None, None, None, None
+        while tier < len(models):
+            model = models[tier]
+            attempt_id = attempts + 1
+            attempt = self._attempt(
+                self._runnable(model, max_tokens, None if on_item is None else functools.partial(on_item, attempt_id)),
+                prompt, content_tokens)
+            attempts += 1
+            LLM_CASCADE_ATTEMPTS.labels(node=self.node, model=model, outcome=attempt.outcome).inc()
+            if attempt.outcome == "accepted":
+                _record_call(self.node, "first_try" if attempts == 1 else "escalated")
+                return CascadeResult(attempt.value, False, attempt_id)
+            logger.info(f"CASCADE node={self.node} model={model} max_tokens={max_tokens} "
+                        f"outcome={attempt.outcome}" + (f": {attempt.error}" if attempt.error else ""))
+            last_error = attempt.error or last_error
+            if attempt.outcome == "empty":
+                empty, empty_id = attempt, attempt_id
+            elif attempt.outcome == "invalid" and attempt.output and settings.CASCADE_REPAIR_ENABLED:
+                value = self._repair(model, max_tokens, attempt)
+                attempts += 1
+                if value is not None:
+                    _record_call(self.node, "escalated")
+                    return CascadeResult(value, False)
+            elif attempt.outcome == "truncated":
+                if self.stitch is not None:
+                    value, complete, calls = self._continue(model, max_tokens, prompt, attempt)
+                    attempts += calls
+                    if complete:
+                        _record_call(self.node, "escalated")
+                        return CascadeResult(value, False)
+                    partial = value if value is not None else partial
+                if max_tokens < settings.CASCADE_MAX_OUTPUT_TOKENS:
+                    max_tokens = min(max_tokens * 2, settings.CASCADE_MAX_OUTPUT_TOKENS)
+                    continue
+            elif attempt.outcome == "runaway":
+                # Chạy lại cùng model dễ lặp tiếp: giữ phần đã có, chuyển model kế tiếp
+                value = self._salvage(attempt.output)
+                partial = value if value is not None else partial
+            tier += 1
+
+        # Kết quả bị cắt/bị dừng: các phần tử đầy đủ đã cứu được vẫn tốt hơn không có gì
+        if partial is not None:
+            logger.warning(f"CASCADE node={self.node}: returning partial output salvaged after {attempts} attempts")
+            _record_call(self.node, "partial")
+            return CascadeResult(partial, True)
+
+        # Không model nào tìm thấy item: kết quả rỗng là hợp lệ
+        if empty is not None:
+            _record_call(self.node, "first_try" if attempts == 1 else "escalated")
+            return CascadeResult(empty.value, False, empty_id)
+        _record_call(self.node, "failed")
+        raise CascadeError(f"{self.node}: no acceptable output after {attempts} attempts: {last_error}") \
+            from last_error
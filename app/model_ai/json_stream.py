@@ -0,0 +1,150 @@
+"""
+Incremental JSON parsing of streamed extraction responses.
+
+Technology and HR responses run to thousands of tokens. In streaming mode the
+cascade feeds every token chunk to ``IncrementalJSONParser``, which:
+
+- emits each object element of an array (an HR position, a requirement,
+  a ``requirement_level_N`` node) as soon as it closes, with the path of
+  keys leading to its array (``("hr",)``, ``("hr", "requirements")``,
+  ``("requirement_level_0", "sub_requirements")``...);
+- aborts degenerate generations with ``RunawayGenerationError``: the same
+  element repeated more than ``max_repeats`` times in one array (looping
+  rows), or text repeating with a short period (looping inside a value).
+
+Only the new text of each chunk is scanned; a string cut between two chunks
+is scanned again once complete.
+"""
+import hashlib
+import json
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from app.model_ai.truncation import CLOSERS, TOKEN_PATTERN
+
+# Kiểm tra văn bản lặp sau mỗi chừng này ký tự mới
+LOOP_CHECK_EVERY_CHARS = 512
+# Đoạn cuối phải lặp toàn bộ với chu kỳ ngắn mới coi là model bị lặp
+LOOP_TAIL_CHARS = 1200
+LOOP_MAX_PERIOD = 200
+
+
+class RunawayGenerationError(ValueError):
+    """The streamed output is looping; ``reason`` is repeated_item or looping_text."""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class _Open(NamedTuple):
+    char: str  # "{" hoặc "["
+    key: Optional[str]  # khóa của container trong object cha
+    start: int
+
+
+def looping_period(text: str) -> Optional[int]:
+    """Period of the last ``LOOP_TAIL_CHARS`` characters when they repeat with a period up to ``LOOP_MAX_PERIOD``."""
+    if len(text) < LOOP_TAIL_CHARS:
+        return None
+    tail = text[-LOOP_TAIL_CHARS:]
+    for period in range(1, LOOP_MAX_PERIOD + 1):
+        if tail[period:] == tail[:-period]:
+            return period
+    return None
+
+
+def _digest(item) -> str:
+    return hashlib.sha1(json.dumps(item, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def drop_repeated(value):
+    """Copy of ``value`` where repeated object elements of each array are kept once."""
+    if isinstance(value, dict):
+        return {key: drop_repeated(item) for key, item in value.items()}
+    if isinstance(value, list):
+        seen, items = set(), []
+        for item in value:
+            if isinstance(item, dict):
+                digest = _digest(item)
+                if digest in seen:
+                    continue
+                seen.add(digest)
+            items.append(drop_repeated(item))
+        return items
+    return value
+
+
+class IncrementalJSONParser:
+    """
+    Parser fed with the chunks of one streamed JSON document.
+
+    Args:
+        max_repeats: Identical elements allowed in one array before the
+            generation is considered looping.
+    """
+
+    def __init__(self, max_repeats: int = 3):
+        self.max_repeats = max_repeats
+        self.text = ""
+        self.done = False
+        self._pos = 0
+        self._stack: List[_Open] = []
+        self._last_string: Optional[str] = None
+        self._counts: Dict[Tuple[int, str], int] = {}  # (mảng cha, digest) -> số lần
+        self._next_loop_check = LOOP_TAIL_CHARS
+
+    def feed(self, chunk: str) -> List[Tuple[Tuple[str, ...], Any]]:
+        """
+        Add a chunk of the response.
+
+        Returns:
+            List[Tuple[Tuple[str, ...], Any]]: ``(path, element)`` of the
+            array elements closed by this chunk, in order.
+
+        Raises:
+            RunawayGenerationError: When the output is looping.
+        """
+        self.text += chunk
+        closed = []
+        for match in TOKEN_PATTERN.finditer(self.text, self._pos):
+            if self.done:
+                break
+            if match.group("cut") is not None:
+                # Chuỗi chưa kết thúc: quét lại từ đầu chuỗi ở chunk sau
+                self._pos = match.start()
+                break
+            self._pos = match.end()
+            token = match.group()
+            if match.group("string") is not None:
+                self._last_string = token
+            elif token in CLOSERS:
+                key = None
+                if self._stack and self._stack[-1].char == "{" and self._last_string is not None:
+                    key = json.loads(self._last_string)
+                self._stack.append(_Open(token, key, match.start()))
+            else:
+                opened = self._stack.pop() if self._stack else None
+                if opened is None or CLOSERS[opened.char] != token:
+                    self.done = True  # JSON sai cấu trúc: để bước parse cuối báo lỗi
+                    break
+                if not self._stack:
+                    self.done = True
+                elif opened.char == "{" and self._stack[-1].char == "[":
+                    item = json.loads(self.text[opened.start:match.end()])
+                    self._check_repeat(self._stack[-1].start, item)
+                    closed.append((tuple(o.key for o in self._stack if o.key is not None), item))
+
+        if len(self.text) >= self._next_loop_check:
+            self._next_loop_check = len(self.text) + LOOP_CHECK_EVERY_CHARS
+            period = looping_period(self.text)
+            if period is not None:
+                raise RunawayGenerationError(
+                    f"output repeats with a period of {period} characters", "looping_text")
+        return closed
+
+    def _check_repeat(self, array_start: int, item):
+        key = (array_start, _digest(item))
+        self._counts[key] = self._counts.get(key, 0) + 1
+        if self._counts[key] > self.max_repeats:
+            raise RunawayGenerationError(
+                f"element repeated {self._counts[key]} times in one array", "repeated_item")
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 
 # your imports
@@ -61,6 +63,17 @@ def chat_model_gpt_4o_mini_128k():
     )
     return llm
 
+@lru_cache(maxsize=16)
+def chat_model(model: str = None, max_tokens: int = 4000, temperature: float = 0.5):
+    """ChatOpenAI theo tên model (mặc định OPENAI_MODEL), dùng chung cho các bậc của cascade"""
+    llm = ChatOpenAI(
+        model=model or EnvSettings().OPENAI_MODEL,
+        api_key=EnvSettings().OPENAI_API_KEY,
+        max_tokens=max_tokens,
+        temperature=temperature,
+    )
+    return llm
+
 def embedding_model_text_3_small():
     """OPENAI text embedding 3 small"""
     # Define model
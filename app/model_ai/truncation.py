@@ -0,0 +1,156 @@
+"""
+Salvage and continuation of JSON outputs cut at ``max_tokens``.
+
+When a structured extraction stops with ``finish_reason == "length"`` the
+JSON is incomplete: it fails to parse, or a lenient parser returns a partial
+list as if it were complete. Instead of re-running the whole extraction:
+
+1. ``salvage_json`` keeps the output up to the last complete element of an
+   array (at any depth) and closes the open containers, so every leaf item
+   kept is whole. A cut inside a nested array keeps the last parent with
+   only the children received so far (an HR position with its first
+   requirements);
+2. ``continuation_prompt`` re-sends the prompt with the tail of what was
+   received and asks only for the remaining elements, repeating the parent
+   (with its identifying fields) of children that continue a cut list;
+3. the node's stitch function (``concat_field``, ``concat_results``) appends
+   the continuation to the salvaged result. ``concat_field`` merges a
+   re-emitted parent into the cut one instead of appending it twice;
+   ``concat_results`` leaves that to the node's merge step.
+"""
+import json
+import re
+from typing import Any, Callable, List, NamedTuple, Optional
+
+from langchain_core.messages import HumanMessage
+from pydantic import BaseModel
+
+# Chuỗi JSON đầy đủ, chuỗi bị cắt ở cuối văn bản, hoặc dấu ngoặc
+TOKEN_PATTERN = re.compile(r'(?P<string>"(?:[^"\\]|\\.)*")|(?P<cut>"(?:[^"\\]|\\.)*\\?\Z)|[{}\[\]]', re.DOTALL)
+CLOSERS = {"{": "}", "[": "]"}
+# Số ký tự cuối của phần đã nhận gửi kèm prompt tiếp tục
+TAIL_CHARS = 1500
+# Số phần tử cuối của phần trước dùng để bỏ phần tử bị lặp lại ở đầu phần tiếp theo
+STITCH_OVERLAP = 3
+
+CONTINUATION_PROMPT = """
+    Kết quả JSON trước đó bị cắt do vượt giới hạn độ dài. Các phần tử đầy đủ đã được nhận, phần cuối đã nhận là:
+    {tail}
+
+    Hãy tiếp tục bóc tách CHỈ các phần tử còn lại nằm sau phần trên, theo đúng cấu trúc JSON như yêu cầu ban đầu.
+    Không lặp lại các phần tử đã nhận. Nếu phần trên dừng giữa danh sách con của một mục (ví dụ các yêu cầu của
+    một vị trí nhân sự, các yêu cầu con của một mục kỹ thuật), hãy lặp lại mục cha đó với đúng các trường nhận dạng
+    (position, quantity, muc, requirement_name...) và chỉ kèm các phần tử con còn lại.
+"""
+
+
+class SalvagedJSON(NamedTuple):
+    value: Any  # JSON đã đóng lại, chỉ gồm các phần tử đầy đủ
+    tail: str  # phần cuối của đoạn JSON được giữ
+
+
+def salvage_json(text: str) -> Optional[SalvagedJSON]:
+    """
+    Parse a JSON document cut off mid-way.
+
+    Returns:
+        SalvagedJSON: The document up to its last complete array element,
+        with open objects / arrays closed; None when no element is complete.
+    """
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        return None
+    stack: List[str] = []
+    cut, cut_stack = None, ()
+    for match in TOKEN_PATTERN.finditer(text, start):
+        token = match.group()
+        if token in CLOSERS:
+            stack.append(token)
+            continue
+        if token in ("}", "]"):
+            if not stack or CLOSERS[stack.pop()] != token:
+                return None
+            if not stack:
+                # Văn bản đầy đủ: không cần cắt
+                cut, cut_stack = match.end(), ()
+                break
+        elif match.group("cut") is not None or not stack:
+            break  # chuỗi bị cắt: dừng ở phần tử đầy đủ trước đó
+        if stack and stack[-1] == "[":
+            cut, cut_stack = match.end(), tuple(stack)
+    if cut is None:
+        return None
+    kept = text[start:cut]
+    try:
+        value = json.loads(kept + "".join(CLOSERS[c] for c in reversed(cut_stack)))
+    except json.JSONDecodeError:
+        return None
+    return SalvagedJSON(value, kept[-TAIL_CHARS:])
+
+
+def continuation_prompt(prompt, tail: str) -> list:
+    """Messages of ``prompt`` followed by the request for the remaining elements."""
+    if hasattr(prompt, "to_messages"):
+        messages = prompt.to_messages()
+    elif isinstance(prompt, str):
+        messages = [HumanMessage(content=prompt)]
+    else:
+        messages = list(prompt)
+    return [*messages, HumanMessage(content=CONTINUATION_PROMPT.format(tail=tail))]
+
+
+def _without_overlap(previous: list, items: list, window: Optional[int] = STITCH_OVERLAP) -> list:
+    recent = previous[-window:] if window else previous
+    return [item for item in items if item not in recent]
+
+
+def _fields(item) -> Optional[dict]:
+    if isinstance(item, BaseModel):
+        return dict(item)
+    return item if isinstance(item, dict) else None
+
+
+def _same_parent(previous, item) -> bool:
+    """Cùng một mục cha: có danh sách con và mọi trường không phải danh sách đều bằng nhau."""
+    previous_fields, fields = _fields(previous), _fields(item)
+    if previous_fields is None or fields is None or previous_fields.keys() != fields.keys():
+        return False
+    if not any(isinstance(value, list) for value in previous_fields.values()):
+        return False
+    return all(value == fields[key] for key, value in previous_fields.items() if not isinstance(value, list))
+
+
+def _stitch_items(previous: list, items: list, window: Optional[int] = STITCH_OVERLAP) -> list:
+    """
+    ``previous`` followed by the new elements of ``items``. When ``items``
+    starts with the parent ``salvage_json`` cut mid-way, its children are
+    merged into that parent (recursively) instead of repeating the parent.
+    """
+    if previous and items and _same_parent(previous[-1], items[0]):
+        parent, fields = previous[-1], _fields(previous[-1])
+        update = {
+            key: _stitch_items(list(value), list(_fields(items[0])[key]), window=None)
+            for key, value in fields.items() if isinstance(value, list)
+        }
+        merged = parent.model_copy(update=update) if isinstance(parent, BaseModel) else {**parent, **update}
+        return [*previous[:-1], merged, *_without_overlap(previous, items[1:], window)]
+    return previous + _without_overlap(previous, items, window)
+
+
+def concat_field(field: str) -> Callable[[Any, Any], Any]:
+    """Stitch function appending the ``field`` list of the continuation (dict or schema instance)."""
+
+    def stitch(first, rest):
+        if isinstance(first, BaseModel):
+            return first.model_copy(update={field: _stitch_items(list(getattr(first, field)),
+                                                                 list(getattr(rest, field)))})
+        return {**first, field: _stitch_items(list(first.get(field) or []), list(rest.get(field) or []))}
+
+    return stitch
+
+
+def concat_results(first, rest) -> list:
+    """Stitch function keeping both results as a list (merged later, e.g. by ``merge_requirement_trees``)."""
+    first = first if isinstance(first, list) else [first]
+    rest = rest if isinstance(rest, list) else [rest]
+    return first + rest
@@ -1,16 +1,31 @@
+import functools
 import json
+import threading
 import time
 from typing import Callable
 
 import pika
-from pika.exceptions import AMQPConnectionError, ChannelClosedByBroker
+from pika.exceptions import AMQPConnectionError, AMQPError, ChannelClosedByBroker
 
 from app.config.env import EnvSettings
 from app.utils.logger import get_logger
+from app.utils.metrics import observe_message
+from app.utils.profiler import is_profiling, profile_run
 
 logger = get_logger(__name__)
 
 
+def _profile_request(body):
+    """Đọc cờ ``profile`` và hs_id từ message (nếu message là JSON object)."""
+    try:
+        message = json.loads(body)
+    except (TypeError, ValueError):
+        return False, None
+    if not isinstance(message, dict) or not message.get("profile"):
+        return False, None
+    return True, message.get("hs_id") or message.get("id") or "unknown"
+
+
 class RabbitMQClient:
     """
     RabbitMQClient - Hỗ trợ Publisher và Consumer với RabbitMQ
@@ -75,6 +90,10 @@ class RabbitMQClient:
                 # Khai báo queue với durable=True
                 self.channel.queue_declare(queue=queue, durable=self.durable)
 
+                # Giữ cờ profile cho bước tiếp theo của pipeline
+                if is_profiling() and isinstance(message, dict):
+                    message = {**message, "profile": True}
+
                 # Chuyển dict sang JSON string
                 body = json.dumps(message)
 
@@ -107,7 +126,13 @@ class RabbitMQClient:
                 logger.error(f"Unexpected error during publish: {e}")
                 raise
 
-    def start_consumer(self, queue, callback: Callable, auto_ack=EnvSettings().RABBIT_MQ_AUTO_ACKNOWLEDGE):
+    def start_consumer(
+        self,
+        queue,
+        callback: Callable,
+        auto_ack=EnvSettings().RABBIT_MQ_AUTO_ACKNOWLEDGE,
+        threaded=False
+    ):
         """
         Bắt đầu consumer, lắng nghe queue với retry logic.
 
@@ -116,7 +141,47 @@ class RabbitMQClient:
             callback: Hàm callback để xử lý message
             auto_ack: True để tự động acknowledge message, False để manual acknowledge
                       (Default: False - manual acknowledgment for safety)
+            threaded: True để chạy callback trong worker thread (chỉ dùng với manual ack);
+                      I/O loop vẫn gửi heartbeat trong lúc xử lý message dài, ack/nack
+                      được đưa về I/O thread qua ``add_callback_threadsafe``
         """
+        def settle(ch, method, ok):
+            # Chạy trên I/O thread; kênh đã đóng thì broker sẽ tự giao lại message
+            if not ch.is_open:
+                logger.warning(
+                    f"Channel closed, couldn't handle acknowledgment for message {method.delivery_tag}")
+            elif ok:
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+                logger.debug(f"Manually acknowledged message {method.delivery_tag}")
+            else:
+                # Chỉ requeue một lần: message lỗi lần thứ hai bị bỏ, tránh vòng lặp vô hạn
+                ch.basic_nack(
+                    delivery_tag=method.delivery_tag, requeue=not method.redelivered)
+                logger.debug(
+                    f"Nacked message {method.delivery_tag}, requeue={not method.redelivered}")
+
+        def threaded_callback(ch, method, properties, body):
+            connection = self.connection
+
+            def work():
+                ok = False
+                try:
+                    profile, hs_id = _profile_request(body)
+                    with observe_message(queue), profile_run(hs_id, queue, enabled=profile):
+                        callback(ch, method, properties, body)
+                    ok = True
+                except Exception as e:
+                    logger.error(
+                        f"Error processing message {method.delivery_tag}: {e}", exc_info=True)
+                try:
+                    connection.add_callback_threadsafe(
+                        functools.partial(settle, ch, method, ok))
+                except AMQPError as e:
+                    logger.warning(
+                        f"Connection closed, couldn't handle acknowledgment for message {method.delivery_tag}: {e}")
+
+            threading.Thread(target=work, name=f"{queue}-worker", daemon=True).start()
+
         # Wrap the callback to handle exceptions and acknowledgment
         def wrapped_callback(ch, method, properties, body):
             message_id = method.delivery_tag
@@ -124,7 +189,9 @@ class RabbitMQClient:
 
             try:
                 # Execute the callback
-                result = callback(ch, method, properties, body)
+                profile, hs_id = _profile_request(body)
+                with observe_message(queue), profile_run(hs_id, queue, enabled=profile):
+                    result = callback(ch, method, properties, body)
 
                 # Only handle manual acknowledgment if auto_ack is False
                 if not auto_ack and ch.is_open:
@@ -165,7 +232,7 @@ class RabbitMQClient:
                 # Start consuming with the specified auto_ack setting
                 self.channel.basic_consume(
                     queue=queue,
-                    on_message_callback=wrapped_callback,
+                    on_message_callback=threaded_callback if threaded and not auto_ack else wrapped_callback,
                     auto_ack=auto_ack
                 )
 
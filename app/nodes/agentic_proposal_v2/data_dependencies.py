@@ -0,0 +1,179 @@
+# Standard imports
+from collections import defaultdict, deque
+from typing import Dict, Iterable, Set
+
+# Your imports
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Các key có sẵn trong input của graph (message từ extraction queue)
+GRAPH_INPUT_KEYS = {"hs_id", "document_file_md"}
+
+# Các key có reducer, được ghi bởi nhiều node và không tạo ràng buộc thứ tự
+SHARED_KEYS = {"error_messages"}
+
+# Khai báo dữ liệu mỗi node đọc/ghi trong state.
+# Một node chỉ được đọc key do START hoặc do một node tổ tiên (ancestor) ghi ra,
+# nếu không nó phụ thuộc vào thứ tự chạy ngẫu nhiên giữa các nhánh song song.
+NODE_DATA_DEPENDENCIES: Dict[str, Dict[str, Set[str]]] = {
+    "PrepareDataDocumentNodeV2m0p0": {
+        "reads": {"hs_id", "document_file_md"},
+        "writes": {
+            "email_content_id",
+            "document_content_markdown_hsmt",
+            "document_content_markdown_tbmt",
+            "document_content_markdown_hskt",
+            "document_content_markdown_tcdg",
+            "document_content_markdown_tcdgkt",
+        },
+    },
+    "ClassifyDocumentPdfNodeV2m0p0": {
+        "reads": {
+            "hs_id",
+            "document_content_markdown_tbmt",
+            "document_content_markdown_hskt",
+            "document_content_markdown_hsmt",
+        },
+        "writes": {
+            "is_exist_content_markdown_tbmt",
+            "is_exist_content_markdown_hskt",
+            "is_exist_content_markdown_hsmt",
+            "agentai_name",
+            "agentai_code",
+        },
+    },
+    "SummaryHSMTNodeV2m0p1": {
+        "reads": {"hs_id", "document_content_markdown_hsmt"},
+        "writes": {"result_extraction_overview"},
+    },
+    "ExtractionHRMDNodeV2m0p0": {
+        "reads": {"hs_id", "document_content_markdown_hskt", "document_content_markdown_tcdg"},
+        "writes": {"result_extraction_hr"},
+    },
+    "ExtractionFinanceMDNodeV2m0p0": {
+        "reads": {"hs_id", "document_content_markdown_tcdg"},
+        "writes": {"result_extraction_finance"},
+    },
+    "ExtractionExperienceMDNodeV2m0p0": {
+        "reads": {"hs_id", "document_content_markdown_tcdg"},
+        "writes": {"result_extraction_experience"},
+    },
+    "ExtractionTechnologyNodeV2m0p0": {
+        "reads": {"hs_id", "document_content_markdown_hskt", "document_content_markdown_tcdgkt"},
+        "writes": {"result_extraction_technology"},
+    },
+    "ExtractionNoticeBidMDNodeV2m0p0": {
+        "reads": {"hs_id", "document_content_markdown_tbmt"},
+        "writes": {"result_extraction_notice_bid"},
+    },
+    "PostExtractionMDNodeV2m0p0": {
+        "reads": {
+            "hs_id",
+            "email_content_id",
+            "agentai_name",
+            "agentai_code",
+            "result_extraction_overview",
+            "result_extraction_hr",
+            "result_extraction_finance",
+            "result_extraction_experience",
+            "result_extraction_technology",
+            "result_extraction_notice_bid",
+            "error_messages",
+        },
+        "writes": {"proposal_id", "is_data_extracted_finance", "result_extraction_technology"},
+    },
+}
+
+
+def validate_data_dependencies(
+    edges: Iterable[tuple],
+    dependencies: Dict[str, Dict[str, Set[str]]] = NODE_DATA_DEPENDENCIES,
+    input_keys: Set[str] = GRAPH_INPUT_KEYS,
+    start: str = "__start__",
+):
+    """
+        Kiểm tra tĩnh: mọi key một node đọc phải do input của graph hoặc một node tổ tiên ghi ra.
+
+        Args:
+            edges: Danh sách cạnh (source, target) của graph.
+            dependencies: Bản đồ reads/writes theo tên node.
+            input_keys: Các key có sẵn từ input.
+            start: Tên node START của LangGraph.
+
+        Raises:
+            ValueError: Nếu có node đọc key không được đảm bảo ghi trước đó.
+    """
+    parents = defaultdict(set)
+    for source, target in edges:
+        parents[target].add(source)
+
+    def ancestors(node: str) -> Set[str]:
+        seen, queue = set(), deque(parents[node])
+        while queue:
+            current = queue.popleft()
+            if current not in seen:
+                seen.add(current)
+                queue.extend(parents[current])
+        return seen
+
+    violations = []
+    for node, declared in dependencies.items():
+        available = set(input_keys) | SHARED_KEYS
+        for ancestor in ancestors(node):
+            if ancestor != start:
+                available |= dependencies.get(ancestor, {}).get("writes", set())
+        missing = declared["reads"] - available
+        if missing:
+            violations.append(f"{node} đọc {sorted(missing)} nhưng không có node tổ tiên nào ghi")
+    if violations:
+        raise ValueError("Data dependency không hợp lệ:\n" + "\n".join(violations))
+
+
+class DeclaredReadsState(dict):
+    """State dict ghi log cảnh báo khi node đọc key chưa được khai báo trong NODE_DATA_DEPENDENCIES."""
+
+    def __init__(self, state, node_name: str, reads: Set[str], warned: Set[str]):
+        super().__init__(state)
+        self._node_name = node_name
+        self._reads = reads
+        self._warned = warned
+
+    def _check(self, key):
+        # Key dùng chung và key input (nhánh xử lý lỗi đọc error_messages, hs_id) luôn có sẵn
+        if key in SHARED_KEYS or key in GRAPH_INPUT_KEYS:
+            return
+        if key not in self._reads and key not in self._warned:
+            self._warned.add(key)
+            logger.warning(
+                f"{self._node_name} đọc key '{key}' không có trong NODE_DATA_DEPENDENCIES; "
+                "cập nhật khai báo hoặc kiểm tra thứ tự node trong graph"
+            )
+
+    def __getitem__(self, key):
+        self._check(key)
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self._check(key)
+        return super().get(key, default)
+
+
+class DeclaredReadsNode:
+    """
+        Bọc một node để kiểm tra runtime các key node đọc từ state.
+
+        Args:
+            name: Tên node trong graph (khóa trong NODE_DATA_DEPENDENCIES).
+            node: Callable của node.
+            dependencies: Bản đồ reads/writes theo tên node.
+    """
+
+    def __init__(self, name: str, node, dependencies: Dict[str, Dict[str, Set[str]]] = NODE_DATA_DEPENDENCIES):
+        self.name = name
+        self._node = node
+        self._reads = dependencies.get(name, {}).get("reads", set())
+        self._warned = set()
+
+    def __call__(self, state):
+        return self._node(DeclaredReadsState(state, self.name, self._reads, self._warned))
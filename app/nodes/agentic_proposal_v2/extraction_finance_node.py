@@ -5,10 +5,13 @@ import time
 from langchain_core.prompts import ChatPromptTemplate
 
 # Your imports
-from app.model_ai import llm
+from app.model_ai.cascade import ModelCascade
+from app.model_ai.truncation import concat_field
 from app.nodes.agentic_proposal.extraction_handle_error import format_error_message
-from app.nodes.states.state_proposal_v1 import StateProposalV1,ExtractFinanceRequirementList
+from app.nodes.states.state_proposal_v1 import StateProposalV1,ExtractFinanceRequirement,ExtractFinanceRequirementList
 from app.utils.logger import get_logger
+from app.utils.section_fingerprint import extraction_version, partition_sections, remember_sections
+from app.utils.section_router import select_sections
 
 logger = get_logger("except_handling_extraction")
 
@@ -27,15 +30,20 @@ class ExtractionFinanceMDNodeV2m0p0:
 
     def __init__(self, name: str):
         self.name = name
+        # Model rẻ nhất trước; chỉ nâng cấp khi kết quả sai cấu trúc, bị cắt hoặc rỗng bất thường
+        self.cascade = ModelCascade(name, ExtractFinanceRequirementList, count_items=lambda response: len(response.data),
+                                    stitch=concat_field("data"))
 
     # Defining __call__ method
     def __call__(self, state: StateProposalV1):
         print(self.name)
         try:
             start_time = time.perf_counter()
-            chapter_content = state["document_content_markdown_tcdg"]
+            # Chỉ giữ các mục liên quan trong giới hạn token
+            sections = select_sections(
+                state["document_content_markdown_tcdg"], "finance", hs_id=state.get("hs_id"))
             # Không có chương liên quan để bóc tách
-            if len(chapter_content) < 1:
+            if len(sections) < 1:
                 return {
                     "result_extraction_finance": [],
                 }
@@ -92,18 +100,28 @@ class ExtractionFinanceMDNodeV2m0p0:
                 ]
             )
 
-            prompt = chat_prompt_template.invoke({"content": "\n\n".join(chapter_content)})
+            # Các mục theo mẫu chuẩn đã bóc tách ở hồ sơ trước (cùng prompt/schema): lấy lại từ kho fingerprint
+            version = extraction_version(chat_prompt_template.pretty_repr(), ExtractFinanceRequirementList)
+            known = partition_sections("finance", sections, self.name, ExtractFinanceRequirement, version)
+            known_items = known.items
+            if not known.pending:
+                print(f"FINANCE (section store): {len(known_items)} items")
+                return {
+                    "result_extraction_finance": known_items,
+                }
 
-            response = (
-                llm.chat_model_gpt_4o_mini()
-                .with_structured_output(ExtractFinanceRequirementList)
-                .invoke(prompt)
-            )
+            prompt = chat_prompt_template.invoke({"content": "\n\n".join(s.text for s in known.pending)})
+
+            result = self.cascade.run(prompt, content_tokens=sum(s.tokens for s in known.pending))
+            response = result.value
             print("FINANCE: ",response)
+            # Kết quả cứu được từ lần gọi bị cắt chưa đầy đủ: không lưu vào kho fingerprint
+            if not result.partial:
+                remember_sections("finance", known, [item.model_dump() for item in response.data], self.name)
             finish_time = time.perf_counter()
             print(f"Total time: {finish_time - start_time} s")
             return {
-                "result_extraction_finance": response.data,
+                "result_extraction_finance": known_items + response.data,
             }
         except Exception as e:
             error_msg = format_error_message(
@@ -2,14 +2,16 @@
 import time
 
 # Third party imports
-from concurrent.futures import ThreadPoolExecutor
 from langchain_core.prompts import ChatPromptTemplate
 
 # Your imports
-from app.model_ai import llm
+from app.model_ai.cascade import ModelCascade
+from app.model_ai.truncation import concat_field
 from app.nodes.agentic_proposal.extraction_handle_error import format_error_message
-from app.nodes.states.state_proposal_v1 import StateProposalV1
+from app.nodes.states.state_proposal_v1 import ExtractHRPositionList, StateProposalV1
+from app.utils.hr_merge import PositionGroups
 from app.utils.logger import get_logger
+from app.utils.profiler import ContextThreadPoolExecutor
 
 logger = get_logger("except_handling_extraction")
 
@@ -25,6 +27,8 @@ class ExtractionHRMDNodeV2m0p0:
 
     def __init__(self, name: str):
         self.name = name
+        # Không kiểm tra rỗng: nhiều chương HSKT/TCDG không có yêu cầu nhân sự
+        self.cascade = ModelCascade(name, ExtractHRPositionList, json_mode=True, stitch=concat_field("hr"), stream=True)
 
     def process_single_content(self, content: str):
         """
@@ -124,13 +128,20 @@ class ExtractionHRMDNodeV2m0p0:
 
             chat_prompt_template = ChatPromptTemplate.from_template(prompt_template)
             prompt = chat_prompt_template.invoke({"content": content})
-            response = (
-                llm.chat_model_gpt_4o_mini()
-                .with_structured_output(None, method="json_mode")
-                .invoke(prompt)
-            )
-            print(f"response: {response}")
-            return response["hr"]
+
+            # Gom nhóm vị trí ngay khi stream; mỗi lần gọi model một bộ riêng, chỉ dùng bộ của lần được chấp nhận
+            groups = {}
+
+            def on_item(attempt, path, item):
+                if path == ("hr",):
+                    groups.setdefault(attempt, PositionGroups()).add(item)
+
+            result = self.cascade.run(prompt, on_item=on_item)
+            print(f"response: {result.value}")
+            # Kết quả đã sửa/ghép/cứu được không khớp phần đã stream: gom nhóm lại từ kết quả
+            positions = groups.get(result.attempt) or PositionGroups(result.value["hr"])
+            # Vị trí mơ hồ giữ riêng: bước gộp HR sau cùng mới hỏi model
+            return positions.merged()
         except Exception as e:
             logger.error(f"Error processing content: {str(e)}")
             return []
@@ -165,7 +176,7 @@ class ExtractionHRMDNodeV2m0p0:
                     "result_extraction_hr": [],
                 }
             # Xử lý song song các nội dung trong hr_input_content bằng ThreadPoolExecutor
-            with ThreadPoolExecutor(max_workers=4) as executor:
+            with ContextThreadPoolExecutor(max_workers=4) as executor:
                 results = list(executor.map(self.process_single_content, hr_input_content))
             # Gộp kết quả từ tất cả các nội dung
             combined_results = []
@@ -1,7 +1,6 @@
 # Standard imports
 import re
 import time
-from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Third party imports
@@ -9,10 +8,16 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_text_splitters import MarkdownTextSplitter
 
 # Your imports
-from app.model_ai import llm
+from app.model_ai.cascade import ModelCascade
+from app.model_ai.truncation import concat_results
 from app.nodes.agentic_proposal.extraction_handle_error import format_error_message
-from app.nodes.states.state_proposal_v1 import StateProposalV1
+from app.nodes.states.state_proposal_v1 import ExtractTechnologyResult, StateProposalV1
 from app.utils.logger import get_logger
+from app.utils.profiler import ContextThreadPoolExecutor
+from app.utils.hr_merge import PositionGroups
+from app.utils.requirement_merge import RequirementTree, count_requirements, merge_requirement_trees
+from app.utils.section_router import route_sections
+from app.utils.tokens import count_tokens
 
 logger = get_logger("except_handling_extraction")
 
@@ -23,21 +28,39 @@ class ExtractionTechnologyNodeV2m0p0:
 
     def __init__(self, name: str):
         self.name = name
+        self.cascade = ModelCascade(name, ExtractTechnologyResult, json_mode=True,
+                                    count_items=self._count_items, stitch=concat_results, stream=True,
+                                    max_tokens=16000)
+
+    @staticmethod
+    def _count_items(response) -> int:
+        """Số vị trí nhân sự và yêu cầu kỹ thuật trong kết quả một chunk."""
+        total = 0
+        for item in response if isinstance(response, list) else [response]:
+            if isinstance(item, dict):
+                root = item.get("requirement_level_0")
+                total += len(item.get("hr") or []) + (
+                    count_requirements(root.get("sub_requirements") or []) if isinstance(root, dict) else 0)
+        return total
 
     def __call__(self, state: StateProposalV1):
         logger.info(f"Running node: {self.name}")
         try:
             start_time = time.perf_counter()
 
-            input_contents = [
-                *state.get("document_content_markdown_hskt", []),
-                *state.get("document_content_markdown_tcdgkt", [])
-            ]
+            input_contents = route_sections(
+                [
+                    *state.get("document_content_markdown_hskt", []),
+                    *state.get("document_content_markdown_tcdgkt", [])
+                ],
+                "technology",
+                hs_id=state.get("hs_id"),
+            )
             if not input_contents:
                 return {"result_extraction_technology": {}}
 
             all_results = []
-            with ThreadPoolExecutor(max_workers=2) as outer_executor:
+            with ContextThreadPoolExecutor(max_workers=2) as outer_executor:
                 results = list(outer_executor.map(self.process_one_document, input_contents))
                 for r in results:
                     all_results.extend(r)
@@ -75,11 +98,25 @@ class ExtractionTechnologyNodeV2m0p0:
             try:
                 prompt_template = self._get_prompt_template()
                 prompt = ChatPromptTemplate.from_template(prompt_template).invoke({"content": chunk})
-                response = (
-                    llm.chat_model_gpt_4o_mini_16k()
-                    .with_structured_output(None, method="json_mode")
-                    .invoke(prompt)
-                )
+
+                # Gộp dần yêu cầu kỹ thuật và nhân sự trong lúc stream, riêng cho từng lần gọi model
+                trees, groups = {}, {}
+
+                def on_item(attempt, path, item):
+                    if path == ("requirement_level_0", "sub_requirements"):
+                        trees.setdefault(attempt, RequirementTree()).add([item])
+                    elif path == ("hr",):
+                        groups.setdefault(attempt, PositionGroups()).add(item)
+
+                result = self.cascade.run(prompt, content_tokens=count_tokens(chunk), on_item=on_item)
+                response = result.value
+                # Chỉ dùng phần đã gộp của lần gọi được chấp nhận (kết quả khớp đúng phần đã stream)
+                if isinstance(response, dict) and result.attempt is not None:
+                    response = dict(response)
+                    if result.attempt in trees:
+                        response["requirement_level_0"] = trees[result.attempt].to_dict()
+                    if result.attempt in groups:
+                        response["hr"] = groups[result.attempt].merged()
                 logger.debug(f"[Chunk {chunk_idx+1}] Output: {response}")
                 if isinstance(response, list):
                     return response
@@ -91,47 +128,33 @@ class ExtractionTechnologyNodeV2m0p0:
                 return []
 
         chunk_results = []
-        with ThreadPoolExecutor(max_workers=4) as inner_executor:
+        with ContextThreadPoolExecutor(max_workers=4) as inner_executor:
             futures = [inner_executor.submit(process_chunk, chunk, i) for i, chunk in enumerate(chunks)]
             for future in futures:
                 chunk_results.extend(future.result())
         return chunk_results
 
     def _format_merged_output(self, merged_results):
-        merged = {
-            "hr": [],
-            "requirement_level_0": {
-                "muc": "1.",
-                "requirement_name": "Yêu cầu về kỹ thuật",
-                "sub_requirements": []
-            }
-        }
-
-        hr_seen = set()
+        hr_positions = []
+        roots = []
 
         for item in merged_results:
             if not isinstance(item, dict):
                 continue
 
-            # Gộp thông tin nhân sự
-            hr_list = item.get("hr", [])
-            for hr_item in hr_list:
-                hr_key = (
-                    hr_item.get("position", ""),
-                    hr_item.get("quantity", "0"),
-                    tuple(
-                        (req.get("name", ""), req.get("description", ""))
-                        for req in hr_item.get("requirements", [])
-                    )
-                )
-                if hr_key not in hr_seen:
-                    hr_seen.add(hr_key)
-                    merged["hr"].append(hr_item)
-
-            # Gộp các yêu cầu kỹ thuật
-            sub_reqs = item.get("requirement_level_0", {}).get("sub_requirements", [])
-            merged["requirement_level_0"]["sub_requirements"].extend(sub_reqs)
+            # Gộp thông tin nhân sự: cùng vị trí (kể cả vị trí bị cắt rồi được phần tiếp theo lặp lại) thì gộp
+            hr_positions.extend(item.get("hr") or [])
+
+            # Gộp các yêu cầu kỹ thuật: khử trùng lặp phần chồng lấn giữa các chunk
+            root = item.get("requirement_level_0")
+            if isinstance(root, dict):
+                roots.append(root)
 
+        merged = {"hr": PositionGroups(hr_positions).merged()}
+        merged["requirement_level_0"] = merge_requirement_trees(roots)
+        extracted = sum(count_requirements(root.get("sub_requirements") or []) for root in roots)
+        kept = count_requirements(merged["requirement_level_0"]["sub_requirements"])
+        logger.info(f"Merged technical requirements: {extracted} -> {kept} nodes")
         return merged
 
     def _get_prompt_template(self):
@@ -1,17 +1,13 @@
 # Standard imports
 import time
 from datetime import datetime
-from typing import Any, Dict
-
-# Third party imports
-from langchain_core.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
+from typing import Any, Dict, List
 
 # Your imports
 from app.nodes.agentic_proposal.extraction_handle_error import format_error_message
 from app.nodes.states.state_proposal_v1 import StateProposalV1
 from app.storage import pgdb_proposal
-from app.model_ai import llm
+from app.utils import hr_merge
 from app.utils.logger import get_logger 
 from app.utils.insert_technical import insert_technical
 
@@ -51,64 +47,18 @@ class PostExtractionMDNodeV2m0p0:
                 continue
         return "NULL"  # Nếu không khớp bất kỳ format nào
     
-    def merge_hr_requirements(self, result_extraction_hr: Dict[str, Any], result_extraction_technology: Dict[str, Any]):
+    def merge_hr_requirements(self, result_extraction_hr: List[Dict[str, Any]], result_extraction_technology: List[Dict[str, Any]]):
         """
             merge_hr_requirements
-            Gộp và so sánh yêu cầu nhân sự từ 2 JSON HR.
+            Gộp và so sánh yêu cầu nhân sự từ 2 nguồn bằng bộ gộp cục bộ (app.utils.hr_merge),
+            chỉ hỏi model cho các cặp vị trí mơ hồ.
             Args:
-                - result_extraction_hr: Dict[str, Any] - JSON A (Hồ sơ mời thầu HR)
-                - result_extraction_technology: Dict[str, Any] - JSON B (Yêu cầu kỹ thuật HR)
+                - result_extraction_hr: List[Dict[str, Any]] - nhân sự từ node HR (Hồ sơ mời thầu HR)
+                - result_extraction_technology: List[Dict[str, Any]] - nhân sự từ node kỹ thuật (Yêu cầu kỹ thuật HR)
             Output:
-                - result: Dict[str, Any] - Kết quả gộp và so sánh yêu cầu nhân sự
-        """
-        llm_structured = llm.chat_model_gpt_4o_mini().with_structured_output(None, method="json_mode")
-        system_prompt_template = PromptTemplate.from_template(
+                - result: List[Dict[str, Any]] - Danh sách vị trí nhân sự đã gộp
         """
-            Bạn là một chuyên gia phân tích và so sánh dữ liệu đầu vào.
-            Dưới đây là hai JSON chứa yêu cầu nhân sự (HR) cho các vị trí khác nhau.Hãy phân tích và xác định các yêu cầu nhân sự từ hai JSON này. 
-            **Yêu cầu xử lý:**
-                + Nếu một vị trí chỉ có trong một JSON, hãy giữ nguyên vị trí đó và gộp chúng lại.
-                + Nếu có sự trùng lặp giữa hai JSON:
-                    - So sánh chi tiết từng trường: yêu cầu bằng cấp, số lượng, kinh nghiệm, chứng chỉ, v.v.
-                    - Ưu tiên giữ lại thông tin chi tiết hơn, đầy đủ hơn hoặc hợp lý hơn giữa hai nguồn.
-                    - Nếu thông tin từ cả hai nguồn đều hữu ích, hãy gộp lại có cấu trúc.
-            
-            **Ví dụ:**
-            *Ví dụ 1: Trùng yêu cầu và mô tả:
-                INPUT:
-                    JSON A: "result_extraction_hr": {{"hr": [{{"position": "Kỹ sư mạng","quantity": "2","requirements": [{{"name": "Bằng cấp","description": "Tốt nghiệp đại học ngành CNTT."}}]}}]}},
-                    JSON B: "result_extraction_technology": {{"hr": [{{"position": "Kỹ sư mạng","quantity": "2","requirements": [{{"name": "Bằng cấp","description": "Tốt nghiệp đại học ngành CNTT."}}]}}]}}
-                OUTPUT:
-                    {{"hr": [{{"position": "Kỹ sư mạng","quantity": "2","requirements": [{{"name": "Bằng cấp","description": "Tốt nghiệp đại học ngành CNTT."}}]}}]}}
-
-            *Ví dụ 2: Trùng tên yêu cầu, mô tả khác:
-                INPUT:
-                    JSON A: "result_extraction_hr": {{"hr": [{{"position": "Lập trình viên","quantity": "3","requirements": [{{"name": "Kinh nghiệm","description": "Ít nhất 2 năm kinh nghiệm phát triển phần mềm."}}]}}]}},
-                    JSON B: "result_extraction_technology": {{"hr": [{{"position": "Lập trình viên","quantity": "3","requirements": [{{"name": "Kinh nghiệm","description": "Đã từng tham gia phát triển hệ thống lớn sử dụng Python hoặc Java."}}]}}]}}
-                OUTPUT:
-                    {{"hr": [{{"position": "Lập trình viên","quantity": "3","requirements": [{{"name": "Kinh nghiệm","description": "• Ít nhất 2 năm kinh nghiệm phát triển phần mềm.\n• Đã từng tham gia phát triển hệ thống lớn sử dụng Python hoặc Java."}}]}}]}}
-                
-            *Ví dụ 3: Yêu cầu khác biệt:
-                INPUT:
-                    JSON A: "result_extraction_hr": {{"hr": [{{"position": "Quản trị hệ thống","quantity": "1","requirements": [{{"name": "Chứng chỉ","description": "Có chứng chỉ MCSA hoặc tương đương."}}]}}]}},
-                    JSON B: "result_extraction_technology": {{"hr": [{{"position": "Quản trị hệ thống","quantity": "1","requirements": [{{"name": "Trình độ chuyên môn","description": "Tốt nghiệp đại học chuyên ngành Hệ thống thông tin."}}]}}]}}
-                OUTPUT:
-                    {{"hr": [{{"position": "Quản trị hệ thống","quantity": "1","requirements"{{"name": "Chứng chỉ","description": "Có chứng chỉ MCSA hoặc tương đươn{{"name": "Trình độ chuyên môn","description": "Tốt nghiệp đại học chuyên ngành Hệ thống thông ti}}]}}]}}
-                    
-            **Đầu vào:
-                JSON A (Hồ sơ mời thầu HR):
-                {result_extraction_hr}
-
-                JSON B (Yêu cầu kỹ thuật HR):
-                {result_extraction_technology}
-            Kết luận: (Hãy đưa ra kết quả cuối cùng dựa trên phân tích của bạn)
-        """)
-        merge_chain = system_prompt_template | llm_structured
-        result = merge_chain.invoke({
-            "result_extraction_hr": result_extraction_hr,
-            "result_extraction_technology": result_extraction_technology,
-        })
-        return result["hr"] if "hr" in result else []
+        return hr_merge.merge_hr_requirements(result_extraction_hr, result_extraction_technology)
 
     # Defining __call__ method
     def __call__(self, state: StateProposalV1):
@@ -184,12 +134,15 @@ class PostExtractionMDNodeV2m0p0:
             # 3. insert into hr requirement and hr detail requirement table
             result_extraction_hr = state.get("result_extraction_hr", [])
             result_extraction_technology = state.get("result_extraction_technology", {})
+            hr_items = []
             if isinstance(result_extraction_technology, dict):
                 hr_items = result_extraction_technology.get("hr", [])
-                if isinstance(hr_items, list) and len(hr_items) > 0:
-                    result_extraction_hr = self.merge_hr_requirements(result_extraction_hr, hr_items)
+            # Gộp cục bộ (không gọi model trừ cặp mơ hồ), đồng thời khử trùng lặp trong từng nguồn
+            result_extraction_hr = self.merge_hr_requirements(
+                result_extraction_hr, hr_items if isinstance(hr_items, list) else [])
             
-            result_extraction_hr = list(filter(lambda item: int(item.get("quantity", "0")) > 0, result_extraction_hr))
+            result_extraction_hr = list(filter(
+                lambda item: (hr_merge.parse_quantity(item.get("quantity", "0")) or 0) > 0, result_extraction_hr))
             if len(result_extraction_hr) > 0:
                 pgdb_proposal.insert_many_hr_requirement(
                     proposal_id, result_extraction_hr
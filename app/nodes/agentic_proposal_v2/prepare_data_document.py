@@ -18,6 +18,7 @@ from app.model_ai import llm
 from app.storage import pgdb
 from app.nodes.states.state_proposal_v1 import StateProposalV1
 from app.utils.minio import download_from_minio
+from app.utils.profiler import ContextThreadPoolExecutor
 
 logger = get_logger("except_handling_extraction")
 
@@ -186,7 +187,7 @@ class PrepareDataDocumentNodeV2m0p0:
 
             # 3. Tải và đọc tất cả markdown song song
             content_by_type = defaultdict(list)
-            with concurrent.futures.ThreadPoolExecutor() as executor:
+            with ContextThreadPoolExecutor() as executor:
                 future_to_file = {
                     executor.submit(self.download_and_read_markdown, file): file
                     for file in document_file_md_filtered
@@ -1,5 +1,6 @@
 # Standard imports
 import time
+from typing import Callable, Dict, Optional
 
 # Third party imports
 from langgraph.graph import StateGraph, START, END
@@ -16,8 +17,22 @@ from app.nodes.agentic_proposal_v2.post_extraction_node import PostExtractionMDN
 from app.nodes.agentic_proposal_v2.prepare_data_document import PrepareDataDocumentNodeV2m0p0
 from app.nodes.agentic_proposal_v2.extraction_notice_bid_node import ExtractionNoticeBidMDNodeV2m0p0
 from app.nodes.agentic_proposal_v2.summary_hsmt_node import SummaryHSMTNodeV2m0p1
-def proposal_md_team_graph_v2_0_0():
-    """proposal_md_team_graph_v2_0_0"""
+from app.nodes.agentic_proposal_v2.data_dependencies import DeclaredReadsNode, validate_data_dependencies
+from app.utils.metrics import instrument_node
+
+GRAPH_NAME = "proposal_md_team_v2_0_0"
+
+
+def proposal_md_team_graph_v2_0_0(node_overrides: Optional[Dict[str, Callable]] = None):
+    """
+        proposal_md_team_graph_v2_0_0
+
+        Summary HSMT chạy song song với các nhánh bóc tách (không nhánh nào đọc kết quả
+        của Summary) và chỉ hội tụ tại Post-Extraction.
+
+        Args:
+            node_overrides: Thay node theo tên (dùng cho benchmark/test với LLM giả lập).
+    """
     start_time = time.perf_counter()
 
     #
@@ -62,6 +77,13 @@ def proposal_md_team_graph_v2_0_0():
     #
     # End Define Node
     #
+    node_overrides = node_overrides or {}
+
+    def wrap(node):
+        """Node (hoặc node thay thế) kèm kiểm tra data dependency và metrics"""
+        return instrument_node(
+            GRAPH_NAME, DeclaredReadsNode(node.name, node_overrides.get(node.name, node)))
+
     #
     # Build Graph
     #
@@ -70,23 +92,23 @@ def proposal_md_team_graph_v2_0_0():
     # Add node
     #
     # 1. Prepare Data MD
-    builder.add_node(prepare_data_document_node_v2.name, prepare_data_document_node_v2)
+    builder.add_node(prepare_data_document_node_v2.name, wrap(prepare_data_document_node_v2))
     # 2. Classify Document PDF
-    builder.add_node(classify_document_pdf_node_v2.name, classify_document_pdf_node_v2)
+    builder.add_node(classify_document_pdf_node_v2.name, wrap(classify_document_pdf_node_v2))
     # 3. Summary HSMT
-    builder.add_node(summary_hsmt_node_v2.name, summary_hsmt_node_v2)
+    builder.add_node(summary_hsmt_node_v2.name, wrap(summary_hsmt_node_v2))
     # 4. Extraction HR MD
-    builder.add_node(extraction_hr_md_node_v2.name, extraction_hr_md_node_v2)
+    builder.add_node(extraction_hr_md_node_v2.name, wrap(extraction_hr_md_node_v2))
     # 5. Extraction Finance MD
-    builder.add_node(extraction_finance_md_node_v2.name, extraction_finance_md_node_v2)
+    builder.add_node(extraction_finance_md_node_v2.name, wrap(extraction_finance_md_node_v2))
     # 6. Extraction Experience MD
-    builder.add_node(extraction_experience_md_node_v2.name, extraction_experience_md_node_v2)
+    builder.add_node(extraction_experience_md_node_v2.name, wrap(extraction_experience_md_node_v2))
     # 7. Extraction Technology MD
-    builder.add_node(extraction_technology_md_node_v2.name, extraction_technology_md_node_v2)
+    builder.add_node(extraction_technology_md_node_v2.name, wrap(extraction_technology_md_node_v2))
     # 8. Extraction Notice Bid MD
-    builder.add_node(extraction_notice_bid_md_node_v2.name, extraction_notice_bid_md_node_v2)
+    builder.add_node(extraction_notice_bid_md_node_v2.name, wrap(extraction_notice_bid_md_node_v2))
     # 9. Post-Extraction MD
-    builder.add_node(post_extraction_md_node_v2.name, post_extraction_md_node_v2)
+    builder.add_node(post_extraction_md_node_v2.name, wrap(post_extraction_md_node_v2))
     # ------------
     # End Add Node
     #
@@ -99,39 +121,37 @@ def proposal_md_team_graph_v2_0_0():
     # 1->2
     # from Prepare Data Document to Classify Document PDF
     builder.add_edge(prepare_data_document_node_v2.name, classify_document_pdf_node_v2.name)
-    # 2->3 
-    # from Classify Document PDF to Extraction Overview MD
+    # 2->3
+    # from Classify Document PDF to Summary HSMT (nhánh song song, chỉ hội tụ ở Post-Extraction)
     builder.add_edge(classify_document_pdf_node_v2.name, summary_hsmt_node_v2.name)
-    # 3->4
-    # from Extraction Overview MD to Extraction HR MD
-    builder.add_edge(summary_hsmt_node_v2.name, extraction_hr_md_node_v2.name)
-    # 3->5
-    # from Extraction Overview MD to Extraction Finance MD
-    builder.add_edge(summary_hsmt_node_v2.name, extraction_finance_md_node_v2.name)
-    # 3->6
-    # from Extraction Overview MD to Extraction Experience MD
-    builder.add_edge(summary_hsmt_node_v2.name, extraction_experience_md_node_v2.name)
-    # 3->7
-    # from Extraction Overview MD to Extraction Technology MD
-    builder.add_edge(summary_hsmt_node_v2.name, extraction_technology_md_node_v2.name)
-    # 3->8
-    # from Extraction Overview MD to Extraction Notice Bid MD
-    builder.add_edge(summary_hsmt_node_v2.name, extraction_notice_bid_md_node_v2.name)
-    # 4->9
-    # from Extraction HR MD to Post-Extraction MD
-    builder.add_edge(extraction_hr_md_node_v2.name, post_extraction_md_node_v2.name)
-    # 5->9
-    # from Extraction Finance MD to Post-Extraction MD
-    builder.add_edge(extraction_finance_md_node_v2.name, post_extraction_md_node_v2.name)
-    # 6->9
-    # from Extraction Experience MD to Post-Extraction MD
-    builder.add_edge(extraction_experience_md_node_v2.name, post_extraction_md_node_v2.name)
-    # 7->9
-    # from Extraction Overview MD to Extraction Technology MD
-    builder.add_edge(extraction_technology_md_node_v2.name, post_extraction_md_node_v2.name)
-    # 8->9
-    # from Extraction Notice Bid MD to Extraction Technology MD
-    builder.add_edge(extraction_notice_bid_md_node_v2.name, post_extraction_md_node_v2.name)
+    # 2->4
+    # from Classify Document PDF to Extraction HR MD
+    builder.add_edge(classify_document_pdf_node_v2.name, extraction_hr_md_node_v2.name)
+    # 2->5
+    # from Classify Document PDF to Extraction Finance MD
+    builder.add_edge(classify_document_pdf_node_v2.name, extraction_finance_md_node_v2.name)
+    # 2->6
+    # from Classify Document PDF to Extraction Experience MD
+    builder.add_edge(classify_document_pdf_node_v2.name, extraction_experience_md_node_v2.name)
+    # 2->7
+    # from Classify Document PDF to Extraction Technology MD
+    builder.add_edge(classify_document_pdf_node_v2.name, extraction_technology_md_node_v2.name)
+    # 2->8
+    # from Classify Document PDF to Extraction Notice Bid MD
+    builder.add_edge(classify_document_pdf_node_v2.name, extraction_notice_bid_md_node_v2.name)
+    # (3,4,5,6,7,8)->9
+    # Post-Extraction chờ tất cả các nhánh hoàn thành
+    builder.add_edge(
+        [
+            summary_hsmt_node_v2.name,
+            extraction_hr_md_node_v2.name,
+            extraction_finance_md_node_v2.name,
+            extraction_experience_md_node_v2.name,
+            extraction_technology_md_node_v2.name,
+            extraction_notice_bid_md_node_v2.name,
+        ],
+        post_extraction_md_node_v2.name,
+    )
     # 9->END
     # from Post-Extraction to Generate Excel And Docx
     builder.add_edge(post_extraction_md_node_v2.name, END)
@@ -140,6 +160,9 @@ def proposal_md_team_graph_v2_0_0():
     
 
     graph = builder.compile(debug=False)
+    validate_data_dependencies(
+        (edge.source, edge.target) for edge in graph.get_graph().edges
+    )
     finish_time = time.perf_counter()
     print(f"Total time build graph proposal_md_team_graph_v2_0_0 = {finish_time - start_time} s")
     return graph
@@ -8,6 +8,7 @@ from langchain_core.prompts import ChatPromptTemplate
 from app.model_ai import llm
 from app.nodes.states.state_proposal_v1 import StateProposalV1
 from app.utils.logger import get_logger
+from app.utils.section_router import route_sections
 
 logger = get_logger("except_handling_extraction")
 
@@ -153,7 +154,9 @@ class SummaryHSMTNodeV2m0p1:
         """
         print(self.name)
         start_time = time.perf_counter()
-        chapter_content = state["document_content_markdown_hsmt"]
+        # Thông tin chung nằm ở trang bìa/phần đầu và các mục có từ khóa liên quan
+        chapter_content = route_sections(
+            state["document_content_markdown_hsmt"], "summary", hs_id=state.get("hs_id"))
         # Không có chương liên quan để bóc tách
         if len(chapter_content) < 0:
             return {
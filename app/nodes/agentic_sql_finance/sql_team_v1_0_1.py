@@ -9,6 +9,9 @@ from app.nodes.agentic_sql_finance.generate_excel_and_docx import GenerateExcelA
 from app.nodes.agentic_sql_finance.sql_finance_conditional_node import SQLFinanceConditionalNodeV1
 from app.model_ai import llm
 from app.nodes.states.state_finance import StateSqlFinance
+from app.utils.metrics import instrument_node
+
+GRAPH_NAME = "sql_team_v1_0_1"
 
 
 def sql_team_graph_v1_0_1():
@@ -59,15 +62,15 @@ def sql_team_graph_v1_0_1():
     # Add node
     #
     # 1. SQL Expert
-    builder.add_node(sql_expert_node.name, sql_expert_node)
+    builder.add_node(sql_expert_node.name, instrument_node(GRAPH_NAME, sql_expert_node))
     # 2. SQL Executor
-    builder.add_node(sql_executor_node.name, sql_executor_node)
+    builder.add_node(sql_executor_node.name, instrument_node(GRAPH_NAME, sql_executor_node))
     # 3. SQL Summary
-    builder.add_node(sql_summarizer_node.name, sql_summarizer_node)
+    builder.add_node(sql_summarizer_node.name, instrument_node(GRAPH_NAME, sql_summarizer_node))
     # 4. Generate Excel And Docx
-    builder.add_node(generate_excel_and_docx_node.name, generate_excel_and_docx_node)
+    builder.add_node(generate_excel_and_docx_node.name, instrument_node(GRAPH_NAME, generate_excel_and_docx_node))
     # 5. SQL Supervisor
-    builder.add_node(sql_supervisor_node.name, sql_supervisor_node)
+    builder.add_node(sql_supervisor_node.name, instrument_node(GRAPH_NAME, sql_supervisor_node))
     # ------------
     # End Add Node
     #
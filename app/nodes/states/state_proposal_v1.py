@@ -1,6 +1,6 @@
 # Standard imports
 import operator
-from typing import Annotated, Any, List, TypedDict
+from typing import Annotated, Any, Dict, List, Optional, TypedDict, Union
 
 from pydantic import BaseModel, Field
 
@@ -71,6 +71,44 @@ class ExtractExperienceRequirementList(BaseModel):
     )
 
 
+class ExtractHRRequirement(BaseModel):
+    """Yêu cầu của một vị trí nhân sự"""
+
+    name: Optional[str] = Field(default="", description="Tên yêu cầu")
+    description: Optional[str] = Field(default="", description="Mô tả chi tiết của yêu cầu")
+    document_name: Optional[str] = Field(default="", description="Biểu mẫu cần nộp")
+
+
+class ExtractHRPosition(BaseModel):
+    """Vị trí nhân sự được trích xuất"""
+
+    position: str = Field(description="Vị trí công việc")
+    quantity: Union[int, str, None] = Field(default=None, description="Số lượng")
+    requirements: List[ExtractHRRequirement] = Field(default_factory=list)
+
+
+class ExtractHRPositionList(BaseModel):
+    """Kết quả node nhân sự: {"hr": [...]}"""
+
+    hr: List[ExtractHRPosition] = Field(description="Danh sách vị trí nhân sự")
+
+
+class TechnologyRequirement(BaseModel):
+    """Một nút của cây yêu cầu kỹ thuật; con nằm dưới khóa requirement_level_<N>"""
+
+    muc: Union[str, int, float, None] = None
+    requirement_name: Optional[str] = ""
+    description: List[Union[Dict[str, Any], str]] = Field(default_factory=list)
+    sub_requirements: List[Dict[str, "TechnologyRequirement"]] = Field(default_factory=list)
+
+
+class ExtractTechnologyResult(BaseModel):
+    """Kết quả một chunk của node kỹ thuật"""
+
+    hr: List[ExtractHRPosition] = Field(default_factory=list)
+    requirement_level_0: Optional[TechnologyRequirement] = None
+
+
 class StateProposalV1(TypedDict):
     """
     StateProposalV1
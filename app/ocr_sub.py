@@ -0,0 +1,83 @@
+import json
+import os
+import signal
+import sys
+import tempfile
+import threading
+
+from app.config.env import EnvSettings
+from app.mq.rabbit_mq import RabbitMQClient
+from app.utils.distributed_ocr import process_part
+from app.utils.download_file_minio import get_minio_client
+from app.utils.logger import get_logger
+from app.utils.metrics import observe_object_store, start_metrics_server
+
+logger = get_logger(__name__)
+
+# Khởi tạo RabbitMQClient dùng chung
+RABBIT_MQ_HOST = EnvSettings().RABBIT_MQ_HOST
+RABBIT_MQ_PORT = EnvSettings().RABBIT_MQ_PORT
+RABBIT_MQ_USER = EnvSettings().RABBIT_MQ_USER
+RABBIT_MQ_PASS = EnvSettings().RABBIT_MQ_PASS
+RABBIT_MQ_OCR_QUEUE = EnvSettings().RABBIT_MQ_OCR_QUEUE
+
+rabbit_mq = RabbitMQClient(
+    host=RABBIT_MQ_HOST,
+    port=RABBIT_MQ_PORT,
+    user=RABBIT_MQ_USER,
+    password=RABBIT_MQ_PASS,
+    prefetch_count=1,
+)
+
+# Các phần liên tiếp của cùng một hồ sơ thường đến cùng worker: giữ vài file nguồn gần nhất
+SOURCE_CACHE_DIR = tempfile.mkdtemp(prefix="ocr-source-")
+SOURCE_CACHE_SIZE = 3
+_source_cache_lock = threading.Lock()
+
+
+def _source_path(bucket: str, object_name: str) -> str:
+    """Tải file PDF nguồn về cache cục bộ (nếu chưa có) và trả về đường dẫn."""
+    path = os.path.join(SOURCE_CACHE_DIR, f"{bucket}__{os.path.basename(object_name)}")
+    with _source_cache_lock:
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+        cached = sorted(
+            (os.path.join(SOURCE_CACHE_DIR, name) for name in os.listdir(SOURCE_CACHE_DIR)),
+            key=os.path.getmtime)
+        for old_path in cached[:max(0, len(cached) - SOURCE_CACHE_SIZE + 1)]:
+            os.remove(old_path)
+        with observe_object_store("download", bucket) as transfer:
+            get_minio_client().fget_object(bucket_name=bucket, object_name=object_name, file_path=path)
+            transfer.bytes = os.path.getsize(path)
+    return path
+
+
+def consume_callback(ch, method, properties, body):
+    """Hàm consume_callback:
+        - Input: message {job_id, part, bucket, object_name, page_range: [start, end), document_name, attempt}.
+        - OCR các trang [start, end) của file nguồn và ghi markdown từng phần lên MinIO
+          (OCR_PARTS_BUCKET/<job_id>/<part>.md); bên classify ghép các phần theo thứ tự."""
+    message = json.loads(body.decode("utf-8"))
+    logger.info(f" [x] Received OCR part: {message}")
+    source_path = _source_path(message["bucket"], message["object_name"])
+    process_part(message, source_path)
+
+
+def ocr_sub():
+    """
+        ocr_queue
+    """
+    # Define signal handler for graceful shutdown
+    def signal_handler(sig, frame):
+        logger.info("Interrupt received, shutting down...")
+        sys.exit(0)
+
+    # Register the signal handler for SIGINT (Ctrl+C)
+    signal.signal(signal.SIGINT, signal_handler)
+
+    queue = RABBIT_MQ_OCR_QUEUE
+    start_metrics_server(default_port=9106)
+    # Manual ack + prefetch 1: mỗi worker chỉ giữ một phần, ack sau khi write_part xong.
+    # OCR chạy trong worker thread để I/O loop vẫn gửi heartbeat khi một phần chạy lâu.
+    rabbit_mq.start_consumer(queue, consume_callback, auto_ack=False, threaded=True)
@@ -10,6 +10,7 @@ from app.storage import postgre
 from app.nodes.agentic_sql_finance.sql_team_v1_0_1 import (
     sql_team_graph_v1_0_1_instance,
 )
+from app.utils.metrics import PipelineStep, start_metrics_server
 from app.utils.smtp_mail import send_email_with_attachments
 MINIO_API_ENDPOINT = EnvSettings().MINIO_API_ENDPOINT  # Cổng API
 MINIO_CONSOLE_ENDPOINT = EnvSettings().MINIO_CONSOLE_ENDPOINT  # Cổng Console (UI)
@@ -51,9 +52,9 @@ def consume_callback(ch, method, properties, body):
         recipient=message.get("recipient", "")
         attachment_paths=message.get("attachment_paths", None)
         # Insert History SQL With hs_id and step SENT_MAIL
-        inserted_step_send_mail = postgre.insertHistorySQL(hs_id=hs_id, step="SENT_MAIL")
+        step_send_mail = PipelineStep(hs_id=hs_id, step="SENT_MAIL")
         # Insert History SQL With hs_id and step COMPELETE
-        inserted_step_compelete = postgre.insertHistorySQL(hs_id=hs_id, step="COMPELETE")
+        step_compelete = PipelineStep(hs_id=hs_id, step="COMPELETE")
         response = send_email_with_attachments(
             email_address=EnvSettings().GMAIL_ADDRESS,
             app_password=EnvSettings().GMAIL_APP_PASSWORD,
@@ -75,13 +76,14 @@ def consume_callback(ch, method, properties, body):
                 print(" [v] Email sent successfully")
                 
                 # Update Hisotry End Date SQL with SENT_MAIL
-                postgre.updateHistoryEndDateSQL(inserted_step_send_mail)
-                if not inserted_step_send_mail:
+                step_send_mail.finish()
+                if not step_send_mail.history_id:
                     print("Không insert được trạng thái 'SENT_MAIL' vào history với hs_id: %s", hs_id)
             else:
                 sql13 = "UPDATE email_contents SET status='XU_LY_LOI', end_process_date = now() AT TIME ZONE 'UTC' WHERE hs_id=%s"
                 params13 = (hs_id,)
                 postgre.executeSQL(sql13, params13)
+        step_send_mail.close()
         # =====================================
         # Xóa các file đã tạo sau khi gửi email
         if attachment_paths:
@@ -91,8 +93,8 @@ def consume_callback(ch, method, properties, body):
                     print(f"Deleted file: {file_path}")
         
         # Update Hisotry End Date SQL with COMPELETE
-        postgre.updateHistoryEndDateSQL(inserted_step_compelete)
-        if not inserted_step_compelete:
+        step_compelete.finish()
+        if not step_compelete.history_id:
             print("Không insert được trạng thái 'COMPELETE' vào history với hs_id: %s", hs_id)
         return {"status": "success", "message": "Thành công"}
     except json.JSONDecodeError:
@@ -111,6 +113,7 @@ def send_mail_sub():
     # Register the signal handler for SIGINT (Ctrl+C)
     signal.signal(signal.SIGINT, signal_handler)
     queue = RABBIT_MQ_SEND_MAIL_QUEUE
+    start_metrics_server(default_port=9105)
     rabbit_mq.start_consumer(queue, consume_callback)
 
 
@@ -11,6 +11,7 @@ from app.nodes.agentic_sql_finance.sql_team_v1_0_1 import (
 )
 from app.storage import postgre
 from app.utils.logger import get_logger
+from app.utils.metrics import PipelineStep, start_metrics_server
 
 # Initialize logger
 logger = get_logger(__name__)
@@ -109,14 +110,14 @@ def consume_callback(ch, method, properties, body):
         }
         try:
             # Insert History SQL
-            inserted_step_sql_answer = postgre.insertHistorySQL(hs_id=hs_id, step="SQL_ANSWER")
+            step_sql_answer = PipelineStep(hs_id=hs_id, step="SQL_ANSWER")
             res = sql_team_graph_v1_0_1_instance.invoke(
                 inputs
             )
             # Update Hisotry End Date SQL
-            postgre.updateHistoryEndDateSQL(inserted_step_sql_answer)
+            step_sql_answer.finish()
             if is_data_extracted_finance:
-                if not inserted_step_sql_answer:
+                if not step_sql_answer.history_id:
                     print(f"Không insert được trạng thái 'SQL_ANSWER' vào history với hs_id: {hs_id}")
             logger.info("[v] Done run graph and inserted finance requirement.")
         except Exception as e:
@@ -156,5 +157,6 @@ def sql_answer_sub():
 
     # Register the signal handler for SIGINT (Ctrl+C)
     signal.signal(signal.SIGINT, signal_handler)
+    start_metrics_server(default_port=9104)
     queue = RABBIT_MQ_SQL_ANSWER_QUEUE
     rabbit_mq.start_consumer(queue, consume_callback)
@@ -1,7 +1,7 @@
-import psycopg2
 from pydantic import BaseModel
 
 from app.config.env import EnvSettings
+from app.storage.postgre import connect
 
 ###
 # Database Configuration
@@ -30,7 +30,7 @@ class ChatHistory(BaseModel):
 def select(select_statement: str):
     """run select sql"""
     # Connect to PostgreSQL database
-    conn = psycopg2.connect(CONNECTION_STRING)
+    conn = connect()
     cur = conn.cursor()
 
     cur.execute(select_statement)
@@ -49,7 +49,7 @@ def select(select_statement: str):
 def insert(insert_statement: str):
     """run insert sql"""
     # Connect to PostgreSQL database
-    conn = psycopg2.connect(CONNECTION_STRING)
+    conn = connect()
     cur = conn.cursor()
 
     cur.execute(insert_statement)
@@ -63,7 +63,7 @@ def insert(insert_statement: str):
 def insert_and_return_id(insert_statement: str):
     """Run insert SQL and return the inserted ID"""
     # Connect to PostgreSQL database
-    conn = psycopg2.connect(CONNECTION_STRING)
+    conn = connect()
     cur = conn.cursor()
 
     try:
@@ -89,7 +89,7 @@ def insert_and_return_id(insert_statement: str):
 
 def insert_and_return_ids(insert_statement: str):
     """Run insert SQL and return the inserted IDs (for multiple rows)"""
-    conn = psycopg2.connect(CONNECTION_STRING)
+    conn = connect()
     cur = conn.cursor()
 
     try:
@@ -116,7 +116,7 @@ def insert_and_return_ids(insert_statement: str):
 def update(update_statement: str):
     """run update sql"""
     # Connect to PostgreSQL database
-    conn = psycopg2.connect(CONNECTION_STRING)
+    conn = connect()
     cur = conn.cursor()
 
     # Execute the update statement
@@ -1,10 +1,10 @@
 # Standard imports
 from typing import List, Optional
-import psycopg2
 from pydantic import BaseModel
 
 # Yours import
 from app.config.env import EnvSettings
+from app.storage.postgre import connect
 
 ###
 # Database Configuration
@@ -112,7 +112,7 @@ class HRDetailRequirement(BaseModel):
 def select(select_statement: str):
     """run select sql"""
     # Connect to PostgreSQL database
-    conn = psycopg2.connect(CONNECTION_STRING)
+    conn = connect()
     cur = conn.cursor()
 
     cur.execute(select_statement)
@@ -131,7 +131,7 @@ def select(select_statement: str):
 def insert(insert_statement: str):
     """run insert sql"""
     # Connect to PostgreSQL database
-    conn = psycopg2.connect(CONNECTION_STRING)
+    conn = connect()
     cur = conn.cursor()
 
     cur.execute(insert_statement)
@@ -146,7 +146,7 @@ def insert(insert_statement: str):
 def insert_many(insert_statement: str, values):
     """run insert sql"""
     # Connect to PostgreSQL database
-    conn = psycopg2.connect(CONNECTION_STRING)
+    conn = connect()
     cur = conn.cursor()
 
     cur.executemany(insert_statement, values)
@@ -161,7 +161,7 @@ def insert_many(insert_statement: str, values):
 def insert_and_get_id(insert_statement: str):
     """run insert sql"""
     # Connect to PostgreSQL database
-    conn = psycopg2.connect(CONNECTION_STRING)
+    conn = connect()
     cur = conn.cursor()
 
     cur.execute(f"{insert_statement} RETURNING id;")
@@ -177,7 +177,7 @@ def insert_and_get_id(insert_statement: str):
 def update(update_statement: str):
     """run update sql"""
     # Connect to PostgreSQL database
-    conn = psycopg2.connect(CONNECTION_STRING)
+    conn = connect()
     cur = conn.cursor()
 
     # Execute the update statement
@@ -218,7 +218,7 @@ def load_chat_history(session: str):
 def insert_proposal(proposal_info: Proposal):
     """insert one proposal and return id of proposal"""
     # Connect to PostgreSQL database
-    conn = psycopg2.connect(CONNECTION_STRING)
+    conn = connect()
     cur = conn.cursor()
     sql = f"""
     INSERT INTO public.proposal
@@ -248,7 +248,7 @@ def insert_proposal(proposal_info: Proposal):
 def insert_proposal_v1_0_2(proposal_info: ProposalV1_0_2):
     """insert one proposal and return id of proposal"""
     # Connect to PostgreSQL database
-    conn = psycopg2.connect(CONNECTION_STRING)
+    conn = connect()
     cur = conn.cursor()
     sql = f"""
     INSERT INTO public.proposal
@@ -280,7 +280,7 @@ def insert_proposal_v1_0_2(proposal_info: ProposalV1_0_2):
 def insert_proposal_v1_0_3(proposal_info: ProposalV1_0_3):
     """insert one proposal and return id of proposal"""
     # Connect to PostgreSQL database
-    conn = psycopg2.connect(CONNECTION_STRING)
+    conn = connect()
     cur = conn.cursor()
     sql = f"""
     INSERT INTO public.proposal
@@ -319,7 +319,7 @@ def insert_many_finance_requirement(
 ):
     """run insert sql"""
     # Connect to PostgreSQL database
-    conn = psycopg2.connect(CONNECTION_STRING)
+    conn = connect()
     cur = conn.cursor()
     # list of rows to be inserted
     finance_values = [
@@ -344,7 +344,7 @@ def insert_many_finance_requirement(
 def insert_many_hr_requirement(proposal_id, list_of_hr_requirement):
     """insert many hr requirement"""
     # Connect to PostgreSQL database
-    conn = psycopg2.connect(CONNECTION_STRING)
+    conn = connect()
     cur = conn.cursor()
     # list of rows to be inserted
     
@@ -382,7 +382,7 @@ def insert_many_experience_requirement(
 ):
     """insert many experience requirement"""
     # Connect to PostgreSQL database
-    conn = psycopg2.connect(CONNECTION_STRING)
+    conn = connect()
     cur = conn.cursor()
     # list of rows to be inserted
     experience_values = [
@@ -401,4 +401,95 @@ def insert_many_experience_requirement(
     conn.commit()
     # Closing the cursor and connection
     cur.close()
-    conn.close()
\ No newline at end of file
+    conn.close()
+
+def clone_proposal(source_proposal_id, email_content_id):
+    """copy a proposal and all of its requirements for another email content, return id of the copy"""
+    # Connect to PostgreSQL database
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            INSERT INTO public.proposal
+                (investor_name, proposal_name,
+                release_date, project,
+                package_number, decision_number,
+                agentai_name, agentai_code, filename,
+                email_content_id, status, selection_method,
+                field, execution_duration, closing_time,
+                validity_period, security_amount
+                )
+            SELECT investor_name, proposal_name,
+                release_date, project,
+                package_number, decision_number,
+                agentai_name, agentai_code, filename,
+                %s, 'EXTRACTED', selection_method,
+                field, execution_duration, closing_time,
+                validity_period, security_amount
+            FROM public.proposal
+            WHERE id = %s
+            RETURNING id;
+        """, (email_content_id, source_proposal_id))
+        proposal_id = cur.fetchone()[0]
+
+        for table in ("finance_requirement", "experience_requirement"):
+            cur.execute(f"""
+                INSERT INTO public.{table}
+                (proposal_id, requirements, description, document_name)
+                SELECT %s, requirements, description, document_name
+                FROM public.{table}
+                WHERE proposal_id = %s
+                ORDER BY id;
+            """, (proposal_id, source_proposal_id))
+
+        # hr requirement: mỗi dòng có chi tiết riêng theo hr_id
+        cur.execute("""
+            SELECT id, "position", quantity FROM public.hr_requirement WHERE proposal_id = %s ORDER BY id;
+        """, (source_proposal_id,))
+        for hr_id, position, quantity in cur.fetchall():
+            cur.execute("""
+                INSERT INTO public.hr_requirement (proposal_id, "position", quantity)
+                VALUES (%s, %s, %s)
+                RETURNING id;
+            """, (proposal_id, position, quantity))
+            new_hr_id = cur.fetchone()[0]
+            cur.execute("""
+                INSERT INTO public.hr_detail_requirement (hr_id, "name", description, document_name)
+                SELECT %s, "name", description, document_name
+                FROM public.hr_detail_requirement
+                WHERE hr_id = %s;
+            """, (new_hr_id, hr_id))
+
+        # technical requirement: cây yêu cầu (id_original là id cha), cha luôn được insert trước con
+        cur.execute("""
+            INSERT INTO public.technical_requirement_json (proposal_id, requirement_json)
+            SELECT %s, requirement_json FROM public.technical_requirement_json WHERE proposal_id = %s;
+        """, (proposal_id, source_proposal_id))
+        cur.execute("""
+            SELECT id, requirements, id_original FROM public.technical_requirement WHERE proposal_id = %s ORDER BY id;
+        """, (source_proposal_id,))
+        new_requirement_ids = {}
+        for requirement_id, requirements, parent_id in cur.fetchall():
+            cur.execute("""
+                INSERT INTO public.technical_requirement (proposal_id, requirements, id_original)
+                VALUES (%s, %s, %s)
+                RETURNING id;
+            """, (proposal_id, requirements, new_requirement_ids.get(parent_id)))
+            new_requirement_ids[requirement_id] = cur.fetchone()[0]
+            cur.execute("""
+                INSERT INTO public.technical_detail_requirement (requirement_id, description)
+                SELECT %s, description
+                FROM public.technical_detail_requirement
+                WHERE requirement_id = %s;
+            """, (str(new_requirement_ids[requirement_id]), str(requirement_id)))
+
+        # Committing the transaction
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        # Closing the cursor and connection
+        cur.close()
+        conn.close()
+    return proposal_id
@@ -2,10 +2,11 @@
 from typing import List, Optional
 
 import psycopg2
-from psycopg2 import extras
+from psycopg2 import extensions, extras
 from pydantic import BaseModel
 
 from app.config.env import EnvSettings
+from app.utils.metrics import observe_db
 
 ###
 # Database Configuration
@@ -20,6 +21,42 @@ CONNECTION_STRING = f"""
                     """
 
 
+def _sql_operation(query) -> str:
+    """Leading SQL keyword (select/insert/update/...) used as the metric label."""
+    text = query.decode() if isinstance(query, bytes) else str(query)
+    parts = text.split(None, 1)
+    return parts[0].lower() if parts else "unknown"
+
+
+class TimedCursor(extensions.cursor):
+    """Cursor that records the latency of every statement it executes."""
+
+    def execute(self, query, vars=None):
+        with observe_db(_sql_operation(query)):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        with observe_db(_sql_operation(query)):
+            return super().executemany(query, vars_list)
+
+
+class TimedRealDictCursor(extras.RealDictCursor):
+    """RealDictCursor that records the latency of every statement it executes."""
+
+    def execute(self, query, vars=None):
+        with observe_db(_sql_operation(query)):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        with observe_db(_sql_operation(query)):
+            return super().executemany(query, vars_list)
+
+
+def connect():
+    """Open a connection whose cursors are timed by default."""
+    return psycopg2.connect(CONNECTION_STRING, cursor_factory=TimedCursor)
+
+
 # Define ChatHistory class
 class ChatHistory(BaseModel):
     """ChatHistory schema"""
@@ -34,8 +71,8 @@ class ChatHistory(BaseModel):
 def selectSQL(query: str, params: Optional[tuple] = None) -> List[dict]:
     """Execute a SELECT query and return results as a list of dictionaries."""
     try:
-        with psycopg2.connect(CONNECTION_STRING) as conn:
-            with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
+        with connect() as conn:
+            with conn.cursor(cursor_factory=TimedRealDictCursor) as cur:
                 cur.execute(query, params)
                 records = cur.fetchall()
                 return records
@@ -47,7 +84,7 @@ def selectSQL(query: str, params: Optional[tuple] = None) -> List[dict]:
 def executeSQL(query: str, params: Optional[tuple] = None) -> Optional[any]:
     """Execute an INSERT, UPDATE, DELETE query and return any RETURNING values."""
     try:
-        with psycopg2.connect(CONNECTION_STRING) as conn:
+        with connect() as conn:
             with conn.cursor() as cur:
                 cur.execute(query, params)
 
@@ -65,6 +102,42 @@ def executeSQL(query: str, params: Optional[tuple] = None) -> Optional[any]:
         print(f"Error executing query: {e}")
         raise
 
+def executeManySQL(query: str, params_list: List[tuple]) -> None:
+    """Execute the same INSERT/UPDATE/DELETE for every params tuple in one transaction."""
+    try:
+        with connect() as conn:
+            with conn.cursor() as cur:
+                extras.execute_batch(cur, query, params_list)
+            conn.commit()
+    except Exception as e:
+        if 'conn' in locals():
+            conn.rollback()
+        print(f"Error executing batch query: {e}")
+        raise
+
+
+def executeValuesSQL(query: str, params_list: List[tuple]) -> List[tuple]:
+    """
+    Insert every params tuple in one multi-row statement (``VALUES %s``) and
+    return the RETURNING rows, one per params tuple in input order.
+    """
+    if not params_list:
+        return []
+    try:
+        with connect() as conn:
+            with conn.cursor() as cur:
+                # page_size = số dòng: một câu lệnh, một round trip
+                rows = extras.execute_values(
+                    cur, query, params_list, page_size=len(params_list), fetch=True)
+            conn.commit()
+            return rows
+    except Exception as e:
+        if 'conn' in locals():
+            conn.rollback()
+        print(f"Error executing multi-row insert: {e}")
+        raise
+
+
 def insertHistorySQL(hs_id: str, step: str) -> int|None:
     """Insert a record into the history table."""
     query = """
@@ -73,7 +146,7 @@ def insertHistorySQL(hs_id: str, step: str) -> int|None:
         RETURNING id;
     """
     try:
-        with psycopg2.connect(CONNECTION_STRING) as conn:
+        with connect() as conn:
             with conn.cursor() as cur:
                 cur.execute(query, (hs_id, step))
                 inserted_id = cur.fetchone()[0]
@@ -93,7 +166,7 @@ def updateHistoryEndDateSQL(id_hisotry: int) -> bool:
         WHERE id = %s
     """
     try:
-        with psycopg2.connect(CONNECTION_STRING) as conn:
+        with connect() as conn:
             with conn.cursor() as cur:
                 cur.execute(query, (id_hisotry,))
                 conn.commit()
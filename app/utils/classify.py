@@ -1,13 +1,20 @@
+import math
+import multiprocessing
 import os
+import random
 import re
 import shutil
 import tempfile
+import threading
 
 # Add these imports at the top of your file
 import time
 import traceback  # Add these imports at the top of your file
+import unicodedata
 import uuid
-from typing import Any, Dict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 
 import fitz
 import pymupdf4llm
@@ -17,12 +24,18 @@ from app.config.env import EnvSettings
 from app.model_ai import llm
 from app.mq.rabbit_mq import RabbitMQClient
 from app.storage import postgre
-from app.storage.postgre import executeSQL, insertHistorySQL, selectSQL
+from app.storage.postgre import executeManySQL, selectSQL
 from app.utils.doc_to_md import do_convert  # Import the DOCX to MD converter
+from app.utils import distributed_ocr, dossier_fingerprint, hybrid_ocr
 from app.utils.download_file_minio import get_minio_client
+from app.utils.hybrid_ocr import classify_pdf_page
+from app.utils.keyword_matcher import document_type
 from app.utils.logger import get_logger
+from app.utils.markdown_normalizer import normalize_markdown
+from app.utils.metrics import CLASSIFY_TRIAGE_DECISIONS, PipelineStep, observe_object_store
 from app.utils.minio import upload_to_minio
 from app.utils.pdf_image_to_text_batch import convert_pdf_to_text
+from app.utils.profiler import ContextThreadPoolExecutor
 
 # Set up logger using the centralized logging system
 logger = get_logger(__name__)
@@ -40,6 +53,43 @@ rabbit_mq = RabbitMQClient(
 BASE_DIR = os.environ.get('APP_BASE_DIR', os.path.dirname(
     os.path.dirname(os.path.dirname(__file__))))
 
+# Tên file gợi ý hồ sơ thuộc phạm vi xử lý (có dấu hoặc không dấu, "_"/"-" đã đổi thành khoảng trắng).
+# "chương"/"phần" chỉ tính khi kèm số thứ tự ("chuong 3", "phần IV"): "phần mềm", "phân tích" không thuộc phạm vi
+IN_SCOPE_FILE_NAME_PATTERN = re.compile(
+    r"hsmt|tbmt|hskt|tcdg|h[oồ]\s*s[oơ]|m[oờ]i\s*th[aầ]u|k[yỹ]\s*thu[aậ]t|ti[eê]u\s*chu[aẩ]n"
+    r"|\b(?:ch[uư][oơ]ng|ph[aầ]n)\s*(?:[ivx]+|\d+)\b")
+# Từ khóa cho thấy văn bản là tài liệu đấu thầu dù mẫu chưa đủ để xác định loại
+IN_SCOPE_TEXT_PATTERN = re.compile(
+    r"mời\s+thầu|gói\s+thầu|đấu\s+thầu|nhà\s+thầu|dự\s+thầu|chủ\s+đầu\s+tư|k[ỹy]\s*thu[ậa]t|tiêu\s+chuẩn\s+đánh\s+giá")
+
+
+class SampleTriage(NamedTuple):
+    in_scope: bool
+    sample_type: str
+    classify_type: str
+    is_image_based: bool
+    reason: str
+    # PDF ảnh: text OCR của ``sample_pages`` trang đầu, dùng lại khi chuyển đổi toàn bộ
+    sample_text: str = ""
+    sample_pages: int = 0
+
+
+class ConversionJob(NamedTuple):
+    email_content_id: Any
+    file_name: str
+    link: str
+    file_path: str
+    triage: SampleTriage
+    source_hash: str = ""
+
+
+# Luật dừng khi phân tích trang PDF: xét ít nhất chừng này trang, sai số cho phép
+PDF_ANALYSIS_MIN_PAGES = 5
+PDF_ANALYSIS_DELTA = 0.01
+
+_conversion_pool: Optional[ProcessPoolExecutor] = None
+_conversion_pool_lock = threading.Lock()
+
 
 def classify(hs_id: str, email: str):
     """
@@ -61,159 +111,48 @@ def classify(hs_id: str, email: str):
     temp_dir = tempfile.mkdtemp()
     logger.debug(f"Created temporary directory: {temp_dir}")
 
-    downloaded_files = []
     files_object = []
     errors = []
+    # Trạng thái email_contents được gom lại và ghi một lần khi mọi file đã xong
+    status_updates = []
+    max_workers = max(1, min(EnvSettings().CLASSIFY_MAX_WORKERS, len(results)))
 
     try:
-        for row in results:
-            id = row["id"]
-            file_name = row["file_name"]
-            link = row["link"]
-
-            # Use the temporary directory instead of DOWNLOADS_DIR
-            temp_file_path = os.path.join(temp_dir, file_name)
-
-            try:
-                minio_client = get_minio_client()
-                # Download the file from MinIO to temp directory
-                minio_client.fget_object(
-                    bucket_name=MINIO_BUCKET,
-                    object_name=os.path.basename(link),
-                    file_path=temp_file_path,  # Use temp directory path
-                )
-                logger.debug(f"Downloaded {file_name} to {temp_dir}")
-                downloaded_files.append(temp_file_path)
-
-                # Get file extension to determine how to process it
-                file_ext = os.path.splitext(file_name)[1].lower()
-
-                # Process based on file type
-                if file_ext == '.pdf':
-                    # Classify text or image PDF
-                    is_image_based = is_image_document(temp_file_path)
-                    if is_image_based:
-                        logger.info(
-                            f"File {file_name} is an image document, converting to text.")
-                        classify_type = "IMAGE"
-
-                        # Convert image-based PDF to text
-                        extracted_text = convert_pdf_to_text(
-                            temp_file_path)
-                    else:
-                        # Handle text-based PDF
-                        logger.info(
-                            f"File {file_name} is a text PDF, proceeding with classification.")
-                        # classify_type = "TEXT"
-                        classify_type = "IMAGE"
-
-                        # Extract text from text-based PDF
-                        extracted_text = pymupdf4llm.to_markdown(
-                            temp_file_path)
-
-                elif file_ext == '.docx':
-                    # Handle DOCX file
-                    logger.info(f"Processing DOCX file: {file_name}")
-                    classify_type = "DOCX"
-
-                    # Extract text from DOCX file
-                    extracted_text = extract_text_from_docx(temp_file_path)
-                    """ elif file_ext == '.doc':
-                        # Handle DOC file by converting to DOCX first
-                        logger.info(f"Processing DOC file: {file_name}")
-                        classify_type = "DOC"
-
-                        # Convert to DOCX
-                        docx_path = convert_doc_to_docx(temp_file_path)
-                        if docx_path:
-                            # Extract text from converted DOCX file
-                            extracted_text = extract_text_from_docx(docx_path)
-                        else:
-                            logger.warning(
-                                f"Could not convert DOC file: {file_name}")
-                            executeSQL("UPDATE email_contents SET type = 'UNKNOWN', status = 'XU_LY_LOI', classify_type = 'DOC' WHERE id = %s",
-                                    (id,))
-                            continue """
-                else:
-                    logger.warning(
-                        f"Unsupported file format: {file_ext} for file {file_name}")
-                    executeSQL("UPDATE email_contents SET type = 'UNKNOWN', status = 'XU_LY_LOI', classify_type = 'UNKNOWN' WHERE id = %s",
-                               (id,))
-                    continue
-
-                # Check if we have extracted text
-                if not extracted_text:
-                    logger.warning(
-                        f"Could not extract text from file: {file_name}")
-                    # Update status in database
-                    executeSQL("UPDATE email_contents SET type = 'UNKNOWN', status = 'XU_LY_LOI', classify_type = %s WHERE id = %s",
-                               (classify_type, id))
-                    continue
-
-                # For image PDFs and DOCX files, save the extracted text to a markdown file
-                if classify_type in ["IMAGE", "DOCX"]:
-                    # Save extracted text to a temporary file
-                    markdown_filename = f"{os.path.splitext(file_name)[0]}_{uuid.uuid4().hex[:8]}.md"
-                    markdown_path = os.path.join(temp_dir, markdown_filename)
-                    with open(markdown_path, "w", encoding="utf-8") as f:
-                        f.write(extracted_text)
-
-                    # Upload markdown to MinIO
-                    uploaded_files = upload_to_minio(
-                        file_paths=markdown_path,
-                        bucket_name="markdown",  # Use a separate bucket for markdown files
-                        minio_endpoint=f"http://{EnvSettings().MINIO_API_ENDPOINT}",
-                        access_key=EnvSettings().MINIO_ACCESS_KEY,
-                        secret_key=EnvSettings().MINIO_SECRET_KEY,
-                    )
-
-                    if uploaded_files:
-                        markdown_link = uploaded_files[0]
-                        logger.info(
-                            f"Uploaded extracted text to MinIO: {markdown_link}")
-
-                        # Classify the document type based on extracted text
-                        doc_type, status = classify_document_from_text(
-                            extracted_text, file_name)
-
-                        # Update database with markdown link and classification
-                        executeSQL("UPDATE email_contents SET type = %s, status = %s, classify_type = %s, markdown_link = %s WHERE id = %s",
-                                   (doc_type, status, classify_type, markdown_link, id))
-
-                        if doc_type != "unknown":
-                            files_object.append({
-                                "email_content_id": id,
-                                "bucket": link.split("/")[0], "file_name": file_name, "file_type": doc_type,
-                                "file_path": link, "classify_type": classify_type,
-                                "markdown_link": markdown_link
-                            })
-                    else:
-                        logger.error(
-                            f"Failed to upload extracted text to MinIO for {file_name}")
-                else:
-                    # For text PDFs, just update classification
-                    doc_type, status = classify_document_from_text(
-                        extracted_text, file_name)
-
-                    # Update back to database with classification result
-                    executeSQL("UPDATE email_contents SET type = %s, status = %s, classify_type = %s WHERE id = %s",
-                               (doc_type, status, classify_type, id))
-
-                    if doc_type != "unknown":
-                        files_object.append({
-                            "email_content_id": id,
-                            "bucket": link.split("/")[0], "file_name": file_name, "file_type": doc_type,
-                            "file_path": link, "classify_type": classify_type,
-                            "markdown_link": ""
-                        })
-            except S3Error as e:
-                error_msg = f"Error downloading file {file_name}: {str(e)}"
-                logger.error(error_msg)
-                errors.append(error_msg)
-            except Exception as e:
-                error_msg = f"Unexpected error processing {file_name}: {str(e)}"
-                logger.error(error_msg)
-                errors.append(error_msg)
+        # Một client MinIO dùng chung cho mọi worker (client thread-safe);
+        # tạo trong try để temp_dir vẫn được dọn nếu không tạo được client
+        minio_client = get_minio_client()
+        # Mỗi file chạy trọn pipeline (tải, phân loại nhanh, chuyển đổi, upload) trong một worker
+        with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(_process_file, row, temp_dir, minio_client)
+                for row in results
+            ]
+            # Duyệt theo thứ tự file ban đầu để files_object giữ nguyên thứ tự
+            for row, future in zip(results, futures):
+                file_name = row["file_name"]
+                try:
+                    status_update, file_object = future.result()
+                    if status_update:
+                        status_updates.append(status_update)
+                    if file_object:
+                        files_object.append(file_object)
+                except S3Error as e:
+                    error_msg = f"Error downloading file {file_name}: {str(e)}"
+                    logger.error(error_msg)
+                    errors.append(error_msg)
+                except Exception as e:
+                    error_msg = f"Unexpected error processing {file_name}: {str(e)}"
+                    logger.error(error_msg)
+                    errors.append(error_msg)
+
+        if status_updates:
+            executeManySQL(
+                "UPDATE email_contents SET type = %s, status = %s, classify_type = %s, "
+                "markdown_link = COALESCE(%s, markdown_link) WHERE id = %s",
+                status_updates)
+        logger.info(
+            f"Classified {len(files_object)}/{len(results)} files for hs_id {hs_id} "
+            f"with {max_workers} workers")
 
         # Check if we have any successfully classified files
         if not files_object:
@@ -224,16 +163,16 @@ def classify(hs_id: str, email: str):
 
         # If no HSMT files found, return an error
         if not has_hsmt:
-            inserted_step_exception_classify = insertHistorySQL(
+            step_exception_classify = PipelineStep(
                 hs_id=hs_id, step="SENT_EMAIL_EXCEPTION")
-            if not inserted_step_exception_classify:
+            if not step_exception_classify.history_id:
                 print(
                     "Không insert được trạng thái 'SENT_EMAIL_EXCEPTION' vào history với hs_id: %s", hs_id)
             sql = "UPDATE email_contents SET end_process_date = now() AT TIME ZONE 'UTC' WHERE hs_id=%s"
             params = (hs_id,)
             postgre.executeSQL(sql, params)
             # Update History End Date SQL
-            postgre.updateHistoryEndDateSQL(inserted_step_exception_classify)
+            step_exception_classify.finish()
             return {"status": "error", "message": "Không có file Hồ sơ mời thầu trong bộ file được tải lên!"}
 
         logger.debug(f"Files object: {files_object}")
@@ -258,6 +197,254 @@ def classify(hs_id: str, email: str):
                 f"Failed to remove temporary directory {temp_dir}: {str(e)}")
 
 
+def _file_name_in_scope(file_name: str) -> bool:
+    name = unicodedata.normalize("NFC", os.path.splitext(file_name)[0]).lower()
+    return bool(IN_SCOPE_FILE_NAME_PATTERN.search(re.sub(r"[_\-.]+", " ", name)))
+
+
+def _read_text_layer(pdf_path: str, max_pages: Optional[int] = None) -> str:
+    """Text layer có sẵn của PDF (không OCR, không phân tích layout)."""
+    with fitz.open(pdf_path) as pdf_document:
+        total_pages = len(pdf_document)
+        if max_pages:
+            total_pages = min(total_pages, max_pages)
+        text = "\n".join(pdf_document[i].get_text() for i in range(total_pages))
+    return unicodedata.normalize("NFC", text)
+
+
+def _judge_sample(text: str):
+    """Trả về (in_scope, sample_type, reason) cho văn bản mẫu."""
+    sample_type, _ = classify_document_from_text(text or "")
+    if sample_type != "unknown":
+        return True, sample_type, "sample_type"
+    if text and IN_SCOPE_TEXT_PATTERN.search(text.lower()):
+        return True, sample_type, "sample_keywords"
+    return False, sample_type, "no_signal"
+
+
+def triage_document(file_path: str, file_name: str) -> SampleTriage:
+    """
+    Phân loại nhanh một file trước khi chuyển đổi toàn bộ.
+
+    PDF text: đọc text layer vài trang đầu (vài ms); nếu chưa thấy dấu hiệu thì
+    đọc hết text layer trước khi loại. PDF ảnh: tên file, rồi OCR vài trang đầu
+    (text mẫu được giữ lại để không OCR lại các trang này khi chuyển đổi).
+    DOCX luôn được chuyển đổi (đã rẻ). Loại tài liệu cuối cùng vẫn được xác định
+    trên toàn văn sau khi chuyển đổi.
+    """
+    start = time.perf_counter()
+    settings = EnvSettings()
+    file_ext = os.path.splitext(file_name)[1].lower()
+    is_image_based = False
+
+    if file_ext == '.docx':
+        triage = SampleTriage(True, "unknown", "DOCX", False, "docx")
+    elif file_ext != '.pdf':
+        logger.warning(
+            f"Unsupported file format: {file_ext} for file {file_name}")
+        triage = SampleTriage(False, "unknown", "UNKNOWN", False, "unsupported_format")
+    else:
+        # Cả PDF text và PDF ảnh đều được lưu markdown (classify_type IMAGE)
+        is_image_based = is_image_document(file_path)
+        sample, sample_pages = "", 0
+        if not settings.CLASSIFY_SAMPLE_FIRST:
+            in_scope, sample_type, reason = True, "unknown", "disabled"
+        elif is_image_based:
+            if _file_name_in_scope(file_name):
+                # Tên file đã cho thấy thuộc phạm vi: không tốn OCR cho mẫu
+                in_scope, sample_type, reason = True, "unknown", "file_name"
+            else:
+                sample_pages = settings.CLASSIFY_SAMPLE_OCR_PAGES
+                sample = convert_pdf_to_text(file_path, max_pages=sample_pages)
+                in_scope, sample_type, reason = _judge_sample(
+                    unicodedata.normalize("NFC", sample))
+        else:
+            in_scope, sample_type, reason = _judge_sample(
+                _read_text_layer(file_path, settings.CLASSIFY_SAMPLE_PAGES))
+            if not in_scope and _file_name_in_scope(file_name):
+                in_scope, reason = True, "file_name"
+            if not in_scope:
+                # Text layer rất rẻ: đọc hết trước khi loại để không bỏ sót
+                in_scope, sample_type, reason = _judge_sample(
+                    _read_text_layer(file_path))
+        triage = SampleTriage(in_scope, sample_type, "IMAGE", is_image_based, reason, sample, sample_pages)
+
+    decision = "convert" if triage.in_scope else "reject"
+    CLASSIFY_TRIAGE_DECISIONS.labels(decision=decision, reason=triage.reason).inc()
+    logger.info(
+        f"Triage {file_name}: {decision} (reason={triage.reason}, sample_type={triage.sample_type}, "
+        f"image={is_image_based}) in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return triage
+
+
+def _process_file(row: dict, temp_dir: str, minio_client) -> Tuple[Optional[tuple], Optional[dict]]:
+    """
+    Tải một file từ MinIO, phân loại nhanh và chuyển đổi nếu thuộc phạm vi.
+
+    Returns:
+        tuple: (tham số UPDATE email_contents, phần tử ``files_object`` hoặc None).
+    """
+    id = row["id"]
+    file_name = row["file_name"]
+    link = row["link"]
+
+    # Mỗi file một thư mục con theo id: các file chạy song song có thể trùng file_name
+    temp_dir = os.path.join(temp_dir, str(id))
+    os.makedirs(temp_dir, exist_ok=True)
+    temp_file_path = os.path.join(temp_dir, file_name)
+
+    # Download the file from MinIO to temp directory
+    with observe_object_store("download", MINIO_BUCKET) as transfer:
+        minio_client.fget_object(
+            bucket_name=MINIO_BUCKET,
+            object_name=os.path.basename(link),
+            file_path=temp_file_path,  # Use temp directory path
+        )
+        transfer.bytes = os.path.getsize(temp_file_path)
+    logger.debug(f"Downloaded {file_name} to {temp_dir}")
+
+    # File đã chuyển đổi trong một hồ sơ trước (gửi lại): dùng lại markdown và loại tài liệu
+    source_hash = dossier_fingerprint.hash_file(temp_file_path)
+    converted = dossier_fingerprint.find_converted(source_hash)
+    if converted:
+        logger.info(f"File {file_name} already converted (email_content {converted['email_content_id']}), "
+                    f"reusing {converted['markdown_link']}")
+        dossier_fingerprint.reuse_converted(id, converted)
+        return _classification_result(
+            id, file_name, link, converted["file_type"], converted["status"], converted["classify_type"],
+            converted["markdown_link"])
+
+    triage = triage_document(temp_file_path, file_name)
+    if not triage.in_scope:
+        return ("UNKNOWN", "XU_LY_LOI", triage.classify_type, None, id), None
+
+    return _convert_and_classify(ConversionJob(
+        email_content_id=id, file_name=file_name, link=link,
+        file_path=temp_file_path, triage=triage, source_hash=source_hash), temp_dir)
+
+
+def _get_conversion_pool() -> Optional[ProcessPoolExecutor]:
+    """Process pool dùng chung cho bước chuyển đổi nặng CPU (tạo một lần cho mỗi consumer)."""
+    global _conversion_pool
+    max_processes = EnvSettings().CLASSIFY_MAX_PROCESSES
+    if max_processes <= 0:
+        return None
+    with _conversion_pool_lock:
+        if _conversion_pool is None:
+            # spawn: consumer đang giữ kết nối RabbitMQ/DB và nhiều thread, không fork
+            _conversion_pool = ProcessPoolExecutor(
+                max_workers=max_processes, mp_context=multiprocessing.get_context("spawn"))
+        return _conversion_pool
+
+
+def _pdf_to_markdown(pdf_path: str, pages: Optional[List[int]] = None) -> str:
+    """``pymupdf4llm.to_markdown`` trong process pool, chạy tại chỗ nếu pool không dùng được."""
+    global _conversion_pool
+    pool = _get_conversion_pool()
+    if pool is None:
+        return pymupdf4llm.to_markdown(pdf_path, pages=pages)
+    try:
+        return pool.submit(pymupdf4llm.to_markdown, pdf_path, pages=pages).result()
+    except BrokenProcessPool as e:
+        logger.warning(f"Conversion process pool broken ({e}), converting {pdf_path} in-process")
+        with _conversion_pool_lock:
+            _conversion_pool = None
+        return pymupdf4llm.to_markdown(pdf_path, pages=pages)
+
+
+def _convert_and_classify(job: ConversionJob, temp_dir: str) -> Tuple[Optional[tuple], Optional[dict]]:
+    """
+    Chuyển đổi toàn bộ một file, upload markdown lên MinIO và phân loại trên
+    toàn văn.
+
+    Returns:
+        tuple: (tham số UPDATE email_contents, phần tử ``files_object`` hoặc None).
+    """
+    id, file_name, link = job.email_content_id, job.file_name, job.link
+    classify_type = job.triage.classify_type
+
+    if classify_type == "DOCX":
+        logger.info(f"Processing DOCX file: {file_name}")
+        extracted_text = extract_text_from_docx(job.file_path)
+    elif job.triage.is_image_based:
+        logger.info(
+            f"File {file_name} is an image document, converting to text.")
+        # Các trang đầu đã OCR khi phân loại nhanh: chỉ chuyển đổi phần còn lại rồi ghép vào sau mẫu
+        first_page = job.triage.sample_pages
+        if distributed_ocr.should_distribute(job.file_path):
+            # File lớn: chia theo khoảng trang cho các worker OCR qua queue
+            rest = distributed_ocr.convert_pdf(
+                job.file_path, MINIO_BUCKET, os.path.basename(link), document_name=file_name,
+                first_page=first_page)
+        else:
+            # Mỗi trang đi qua text layer, Tesseract hoặc Gemini tùy chất lượng trang
+            with fitz.open(job.file_path) as pdf_document:
+                total_pages = len(pdf_document)
+            rest = ""
+            if first_page < total_pages:
+                rest = hybrid_ocr.convert_pdf(
+                    job.file_path, document_name=file_name, pages=range(first_page, total_pages)).text
+        extracted_text = "\n\n".join(part for part in (job.triage.sample_text, rest) if part)
+    else:
+        logger.info(
+            f"File {file_name} is a text PDF, proceeding with classification.")
+        extracted_text = _pdf_to_markdown(job.file_path)
+
+    # Chuẩn hóa markdown (bỏ header/footer lặp, số trang, khoảng trắng) trước khi upload
+    if extracted_text:
+        extracted_text = normalize_markdown(extracted_text, file_name).text
+
+    # Check if we have extracted text
+    if not extracted_text:
+        logger.warning(
+            f"Could not extract text from file: {file_name}")
+        return ("UNKNOWN", "XU_LY_LOI", classify_type, None, id), None
+
+    # Save extracted text to a temporary markdown file
+    markdown_filename = f"{os.path.splitext(file_name)[0]}_{uuid.uuid4().hex[:8]}.md"
+    markdown_path = os.path.join(temp_dir, markdown_filename)
+    with open(markdown_path, "w", encoding="utf-8") as f:
+        f.write(extracted_text)
+
+    # Upload markdown to MinIO
+    uploaded_files = upload_to_minio(
+        file_paths=markdown_path,
+        bucket_name="markdown",  # Use a separate bucket for markdown files
+        minio_endpoint=f"http://{EnvSettings().MINIO_API_ENDPOINT}",
+        access_key=EnvSettings().MINIO_ACCESS_KEY,
+        secret_key=EnvSettings().MINIO_SECRET_KEY,
+    )
+    if not uploaded_files:
+        logger.error(
+            f"Failed to upload extracted text to MinIO for {file_name}")
+        return None, None
+
+    markdown_link = uploaded_files[0]
+    logger.info(f"Uploaded extracted text to MinIO: {markdown_link}")
+
+    # Classify the document type based on extracted text
+    doc_type, status = classify_document_from_text(extracted_text, file_name)
+
+    if doc_type != "unknown" and job.source_hash and dossier_fingerprint.enabled():
+        dossier_fingerprint.record_file(
+            id, doc_type, status, classify_type, markdown_link,
+            dossier_fingerprint.fingerprint_markdown(job.source_hash, extracted_text))
+    return _classification_result(id, file_name, link, doc_type, status, classify_type, markdown_link)
+
+
+def _classification_result(id, file_name: str, link: str, doc_type: str, status: str, classify_type: str,
+                           markdown_link: str) -> Tuple[tuple, Optional[dict]]:
+    status_update = (doc_type, status, classify_type, markdown_link, id)
+    if doc_type == "unknown":
+        return status_update, None
+    return status_update, {
+        "email_content_id": id,
+        "bucket": link.split("/")[0], "file_name": file_name, "file_type": doc_type,
+        "file_path": link, "classify_type": classify_type,
+        "markdown_link": markdown_link
+    }
+
+
 def is_image_document(file_path, text_threshold=100, image_coverage_threshold=0.3):
     """
     Determines if a document (PDF or DOCX) is primarily image-based or text-based.
@@ -281,50 +468,82 @@ def is_image_document(file_path, text_threshold=100, image_coverage_threshold=0.
         return False  # Default to text-based for unsupported formats
 
 
-def _analyze_pdf(pdf_path, text_threshold=100, image_coverage_threshold=0.3):
-    """Helper function to analyze PDF files"""
-    try:
-        pdf_document = fitz.open(pdf_path)
-        total_pages = len(pdf_document)
-        image_pages = 0
-
-        for page_num in range(total_pages):
-            page = pdf_document[page_num]
+class PdfPageAnalysis(NamedTuple):
+    is_image_based: bool
+    total_pages: int
+    # Số trang (0-based) -> "image" / "text", chỉ gồm các trang đã xét
+    page_kinds: Dict[int, str]
+    decided_early: bool
 
-            # Get text content
-            text = page.get_text()
-            text_length = len(text.strip())
+    @property
+    def image_pages(self) -> List[int]:
+        return sorted(p for p, kind in self.page_kinds.items() if kind == "image")
 
-            # Get images on the page
-            image_list = page.get_images(full=True)
+    @property
+    def text_pages(self) -> List[int]:
+        return sorted(p for p, kind in self.page_kinds.items() if kind == "text")
 
-            # Calculate page area
-            page_area = page.rect.width * page.rect.height
 
-            # Calculate area covered by images
-            images_area = 0
-            for img_idx, img in enumerate(image_list):
-                xref = img[0]
-                image_rect = page.get_image_bbox(img)
-                if image_rect:
-                    images_area += image_rect.width * image_rect.height
+def _majority_settled(image_pages: int, examined: int, total_pages: int) -> bool:
+    """
+    Luật dừng tuần tự cho quyết định "hơn nửa số trang là trang ảnh".
 
-            # Calculate image coverage ratio
-            image_coverage = images_area / page_area if page_area > 0 else 0
+    Dừng khi phần còn lại không thể đổi kết quả, hoặc khi khoảng tin cậy
+    Hoeffding (hiệu chỉnh quần thể hữu hạn) của tỷ lệ trang ảnh không chứa 0.5.
+    """
+    if image_pages > total_pages / 2 or examined - image_pages >= total_pages / 2:
+        return True
+    if examined < PDF_ANALYSIS_MIN_PAGES or examined >= total_pages:
+        return examined >= total_pages
+    ratio = image_pages / examined
+    finite_population = math.sqrt((total_pages - examined) / (total_pages - 1))
+    radius = math.sqrt(math.log(2 / PDF_ANALYSIS_DELTA) / (2 * examined)) * finite_population
+    return abs(ratio - 0.5) > radius
+
+
+def analyze_pdf_pages(pdf_path, text_threshold=100, image_coverage_threshold=0.3,
+                      early_stop=True) -> PdfPageAnalysis:
+    """
+    Classify the pages of a PDF as image or text pages.
 
-            # Determine if this page is image-based
-            if text_length < text_threshold or image_coverage > image_coverage_threshold:
-                image_pages += 1
+    Pages are visited in a fixed pseudo-random order so that the first pages
+    examined are spread over the whole document. With ``early_stop`` the walk
+    stops as soon as the majority verdict is statistically settled; otherwise
+    every page is classified (used to route only image pages to OCR).
+    """
+    with fitz.open(pdf_path) as pdf_document:
+        total_pages = len(pdf_document)
+        if total_pages == 0:
+            return PdfPageAnalysis(False, 0, {}, False)
+        order = random.Random(total_pages).sample(range(total_pages), total_pages)
+        page_kinds = {}
+        image_pages = 0
+        for page_num in order:
+            kind = classify_pdf_page(pdf_document[page_num], text_threshold, image_coverage_threshold)
+            page_kinds[page_num] = kind
+            image_pages += kind == "image"
+            if early_stop and _majority_settled(image_pages, len(page_kinds), total_pages):
+                break
+    examined = len(page_kinds)
+    return PdfPageAnalysis(
+        is_image_based=image_pages / examined > 0.5,
+        total_pages=total_pages,
+        page_kinds=page_kinds,
+        decided_early=examined < total_pages,
+    )
 
-        # If more than half the pages are image-based, consider the whole document image-based
-        return image_pages / total_pages > 0.5
 
+def _analyze_pdf(pdf_path, text_threshold=100, image_coverage_threshold=0.3):
+    """Helper function to analyze PDF files"""
+    try:
+        analysis = analyze_pdf_pages(pdf_path, text_threshold, image_coverage_threshold)
+        logger.debug(
+            f"Analyzed {len(analysis.page_kinds)}/{analysis.total_pages} pages of {pdf_path}: "
+            f"{len(analysis.image_pages)} image pages, image_based={analysis.is_image_based}")
+        return analysis.is_image_based
     except Exception as e:
         logger.error(f"Error analyzing PDF: {str(e)}")
         return False
-    finally:
-        if 'pdf_document' in locals():
-            pdf_document.close()
 
 
 def _analyze_docx(docx_path, text_threshold=100):
@@ -372,58 +591,17 @@ def classify_document_from_text(text, file_name=None):
                and status is either 'CHUA_XU_LY' or 'XU_LY_LOI'
     """
     try:
-        # Extract key information for classification
-        text_lower = text.lower()
-
-        # Determine document type using match-case statement
-        doc_type = None
+        # Xét toàn văn, dừng ở luật đầu tiên thỏa mãn
+        doc_type = document_type(text)
         status = "CHUA_XU_LY"
-
-        match True:
-            case _ if "tiêu chuẩn đánh giá về kỹ thuật" in text_lower and "chỉ dẫn nhà thầu" not in text_lower:
-                # This is a case for TCDGKT documents
-                doc_type = "TCDGKT"
-                if file_name:
-                    logger.info(f"Classified {file_name} as TCDGKT")
-            # HSMT must contain specific section identifiers beyond just the title
-            case _ if "hồ sơ mời thầu" in text_lower and any(keyword in text_lower for keyword in
-                                                             ["chỉ dẫn nhà thầu", "chỉ dẫn đối với nhà thầu", "bảng dữ liệu đấu thầu", "phần 1:", "phần 2:"]):
-                doc_type = "HSMT"
-                if file_name:
-                    logger.info(f"Classified {file_name} as HSMT")
-
-            # TBMT must have clear invitation wording and typically includes dates or bid details
-            case _ if "thông báo mời thầu" in text_lower and (
-                # New criteria based on sample TBMT
-                any(keyword in text_lower for keyword in ["gói thầu", "đóng thầu", "mở thầu",
-                                                          "ngày tháng năm", "đấu thầu", "giá dự toán",
-                                                          "địa điểm phát hành", "địa điểm nộp",
-                                                          "bảo đảm dự thầu", "thời gian thực hiện"]) or
-                # Regex patterns for dates and times often found in TBMT
-                re.search(r"\d{1,2}[/-]\d{1,2}[/-]\d{2,4}", text_lower) or
-                re.search(r"\d{1,2}:\d{2}", text_lower)
-            ):
-                doc_type = "TBMT"
-                if file_name:
-                    logger.info(f"Classified {file_name} as TBMT")
-
-            # HSKT must be a complete technical specification document, not just a section mentioning technical aspects
-            case _ if (re.search(r"hồ\s+sơ\s+k[ỹy]\s*thu[ậa]t", text_lower) or
-                      re.search(r"yêu\s+cầu\s+k[ỹy]\s*thu[ậa]t\s+chi\s+tiết", text_lower) or
-                      re.search(r"thuyết\s+minh\s+k[ỹy]\s*thu[ậa]t", text_lower) or
-                      re.search(r"k[ỹy]\s*thu[ậa]t", text_lower) or
-                      re.search(r"yêu\s+cầu\s+về\s+k[ỹy]\s*thu[ậa]t", text_lower)) and "tiêu chuẩn đánh giá" not in text_lower:
-                doc_type = "HSKT"
-                if file_name:
-                    logger.info(f"Classified {file_name} as HSKT")
-
-            case _:
-                doc_type = "unknown"
-                status = "XU_LY_LOI"
-                if file_name:
-                    logger.warning(
-                        f"Could not classify {file_name}, marked as UNKNOWN")
-
+        if doc_type == "unknown":
+            status = "XU_LY_LOI"
+            if file_name:
+                logger.warning(
+                    f"Could not classify {file_name}, marked as UNKNOWN")
+
+        if file_name and doc_type != "unknown":
+            logger.info(f"Classified {file_name} as {doc_type}")
         return doc_type, status
     except Exception as e:
         logger.error(f"Error classifying document from text: {str(e)}")
@@ -0,0 +1,275 @@
+"""
+Map-reduce OCR of large image PDFs over the message queue.
+
+The classifier (coordinator) splits a large scanned PDF into page ranges of
+``OCR_PAGES_PER_JOB`` pages and publishes one message per range to
+``RABBIT_MQ_OCR_QUEUE``. The PDF itself is not copied: every message points
+at the source object already in MinIO plus a ``page_range``. Workers
+(``app.ocr_sub``) OCR their range with ``hybrid_ocr`` and write the partial
+markdown to ``OCR_PARTS_BUCKET`` as ``<job_id>/<part>.md``.
+
+The coordinator polls for the parts and assembles them in page order. A
+part not back after ``OCR_PART_TIMEOUT`` seconds is published again (a
+worker may have died or be stuck; a part is acked only once it is stored). Parts still missing at
+``OCR_JOB_TIMEOUT`` are OCR'd locally so the document always completes.
+When the OCR queue has no consumer (no worker running, or all of them gone
+mid-job) the missing parts are OCR'd locally at once instead of waiting.
+
+Parts are removed once assembled; a part written later by a redispatched
+worker is expired by the lifecycle rule of ``OCR_PARTS_BUCKET``
+(``OCR_PARTS_EXPIRY_DAYS``).
+"""
+import io
+import json
+import math
+import time
+import uuid
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import fitz
+from minio.commonconfig import ENABLED, Filter
+from minio.error import S3Error
+from minio.lifecycleconfig import Expiration, LifecycleConfig, Rule
+from pika.exceptions import AMQPError, ChannelClosedByBroker
+
+from app.config.env import EnvSettings
+from app.mq.rabbit_mq import RabbitMQClient
+from app.utils import hybrid_ocr
+from app.utils.download_file_minio import get_minio_client
+from app.utils.logger import get_logger
+from app.utils.metrics import OCR_DISTRIBUTED_PARTS, observe_object_store
+
+logger = get_logger(__name__)
+
+# Chu kỳ kiểm tra các phần đã xong (giây)
+POLL_INTERVAL = 2.0
+# Số lần gửi lại tối đa cho một phần trước khi chờ đến hết OCR_JOB_TIMEOUT
+MAX_REDISPATCH = 2
+PARTS_EXPIRY_RULE_ID = "expire-ocr-parts"
+
+
+class OCRPartJob(NamedTuple):
+    job_id: str
+    part: int
+    bucket: str
+    object_name: str
+    page_range: Tuple[int, int]  # 0-based, [start, end)
+    document_name: str
+    attempt: int = 0
+
+    @property
+    def part_key(self) -> str:
+        return part_key(self.job_id, self.part)
+
+    def to_message(self) -> dict:
+        return self._asdict() | {"page_range": list(self.page_range)}
+
+    @classmethod
+    def from_message(cls, message: dict) -> "OCRPartJob":
+        fields = {name: message[name] for name in cls._fields if name in message}
+        fields["page_range"] = tuple(fields["page_range"])
+        return cls(**fields)
+
+
+def part_key(job_id: str, part: int) -> str:
+    return f"{job_id}/{part:05d}.md"
+
+
+def page_ranges(total_pages: int, pages_per_job: int) -> List[Tuple[int, int]]:
+    """Chia đều trang cho các phần, mỗi phần không quá ``pages_per_job`` trang."""
+    parts = max(1, math.ceil(total_pages / max(1, pages_per_job)))
+    size, extra = divmod(total_pages, parts)
+    ranges, start = [], 0
+    for part in range(parts):
+        end = start + size + (1 if part < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def should_distribute(pdf_path: str) -> bool:
+    settings = EnvSettings()
+    if not settings.RABBIT_MQ_OCR_QUEUE:
+        return False
+    with fitz.open(pdf_path) as pdf_document:
+        return len(pdf_document) >= settings.OCR_DISTRIBUTED_MIN_PAGES
+
+
+def ensure_parts_bucket(minio_client, bucket: str, expiry_days: int):
+    """Create the parts bucket if needed, with a rule expiring parts left behind after ``expiry_days``."""
+    if not minio_client.bucket_exists(bucket):
+        minio_client.make_bucket(bucket)
+    try:
+        lifecycle = minio_client.get_bucket_lifecycle(bucket)
+        if lifecycle is not None and any(rule.rule_id == PARTS_EXPIRY_RULE_ID for rule in lifecycle.rules):
+            return
+        minio_client.set_bucket_lifecycle(bucket, LifecycleConfig([
+            Rule(ENABLED, rule_filter=Filter(prefix=""), rule_id=PARTS_EXPIRY_RULE_ID,
+                 expiration=Expiration(days=expiry_days)),
+        ]))
+    except S3Error as e:
+        logger.warning(f"Could not set the lifecycle rule of bucket {bucket}: {e}")
+
+
+def _consumer_count(publisher: RabbitMQClient, queue: str) -> Optional[int]:
+    """Số consumer của ``queue`` (0 nếu queue chưa tồn tại); None nếu không hỏi được broker."""
+    try:
+        return publisher.channel.queue_declare(queue=queue, passive=True).method.consumer_count
+    except ChannelClosedByBroker:
+        # Khai báo passive với queue chưa tồn tại: broker đóng channel
+        publisher.channel = publisher.connection.channel()
+        return 0
+    except AMQPError as e:
+        logger.warning(f"Could not read the consumer count of {queue}: {e}")
+        return None
+
+
+def write_part(minio_client, bucket: str, key: str, text: str):
+    data = text.encode("utf-8")
+    with observe_object_store("upload", bucket) as transfer:
+        minio_client.put_object(bucket, key, io.BytesIO(data), len(data), content_type="text/markdown")
+        transfer.bytes = len(data)
+
+
+def _read_part(minio_client, bucket: str, key: str) -> Optional[str]:
+    try:
+        with observe_object_store("download", bucket) as transfer:
+            response = minio_client.get_object(bucket, key)
+            try:
+                data = response.read()
+            finally:
+                response.close()
+                response.release_conn()
+            transfer.bytes = len(data)
+    except S3Error as e:
+        if e.code == "NoSuchKey":
+            return None
+        raise
+    return data.decode("utf-8")
+
+
+def _remove_parts(minio_client, bucket: str, jobs: List[OCRPartJob]):
+    for job in jobs:
+        try:
+            minio_client.remove_object(bucket, job.part_key)
+        except S3Error as e:
+            logger.warning(f"Could not remove OCR part {job.part_key}: {e}")
+
+
+def _wait(publisher: RabbitMQClient, seconds: float):
+    """Chờ giữa hai lần kiểm tra; ``BlockingConnection.sleep`` vẫn trả lời heartbeat."""
+    try:
+        publisher.connection.sleep(seconds)
+    except AMQPError:
+        time.sleep(seconds)
+
+
+def convert_pdf(pdf_path: str, bucket: str, object_name: str, document_name: str = "",
+                first_page: int = 0) -> str:
+    """
+    OCR a large PDF across the OCR workers and return the merged markdown.
+
+    Args:
+        pdf_path: Local copy of the PDF (page count, local fallback).
+        bucket: MinIO bucket of the source PDF.
+        object_name: Object name of the source PDF, read by the workers.
+        document_name: Used in logs.
+        first_page: Skip the pages before this 0-based page (already OCR'd by the caller).
+
+    Returns:
+        str: Markdown of the pages from ``first_page`` on, in page order.
+    """
+    settings = EnvSettings()
+    with fitz.open(pdf_path) as pdf_document:
+        total_pages = len(pdf_document) - first_page
+    if total_pages <= 0:
+        return ""
+    job_id = uuid.uuid4().hex
+    jobs = [
+        OCRPartJob(job_id, part, bucket, object_name, (first_page + start, first_page + end), document_name)
+        for part, (start, end) in enumerate(page_ranges(total_pages, settings.OCR_PAGES_PER_JOB))
+    ]
+    parts_bucket = settings.OCR_PARTS_BUCKET
+    minio_client = get_minio_client()
+    ensure_parts_bucket(minio_client, parts_bucket, settings.OCR_PARTS_EXPIRY_DAYS)
+
+    # Kết nối riêng cho mỗi job: pika BlockingConnection không dùng chung được giữa các thread
+    publisher = RabbitMQClient(
+        host=settings.RABBIT_MQ_HOST,
+        port=settings.RABBIT_MQ_PORT,
+        user=settings.RABBIT_MQ_USER,
+        password=settings.RABBIT_MQ_PASS,
+    )
+    start = time.monotonic()
+    texts: Dict[int, str] = {}
+    # Không có worker OCR: OCR cục bộ ngay, không chờ đến OCR_JOB_TIMEOUT
+    no_consumer = False
+    try:
+        no_consumer = _consumer_count(publisher, settings.RABBIT_MQ_OCR_QUEUE) == 0
+        dispatched_at = {}
+        if not no_consumer:
+            for job in jobs:
+                publisher.publish(settings.RABBIT_MQ_OCR_QUEUE, job.to_message())
+                dispatched_at[job.part] = start
+            logger.info(f"OCR job {job_id} ({document_name}): {total_pages} pages in {len(jobs)} parts dispatched")
+
+        while not no_consumer and len(texts) < len(jobs) and time.monotonic() - start < settings.OCR_JOB_TIMEOUT:
+            for i, job in enumerate(jobs):
+                if job.part in texts:
+                    continue
+                text = _read_part(minio_client, parts_bucket, job.part_key)
+                if text is not None:
+                    texts[job.part] = text
+                    OCR_DISTRIBUTED_PARTS.labels(outcome="completed").inc()
+                elif time.monotonic() - dispatched_at[job.part] > settings.OCR_PART_TIMEOUT \
+                        and job.attempt < MAX_REDISPATCH:
+                    # Phần chậm: gửi lại, worker nào xong trước thì ghi (ghi đè cùng nội dung)
+                    jobs[i] = job = job._replace(attempt=job.attempt + 1)
+                    publisher.publish(settings.RABBIT_MQ_OCR_QUEUE, job.to_message())
+                    dispatched_at[job.part] = time.monotonic()
+                    OCR_DISTRIBUTED_PARTS.labels(outcome="redispatched").inc()
+                    logger.warning(f"OCR job {job_id}: part {job.part} {job.page_range} redispatched "
+                                   f"(attempt {job.attempt})")
+            if len(texts) < len(jobs):
+                # Mọi worker đã dừng giữa chừng: các phần còn thiếu OCR cục bộ
+                no_consumer = _consumer_count(publisher, settings.RABBIT_MQ_OCR_QUEUE) == 0
+                if not no_consumer:
+                    _wait(publisher, POLL_INTERVAL)
+    finally:
+        if publisher.connection and publisher.connection.is_open:
+            publisher.connection.close()
+
+    if no_consumer:
+        logger.warning(f"OCR job {job_id} ({document_name}): no consumer on {settings.RABBIT_MQ_OCR_QUEUE}, "
+                       f"OCR {len(jobs) - len(texts)} parts locally")
+    for job in jobs:
+        if job.part not in texts:
+            if not no_consumer:
+                logger.warning(f"OCR job {job_id}: part {job.part} {job.page_range} timed out, OCR locally")
+            texts[job.part] = hybrid_ocr.convert_pdf(
+                pdf_path, document_name=document_name, pages=range(*job.page_range)).text
+            OCR_DISTRIBUTED_PARTS.labels(outcome="no_consumer" if no_consumer else "local_fallback").inc()
+    _remove_parts(minio_client, parts_bucket, jobs)
+
+    logger.info(f"OCR job {job_id} ({document_name}) assembled in {time.monotonic() - start:.0f}s")
+    return "\n\n".join(texts[job.part] for job in jobs if texts[job.part])
+
+
+def process_part(message: dict, source_path: str) -> str:
+    """
+    Worker side: OCR one page range of a downloaded source PDF and store the
+    partial markdown.
+
+    Returns:
+        str: Key of the stored part.
+    """
+    job = OCRPartJob.from_message(message)
+    settings = EnvSettings()
+    start = time.monotonic()
+    result = hybrid_ocr.convert_pdf(
+        source_path, document_name=f"{job.document_name} [{job.page_range[0] + 1}-{job.page_range[1]}]",
+        pages=range(*job.page_range))
+    write_part(get_minio_client(), settings.OCR_PARTS_BUCKET, job.part_key, result.text)
+    logger.info(f"OCR part {job.part_key} ({job.page_range[1] - job.page_range[0]} pages) done in "
+                f"{time.monotonic() - start:.0f}s: {json.dumps(result.engine_counts())}")
+    return job.part_key
@@ -0,0 +1,315 @@
+"""
+Fingerprint index of converted dossier files, to recognise resubmitted tenders.
+
+Customers often resend a tender (or an amended version of it) in a new email,
+which creates a new ``hs_id``. Every file converted by ``classify()`` is
+recorded in ``document_fingerprints`` with:
+
+- ``source_hash``: SHA-1 of the uploaded file. A file already converted is
+  not downloaded-and-OCR'd again: its markdown in MinIO and its type are
+  reused (``find_converted``);
+- ``content_hash``: SHA-1 of the normalised markdown;
+- ``section_hashes`` / ``simhashes``: exact hash and 64-bit SimHash of each
+  markdown section (``section_fingerprint``).
+
+``match_dossier`` compares a classified dossier with earlier dossiers that
+have an extracted proposal:
+
+- ``duplicate``: same files (type and content hash). The proposal and its
+  requirement rows are cloned (``reuse_extraction``) and extraction is
+  skipped entirely;
+- ``amendment``: at least ``DOSSIER_AMENDMENT_MIN_SIMILARITY`` of the
+  sections are identical or within ``SECTION_STORE_MAX_DISTANCE`` bits. The
+  dossier goes through the normal pipeline; the finance / experience nodes
+  answer unchanged sections from the section store, so only changed
+  sections reach the model.
+"""
+import hashlib
+import threading
+from collections import Counter
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+from app.config.env import EnvSettings
+from app.storage import pgdb_proposal, postgre
+from app.utils.logger import get_logger
+from app.utils.metrics import DOSSIER_FINGERPRINT_LOOKUPS
+from app.utils.section_fingerprint import SIMHASH_BITS, fingerprint_section, normalize_section, to_signed
+from app.utils.section_router import split_sections
+
+logger = get_logger("dossier_fingerprint")
+
+HASH_CHUNK_SIZE = 1 << 20
+# Số hồ sơ ứng viên tối đa được so sánh (mới nhất trước)
+MAX_CANDIDATE_DOSSIERS = 20
+# Proposal của hồ sơ cũ phải bóc tách xong mới được dùng lại
+REUSABLE_PROPOSAL_STATUSES = ("EXTRACTED", "EXPORTED")
+
+# Số bit 1 của mỗi giá trị byte, để đếm khoảng cách Hamming trên mảng numpy
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+_table_lock = threading.Lock()
+_table_ready: Optional[bool] = None
+
+
+class FileFingerprint(NamedTuple):
+    source_hash: str
+    content_hash: str
+    section_hashes: List[str]
+    simhashes: List[int]
+
+
+class DossierMatch(NamedTuple):
+    kind: str  # duplicate / amendment
+    hs_id: str  # hồ sơ trước đó
+    proposal_id: int  # proposal đã bóc tách của hồ sơ trước đó
+    similarity: float  # tỷ lệ mục giống nhau
+    changed_sections: int  # số mục không trùng khớp chính xác
+    total_sections: int
+
+
+def hash_file(path: str) -> str:
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def fingerprint_markdown(source_hash: str, markdown: str) -> FileFingerprint:
+    sections = [fingerprint_section(text) for _, text in split_sections(markdown)]
+    return FileFingerprint(
+        source_hash,
+        hashlib.sha1(normalize_section(markdown).encode("utf-8")).hexdigest(),
+        [s.text_hash for s in sections],
+        [s.simhash for s in sections],
+    )
+
+
+def _ensure_table() -> bool:
+    """Tạo bảng (một lần mỗi process). Không tạo được thì tắt tính năng cho process này."""
+    global _table_ready
+    with _table_lock:
+        if _table_ready is None:
+            try:
+                postgre.executeSQL("""
+                    CREATE TABLE IF NOT EXISTS document_fingerprints (
+                        email_content_id BIGINT PRIMARY KEY,
+                        source_hash TEXT NOT NULL,
+                        content_hash TEXT NOT NULL,
+                        file_type TEXT NOT NULL,
+                        status TEXT,
+                        classify_type TEXT,
+                        markdown_link TEXT NOT NULL,
+                        section_hashes TEXT[] NOT NULL,
+                        simhashes BIGINT[] NOT NULL,
+                        created_at TIMESTAMP NOT NULL DEFAULT NOW()
+                    );
+                    CREATE INDEX IF NOT EXISTS document_fingerprints_source_hash
+                        ON document_fingerprints (source_hash);
+                    CREATE INDEX IF NOT EXISTS document_fingerprints_content_hash
+                        ON document_fingerprints (content_hash);
+                    CREATE INDEX IF NOT EXISTS document_fingerprints_section_hashes
+                        ON document_fingerprints USING GIN (section_hashes);
+                """)
+                _table_ready = True
+            except Exception as e:
+                logger.warning(f"Dossier fingerprint index disabled: {e}")
+                _table_ready = False
+        return _table_ready
+
+
+def enabled() -> bool:
+    return EnvSettings().DOSSIER_DEDUP_ENABLED and _ensure_table()
+
+
+def record_file(email_content_id, file_type: str, status: str, classify_type: str, markdown_link: str,
+                fingerprint: FileFingerprint):
+    """Upsert the fingerprint of a converted file. Failures are only logged."""
+    if not enabled():
+        return
+    try:
+        postgre.executeSQL("""
+            INSERT INTO document_fingerprints
+                (email_content_id, source_hash, content_hash, file_type, status, classify_type, markdown_link,
+                 section_hashes, simhashes)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (email_content_id) DO UPDATE SET
+                source_hash = EXCLUDED.source_hash, content_hash = EXCLUDED.content_hash,
+                file_type = EXCLUDED.file_type, status = EXCLUDED.status,
+                classify_type = EXCLUDED.classify_type, markdown_link = EXCLUDED.markdown_link,
+                section_hashes = EXCLUDED.section_hashes, simhashes = EXCLUDED.simhashes;
+        """, (email_content_id, fingerprint.source_hash, fingerprint.content_hash, file_type, status,
+              classify_type, markdown_link, fingerprint.section_hashes,
+              [to_signed(value) for value in fingerprint.simhashes]))
+    except Exception as e:
+        logger.warning(f"Could not record fingerprint of email_content {email_content_id}: {e}")
+
+
+def find_converted(source_hash: str) -> Optional[dict]:
+    """Latest conversion of an identical uploaded file (markdown_link, type, fingerprint), or None."""
+    if not enabled():
+        return None
+    rows = postgre.selectSQL("""
+        SELECT email_content_id, source_hash, content_hash, file_type, status, classify_type, markdown_link,
+               section_hashes, simhashes
+        FROM document_fingerprints
+        WHERE source_hash = %s
+        ORDER BY created_at DESC
+        LIMIT 1;
+    """, (source_hash,))
+    DOSSIER_FINGERPRINT_LOOKUPS.labels(kind="file", outcome="reused" if rows else "miss").inc()
+    return rows[0] if rows else None
+
+
+def reuse_converted(email_content_id, converted: dict):
+    """Record a reused conversion under the new email_content_id."""
+    record_file(
+        email_content_id, converted["file_type"], converted["status"], converted["classify_type"],
+        converted["markdown_link"],
+        FileFingerprint(converted["source_hash"], converted["content_hash"], converted["section_hashes"],
+                        [value % (1 << SIMHASH_BITS) for value in converted["simhashes"]]))
+
+
+def _dossier_files(where: str, params: tuple) -> List[dict]:
+    return postgre.selectSQL(f"""
+        SELECT e.hs_id, f.file_type, f.content_hash, f.section_hashes, f.simhashes
+        FROM document_fingerprints f
+        JOIN email_contents e ON e.id = f.email_content_id
+        WHERE {where};
+    """, params)
+
+
+def _near_any(values: List[int], others: List[int], max_distance: int) -> np.ndarray:
+    """For each SimHash of ``values``: is one of ``others`` within ``max_distance`` bits?"""
+    if not values or not others:
+        return np.zeros(len(values), dtype=bool)
+    xor = np.array(values, dtype=np.uint64)[:, None] ^ np.array(others, dtype=np.uint64)[None, :]
+    distances = POPCOUNT_TABLE[xor.view(np.uint8)].reshape(*xor.shape, 8).sum(axis=2)
+    return (distances <= max_distance).any(axis=1)
+
+
+def _compare(current: List[dict], previous: List[dict], max_distance: int) -> tuple:
+    """(same files, similarity, changed sections, total sections) of two dossiers."""
+    same_files = Counter((f["file_type"], f["content_hash"]) for f in current) \
+        == Counter((f["file_type"], f["content_hash"]) for f in previous)
+    previous_hashes = {h for f in previous for h in f["section_hashes"]}
+    previous_simhashes = [value % (1 << SIMHASH_BITS) for f in previous for value in f["simhashes"]]
+    sections = [
+        (h, value % (1 << SIMHASH_BITS))
+        for f in current for h, value in zip(f["section_hashes"], f["simhashes"])
+    ]
+    changed = [value for text_hash, value in sections if text_hash not in previous_hashes]
+    similar = len(sections) - len(changed) + int(_near_any(changed, previous_simhashes, max_distance).sum())
+    total = max(len(sections), len(previous_simhashes))
+    return same_files, similar / total if total else 0.0, len(changed), len(sections)
+
+
+def match_dossier(hs_id: str) -> Optional[DossierMatch]:
+    """
+    Best earlier dossier with an extracted proposal sharing a file or a
+    section with ``hs_id``: a ``duplicate`` when all files are identical, an
+    ``amendment`` when enough sections are similar, else None.
+    """
+    if not enabled():
+        return None
+    try:
+        current = _dossier_files("e.hs_id = %s", (hs_id,))
+        if not current:
+            return None
+        content_hashes = sorted({f["content_hash"] for f in current})
+        section_hashes = sorted({h for f in current for h in f["section_hashes"]})
+        candidates = postgre.selectSQL(f"""
+            SELECT p.id AS proposal_id, e.hs_id
+            FROM proposal p
+            JOIN email_contents e ON e.id = p.email_content_id
+            WHERE e.hs_id <> %s
+              AND p.status IN %s
+              AND e.hs_id IN (
+                  SELECT e2.hs_id
+                  FROM document_fingerprints f
+                  JOIN email_contents e2 ON e2.id = f.email_content_id
+                  WHERE f.content_hash = ANY(%s) OR f.section_hashes && %s::text[]
+              )
+            ORDER BY p.id DESC
+            LIMIT {MAX_CANDIDATE_DOSSIERS};
+        """, (hs_id, REUSABLE_PROPOSAL_STATUSES, content_hashes, section_hashes))
+        # Mỗi hồ sơ chỉ giữ proposal mới nhất
+        proposals = {}
+        for row in candidates:
+            proposals.setdefault(row["hs_id"], row["proposal_id"])
+        if not proposals:
+            DOSSIER_FINGERPRINT_LOOKUPS.labels(kind="dossier", outcome="new").inc()
+            return None
+
+        previous_files = {}
+        for row in _dossier_files("e.hs_id = ANY(%s)", (list(proposals),)):
+            previous_files.setdefault(row["hs_id"], []).append(row)
+        max_distance = EnvSettings().SECTION_STORE_MAX_DISTANCE
+        best = None
+        for previous_hs_id, proposal_id in proposals.items():
+            same_files, similarity, changed, total = _compare(
+                current, previous_files.get(previous_hs_id, []), max_distance)
+            kind = "duplicate" if same_files else "amendment"
+            match = DossierMatch(kind, previous_hs_id, proposal_id, similarity, changed, total)
+            if same_files:
+                best = match
+                break
+            if best is None or similarity > best.similarity:
+                best = match
+    except Exception as e:
+        logger.warning(f"Dossier fingerprint lookup failed for hs_id {hs_id}: {e}")
+        return None
+
+    if best.kind == "amendment" and best.similarity < EnvSettings().DOSSIER_AMENDMENT_MIN_SIMILARITY:
+        best = None
+    DOSSIER_FINGERPRINT_LOOKUPS.labels(kind="dossier", outcome=best.kind if best else "new").inc()
+    if best:
+        logger.info(
+            f"DOSSIER_MATCH hs_id={hs_id} kind={best.kind} previous_hs_id={best.hs_id} "
+            f"proposal_id={best.proposal_id} similarity={best.similarity:.0%} "
+            f"changed_sections={best.changed_sections}/{best.total_sections}")
+    return best
+
+
+def reuse_extraction(hs_id: str, match: DossierMatch) -> Optional[dict]:
+    """
+    Clone the proposal of a duplicate dossier for ``hs_id``.
+
+    Returns:
+        dict: Message for the SQL answer queue (same fields as the extraction
+        step publishes), or None when the dossier has no HSMT file.
+    """
+    rows = postgre.selectSQL(
+        "SELECT id FROM email_contents WHERE hs_id = %s AND type IN ('HSMT','TCT') ORDER BY id LIMIT 1",
+        (hs_id,))
+    if not rows:
+        return None
+    email_content_id = rows[0]["id"]
+    proposal_id = pgdb_proposal.clone_proposal(match.proposal_id, email_content_id)
+    postgre.executeSQL(
+        "UPDATE email_contents SET status='DANG_XU_LY' WHERE hs_id = %s AND type <> 'unknown'", (hs_id,))
+
+    # Cờ nội dung giống lần bóc tách trước: cùng file thì cùng các chương
+    chapters = {
+        row["chapter_name"] for row in postgre.selectSQL("""
+            SELECT DISTINCT dd.chapter_name
+            FROM document_detail dd
+            JOIN email_contents e ON e.id = dd.email_content_id
+            WHERE e.hs_id = %s;
+        """, (match.hs_id,))
+    }
+    has_finance = bool(postgre.selectSQL(
+        "SELECT 1 FROM finance_requirement WHERE proposal_id = %s LIMIT 1", (proposal_id,)))
+    logger.info(f"Reused proposal {match.proposal_id} of hs_id {match.hs_id} as proposal {proposal_id} "
+                f"for hs_id {hs_id}")
+    return {
+        "hs_id": hs_id,
+        "proposal_id": proposal_id,
+        "email_content_id": email_content_id,
+        "is_data_extracted_finance": has_finance,
+        "is_exist_content_markdown_hskt": "HSKT" in chapters,
+        "is_exist_content_markdown_tbmt": "TBMT" in chapters,
+        "is_exist_content_markdown_hsmt": True,
+    }
@@ -8,6 +8,7 @@ from fastapi import HTTPException
 from minio.error import S3Error
 
 from app.config.env import EnvSettings
+from app.utils.metrics import observe_object_store
 
 MINIO_API_ENDPOINT = EnvSettings().MINIO_API_ENDPOINT  # Cổng API
 MINIO_CONSOLE_ENDPOINT = EnvSettings().MINIO_CONSOLE_ENDPOINT  # Cổng Console (UI)
@@ -78,11 +79,13 @@ def download_file_from_minio(filename: str, bucket: str = MINIO_BUCKET):
         print(f"Downloading file from MinIO: {filename} to {download_path}")
 
         # Tải file từ MinIO
-        minio_client.fget_object(
-            bucket_name=bucket,
-            object_name=filename,
-            file_path=download_path
-        )
+        with observe_object_store("download", bucket) as transfer:
+            minio_client.fget_object(
+                bucket_name=bucket,
+                object_name=filename,
+                file_path=download_path
+            )
+            transfer.bytes = os.path.getsize(download_path)
 
         print(f"File downloaded successfully to: {download_path}")
 
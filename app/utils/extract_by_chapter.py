@@ -2,6 +2,33 @@ import re
 
 import fitz  # PyMUPDF
 
+from app.utils.extract_by_chapter_md import ROMAN_NUMERAL
+
+# Pattern for regular numbered chapters (1, 2, 3, etc.)
+# Requires explicit separator (colon, period, dash) followed by title content
+ARABIC_CHAPTER_PATTERN = r"Chương\s+\d+\s*[\.:\-]\s*\S+.*"
+
+# Pattern for Roman numeral chapters (I, II, III, IV, etc.)
+# Requires explicit separator (colon, period, dash) followed by title content
+ROMAN_CHAPTER_PATTERN = r"Chương\s+" + ROMAN_NUMERAL + r"\s*[\.:\-]\s*\S+.*"
+
+CHAPTER_PATTERNS = {
+    "arabic": ARABIC_CHAPTER_PATTERN,
+    "roman": ROMAN_CHAPTER_PATTERN,
+    # Combine both patterns with OR operator
+    "any": f"({ARABIC_CHAPTER_PATTERN}|{ROMAN_CHAPTER_PATTERN})",
+}
+
+# Compiled once at import, shared by every helper of this module
+CHAPTER_REGEXES = {name: re.compile(pattern, re.IGNORECASE) for name, pattern in CHAPTER_PATTERNS.items()}
+
+# Chapter number inside a title
+CHAPTER_NUMBER_REGEX = re.compile(r"Chương\s+(\d+)", re.IGNORECASE)
+CHAPTER_ANY_NUMBER_REGEX = re.compile(r"Chương\s+(\d+|[IVXLCDM]+)", re.IGNORECASE)
+# Strong indicator of a real chapter heading (case-sensitive)
+REAL_CHAPTER_TITLE_REGEX = re.compile(r"Chương\s+(I{1,3}|IV|VI{0,3}|IX|X{1,3}|[0-9]+)\s*[\.:\-]\s*\S+.*")
+REAL_CHAPTER_NUMBER_REGEX = re.compile(r"Chương\s+([IVX0-9]+)", re.IGNORECASE)
+
 
 def get_chapter_pattern(format_type="any"):
     """
@@ -16,24 +43,37 @@ def get_chapter_pattern(format_type="any"):
     Returns:
     str: Regex pattern for the specified chapter format
     """
-    # Pattern for regular numbered chapters (1, 2, 3, etc.)
-    # Requires explicit separator (colon, period, dash) followed by title content
-    arabic_pattern = r"Chương\s+\d+\s*[\.:\-]\s*\S+.*"
+    return CHAPTER_PATTERNS.get(format_type.lower(), CHAPTER_PATTERNS["any"])
+
+
+def get_chapter_regex(format_type="any", chapter_pattern=None):
+    """
+    Get the compiled chapter regex: precompiled for the built-in formats,
+    compiled on demand for a custom ``chapter_pattern``.
+
+    Returns:
+    re.Pattern: Compiled pattern (re.IGNORECASE)
+    """
+    if chapter_pattern:
+        return re.compile(chapter_pattern, re.IGNORECASE)
+    return CHAPTER_REGEXES.get(format_type.lower(), CHAPTER_REGEXES["any"])
 
-    # Pattern for Roman numeral chapters (I, II, III, IV, etc.)
-    # Requires explicit separator (colon, period, dash) followed by title content
-    roman_pattern = r"Chương\s+(I{1,3}|IV|VI{0,3}|IX|XI{0,3}|XIV|XVI{0,3}|XIX|XXI{0,3}|XXIV|XXVI{0,3}|XXIX|XXXI{0,3}|XXXIV|XXXVI{0,3}|XXXIX)\s*[\.:\-]\s*\S+.*"
 
-    if format_type.lower() == 'arabic':
-        return arabic_pattern
-    elif format_type.lower() == 'roman':
-        return roman_pattern
-    else:  # 'any' or any other value
-        # Combine both patterns with OR operator
-        return f"({arabic_pattern}|{roman_pattern})"
+def read_page_texts(pdf_path):
+    """
+    Read the plain text of every page once.
 
+    Parameters:
+    pdf_path (str): Path to the PDF file
 
-def list_chapters(pdf_path, format_type="any", chapter_pattern=None):
+    Returns:
+    list: Text of each page, in page order
+    """
+    with fitz.open(pdf_path) as doc:
+        return [page.get_text() for page in doc]
+
+
+def list_chapters(pdf_path, format_type="any", chapter_pattern=None, page_texts=None):
     """
     List all chapters found in the PDF.
 
@@ -41,21 +81,17 @@ def list_chapters(pdf_path, format_type="any", chapter_pattern=None):
     pdf_path (str): Path to the PDF file
     format_type (str): Type of chapter numbering ('arabic', 'roman', or 'any')
     chapter_pattern (str, optional): Custom regex pattern for chapter headings
+    page_texts (list, optional): Already-read page texts (skips opening the PDF)
 
     Returns:
     list: List of dictionaries with chapter info
     """
-    if not chapter_pattern:
-        chapter_pattern = get_chapter_pattern(format_type)
-
-    chapter_regex = re.compile(chapter_pattern, re.IGNORECASE)
-    doc = fitz.open(pdf_path)
+    chapter_regex = get_chapter_regex(format_type, chapter_pattern)
+    if page_texts is None:
+        page_texts = read_page_texts(pdf_path)
 
     chapters = []
-    for page_idx in range(len(doc)):
-        page = doc[page_idx]
-        text = page.get_text()
-
+    for page_idx, text in enumerate(page_texts):
         for match in chapter_regex.finditer(text):
             chapters.append({
                 "title": match.group(0).strip(),
@@ -79,14 +115,10 @@ def extract_chapter(pdf_path, chapter_num=None, chapter_title=None, format_type=
     Returns:
     dict: A dictionary with chapter title, text content, and page range
     """
-    if not chapter_pattern:
-        chapter_pattern = get_chapter_pattern(format_type)
+    chapter_regex = get_chapter_regex(format_type, chapter_pattern)
 
-    # Compile the pattern for better performance
-    chapter_regex = re.compile(chapter_pattern, re.IGNORECASE)
-
-    # Open the PDF
-    doc = fitz.open(pdf_path)
+    # Read every page once: both passes below work on these texts
+    page_texts = read_page_texts(pdf_path)
 
     # Store chapter info: {chapter_title: [start_page, end_page, full_text]}
     chapters = {}
@@ -94,10 +126,7 @@ def extract_chapter(pdf_path, chapter_num=None, chapter_title=None, format_type=
 
     # First pass: find all chapter headings and their starting pages
     print("Scanning for chapter headings...")
-    for page_idx in range(len(doc)):
-        page = doc[page_idx]
-        text = page.get_text()
-
+    for page_idx, text in enumerate(page_texts):
         # Find all matches for chapter headings on this page
         matches = chapter_regex.finditer(text)
 
@@ -117,7 +146,7 @@ def extract_chapter(pdf_path, chapter_num=None, chapter_title=None, format_type=
 
     # Set the end page of the last chapter to the last page of the document
     if current_chapter:
-        chapters[current_chapter][1] = len(doc) - 1
+        chapters[current_chapter][1] = len(page_texts) - 1
 
     # Now update end pages for all chapters
     chapter_list = list(chapters.keys())
@@ -132,8 +161,7 @@ def extract_chapter(pdf_path, chapter_num=None, chapter_title=None, format_type=
     # Find the specific chapter we're looking for
     for heading, (start_page, end_page, _) in chapters.items():
         # Extract chapter number if present
-        chapter_number_match = re.search(
-            r"Chương\s+(\d+)", heading, re.IGNORECASE)
+        chapter_number_match = CHAPTER_NUMBER_REGEX.search(heading)
         extracted_chapter_num = int(chapter_number_match.group(
             1)) if chapter_number_match else None
 
@@ -158,8 +186,7 @@ def extract_chapter(pdf_path, chapter_num=None, chapter_title=None, format_type=
         print(
             f"Extracting {target_chapter} (pages {start_page+1}-{end_page+1})...")
         for page_idx in range(start_page, end_page + 1):
-            page = doc[page_idx]
-            text = page.get_text()
+            text = page_texts[page_idx]
 
             # For the first page, try to start from the chapter heading
             if page_idx == start_page:
@@ -186,11 +213,17 @@ def extract_chapter_smart(pdf_path, chapter_num=None, chapter_title=None):
     """
     Extract chapters using multiple detection methods for better accuracy
     """
-    doc = fitz.open(pdf_path)
+    with fitz.open(pdf_path) as doc:
+        return _extract_chapter_smart(doc, chapter_num, chapter_title)
+
+
+def _extract_chapter_smart(doc, chapter_num=None, chapter_title=None):
     chapter_candidates = []
 
     # Method 2: Text pattern matching
-    chapter_regex = re.compile(get_chapter_pattern(), re.IGNORECASE)
+    chapter_regex = get_chapter_regex()
+    # Page texts are kept for the content extraction below
+    page_texts = []
 
     for page_idx in range(len(doc)):
         page = doc[page_idx]
@@ -199,6 +232,7 @@ def extract_chapter_smart(pdf_path, chapter_num=None, chapter_title=None):
 
         # Method 2: Use text patterns
         text = page.get_text()
+        page_texts.append(text)
         for match in chapter_regex.finditer(text):
             title = match.group(0).strip()
             chapter_candidates.append({
@@ -291,8 +325,7 @@ def extract_chapter_smart(pdf_path, chapter_num=None, chapter_title=None):
         for ch in chapters:
             if chapter_num is not None:
                 # Try to extract chapter number from the title
-                num_match = re.search(
-                    r"Chương\s+(\d+|[IVXLCDM]+)", ch["title"], re.IGNORECASE)
+                num_match = CHAPTER_ANY_NUMBER_REGEX.search(ch["title"])
                 if num_match:
                     # Handle both Arabic and Roman numerals
                     ch_num = num_match.group(1)
@@ -318,8 +351,7 @@ def extract_chapter_smart(pdf_path, chapter_num=None, chapter_title=None):
             # Extract content
             content = ""
             for pg_idx in range(start_page, end_page + 1):
-                page = doc[pg_idx]
-                page_text = page.get_text()
+                page_text = page_texts[pg_idx]
 
                 # On first page, start from the chapter heading
                 if pg_idx == start_page and target_chapter["title"] in page_text:
@@ -357,10 +389,7 @@ def filter_real_chapters(chapter_candidates):
     strong_candidates = []
     for chapter in chapter_candidates:
         # Strong indicators of a real chapter heading
-        title_format = re.match(
-            r"Chương\s+(I{1,3}|IV|VI{0,3}|IX|X{1,3}|[0-9]+)\s*[\.:\-]\s*\S+.*",
-            chapter.get("title", "")
-        )
+        title_format = REAL_CHAPTER_TITLE_REGEX.match(chapter.get("title", ""))
 
         # Primary check - must have chapter format and be centered
         if title_format and chapter.get("is_centered", False):
@@ -395,8 +424,7 @@ def filter_real_chapters(chapter_candidates):
         # Check for proper sequence
         for i, chapter in enumerate(strong_candidates):
             # Extract chapter number using regex
-            num_match = re.search(
-                r"Chương\s+([IVX0-9]+)", chapter.get("title", ""), re.IGNORECASE)
+            num_match = REAL_CHAPTER_NUMBER_REGEX.search(chapter.get("title", ""))
             if num_match:
                 real_chapters.append(chapter)
 
@@ -1,6 +1,51 @@
 import os
 import re
 
+# Roman numerals I..XXXIX
+ROMAN_NUMERAL = r"(I{1,3}|IV|VI{0,3}|IX|XI{0,3}|XIV|XVI{0,3}|XIX|XXI{0,3}|XXIV|XXVI{0,3}|XXIX|XXXI{0,3}|XXXIV|XXXVI{0,3}|XXXIX)"
+
+# Pattern for regular numbered chapters (1, 2, 3, etc.)
+# Matches markdown headings (# or ##) with "Chương" followed by numbers
+ARABIC_CHAPTER_PATTERN = r"^#{1,2}\s+Chương\s+\d+[\s\.:\-]*\S+.*$"
+
+# Pattern for Roman numeral chapters (I, II, III, IV, etc.)
+ROMAN_CHAPTER_PATTERN = r"^#{1,2}\s+Chương\s+" + ROMAN_NUMERAL + r"[\s\.:\-]*\S+.*$"
+
+CHAPTER_PATTERNS = {
+    "arabic": ARABIC_CHAPTER_PATTERN,
+    "roman": ROMAN_CHAPTER_PATTERN,
+    # Combine both patterns with OR operator
+    "any": f"({ARABIC_CHAPTER_PATTERN}|{ROMAN_CHAPTER_PATTERN})",
+}
+
+# Compiled once at import, shared by every helper of this module
+CHAPTER_REGEXES = {name: re.compile(pattern, re.MULTILINE) for name, pattern in CHAPTER_PATTERNS.items()}
+
+# Heading lexer: one alternation classifies every line of a document in a single
+# finditer: a markdown heading (# .. ###) or a plain "Chương/Chapter/Phần <number>" line.
+# Each line is matched from the newline before it: a literal first character lets the
+# regex engine jump from newline to newline instead of trying every position as "^" would.
+# Headings without a chapter keyword anywhere on the line can never be chapters and are
+# skipped by the lookahead.
+HEADING_LEXER = re.compile(
+    r"\n(?:(?P<hashes>#{1,3})[^\S\n]+(?=[^\n]*?(?:Chương|Chapter|Phần))(?P<heading>.*?)"
+    r"|(?P<plain>(?:Chương|Chapter|Phần)[^\S\n]+[0-9IVX]+.*))$",
+    re.MULTILINE | re.IGNORECASE)
+
+# Updated chapter pattern to better match Vietnamese documents
+SMART_CHAPTER_REGEX = re.compile(
+    r'^(Chương|Chapter|CHƯƠNG|CHAPTER|Phần|PHẦN)\s+([0-9IVX]+)(?:[\s\.:\-]+(.*))?', re.IGNORECASE)
+
+# New pattern for uppercase chapter titles
+UPPERCASE_CHAPTER_REGEX = re.compile(r'^(CHƯƠNG|CHAPTER|PHẦN)\s+([0-9IVX]+)', re.MULTILINE)
+
+# Pattern for bold markdown in headings (e.g., # **Chương II.**)
+BOLD_REGEX = re.compile(r'\*\*(.*?)\*\*')
+
+# Chapter number inside a title
+CHAPTER_NUMBER_REGEX = re.compile(r"Chương\s+(\d+)", re.IGNORECASE)
+CHAPTER_OR_PART_NUMBER_REGEX = re.compile(r"(Chương|Phần)\s+(\d+|[IVXLCDM]+)", re.IGNORECASE)
+
 
 def get_chapter_pattern(format_type="any"):
     """
@@ -15,20 +60,20 @@ def get_chapter_pattern(format_type="any"):
     Returns:
     str: Regex pattern for the specified chapter format
     """
-    # Pattern for regular numbered chapters (1, 2, 3, etc.)
-    # Matches markdown headings (# or ##) with "Chương" followed by numbers
-    arabic_pattern = r"^#{1,2}\s+Chương\s+\d+[\s\.:\-]*\S+.*$"
+    return CHAPTER_PATTERNS.get(format_type.lower(), CHAPTER_PATTERNS["any"])
 
-    # Pattern for Roman numeral chapters (I, II, III, IV, etc.)
-    roman_pattern = r"^#{1,2}\s+Chương\s+(I{1,3}|IV|VI{0,3}|IX|XI{0,3}|XIV|XVI{0,3}|XIX|XXI{0,3}|XXIV|XXVI{0,3}|XXIX|XXXI{0,3}|XXXIV|XXXVI{0,3}|XXXIX)[\s\.:\-]*\S+.*$"
 
-    if format_type.lower() == 'arabic':
-        return arabic_pattern
-    elif format_type.lower() == 'roman':
-        return roman_pattern
-    else:  # 'any' or any other value
-        # Combine both patterns with OR operator
-        return f"({arabic_pattern}|{roman_pattern})"
+def get_chapter_regex(format_type="any"):
+    """
+    Get the precompiled regex of ``get_chapter_pattern(format_type)``.
+
+    Parameters:
+    format_type (str): Type of chapter numbering ('arabic', 'roman', or 'any')
+
+    Returns:
+    re.Pattern: Compiled pattern (re.MULTILINE)
+    """
+    return CHAPTER_REGEXES.get(format_type.lower(), CHAPTER_REGEXES["any"])
 
 
 def is_chapter_heading(line, format_type="any"):
@@ -42,46 +87,37 @@ def is_chapter_heading(line, format_type="any"):
     Returns:
     bool: True if the line is a chapter heading, False otherwise
     """
-    pattern = get_chapter_pattern(format_type)
-    return bool(re.match(pattern, line, re.MULTILINE))
+    return bool(get_chapter_regex(format_type).match(line))
 
 
-def list_chapters(md_path, format_type="any"):
+def list_chapters(md_path, format_type="any", lines=None):
     """
     List all chapters found in the markdown file.
 
     Parameters:
     md_path (str): Path to the markdown file
     format_type (str): Type of chapter numbering ('arabic', 'roman', or 'any')
+    lines (list, optional): Already-loaded lines of the file (skips reading it)
 
     Returns:
     list: List of dictionaries with chapter info (title, line number)
     """
-    if not os.path.exists(md_path):
-        print(f"File not found: {md_path}")
-        return []
+    if lines is None:
+        lines = read_markdown_lines(md_path)
+        if lines is None:
+            return []
 
-    chapter_pattern = get_chapter_pattern(format_type)
-    chapter_regex = re.compile(chapter_pattern, re.MULTILINE)
+    chapter_regex = get_chapter_regex(format_type)
 
     chapters = []
-
-    try:
-        with open(md_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-            lines = content.split('\n')
-
-            for line_idx, line in enumerate(lines):
-                match = chapter_regex.match(line)
-                if match:
-                    chapters.append({
-                        "title": line.strip(),
-                        "line": line_idx + 1,  # 1-based line numbering
-                        "content_start": line_idx  # 0-based for internal use
-                    })
-    except Exception as e:
-        print(f"Error reading file: {e}")
-        return []
+    for line_idx, line in enumerate(lines):
+        match = chapter_regex.match(line)
+        if match:
+            chapters.append({
+                "title": line.strip(),
+                "line": line_idx + 1,  # 1-based line numbering
+                "content_start": line_idx  # 0-based for internal use
+            })
 
     return chapters
 
@@ -99,12 +135,13 @@ def extract_chapter(md_path, chapter_num=None, chapter_title=None, format_type="
     Returns:
     dict: A dictionary with chapter title and text content
     """
-    if not os.path.exists(md_path):
-        print(f"File not found: {md_path}")
+    # Read the file once for both listing and slicing
+    lines = read_markdown_lines(md_path)
+    if lines is None:
         return None
 
     # Get all chapters first
-    chapters = list_chapters(md_path, format_type)
+    chapters = list_chapters(md_path, format_type, lines=lines)
 
     if not chapters:
         print(f"No chapters found in {md_path}")
@@ -119,7 +156,7 @@ def extract_chapter(md_path, chapter_num=None, chapter_title=None, format_type="
 
         # Extract chapter number if present
         if chapter_num is not None:
-            num_match = re.search(r"Chương\s+(\d+)", title, re.IGNORECASE)
+            num_match = CHAPTER_NUMBER_REGEX.search(title)
             extracted_chapter_num = int(
                 num_match.group(1)) if num_match else None
 
@@ -139,19 +176,19 @@ def extract_chapter(md_path, chapter_num=None, chapter_title=None, format_type="
             f"Chapter not found. Available chapters: {', '.join(ch['title'] for ch in chapters)}")
         return None
 
-    # Determine end line (next chapter's line - 1 or end of file)
-    with open(md_path, 'r', encoding='utf-8') as file:
-        lines = file.readlines()
+    # Determine end line (next chapter's line - 1 or end of file); a trailing
+    # newline does not start another line
+    line_count = len(lines) - 1 if lines[-1] == '' else len(lines)
 
     start_line = target_chapter["content_start"]
 
     if target_idx < len(chapters) - 1:
         end_line = chapters[target_idx + 1]["content_start"]
+        # Extract content, keeping the newline of the last line as before
+        content = '\n'.join(lines[start_line:end_line]) + '\n'
     else:
-        end_line = len(lines)
-
-    # Extract content
-    content = ''.join(lines[start_line:end_line])
+        end_line = line_count
+        content = '\n'.join(lines[start_line:])
 
     return {
         "title": target_chapter["title"],
@@ -161,18 +198,15 @@ def extract_chapter(md_path, chapter_num=None, chapter_title=None, format_type="
     }
 
 
-def extract_chapter_smart(md_path, chapter_num=None, chapter_title=None):
+def read_markdown_lines(md_path):
     """
-    Extract chapters using multiple detection methods for better accuracy.
+    Read a markdown file once and split it into lines.
 
     Parameters:
     md_path (str): Path to the markdown file
-    chapter_num (int, optional): The specific chapter number to extract
-    chapter_title (str, optional): The specific chapter title to extract (partial match)
 
     Returns:
-    dict or list: Chapter info if chapter_num or chapter_title is specified,
-                  otherwise a list of all chapters with detection metadata
+    list or None: Lines of the file (without newline), None if it cannot be read
     """
     if not os.path.exists(md_path):
         print(f"File not found: {md_path}")
@@ -180,45 +214,50 @@ def extract_chapter_smart(md_path, chapter_num=None, chapter_title=None):
 
     try:
         with open(md_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-            lines = content.split('\n')
+            return file.read().split('\n')
     except Exception as e:
         print(f"Error reading file: {e}")
         return None
 
-    # Method 1: Look for explicit markdown headings with chapter patterns
-    heading_pattern = re.compile(r'^(#{1,3})\s+(.*?)$', re.MULTILINE)
 
-   # Updated chapter pattern to better match Vietnamese documents
-    chapter_pattern = re.compile(
-        r'^(Chương|Chapter|CHƯƠNG|CHAPTER|Phần|PHẦN)\s+([0-9IVX]+)(?:[\s\.:\-]+(.*))?', re.IGNORECASE)
-
-    # New pattern for uppercase chapter titles
-    uppercase_chapter_pattern = re.compile(
-        r'^(CHƯƠNG|CHAPTER|PHẦN)\s+([0-9IVX]+)', re.MULTILINE)
+def detect_chapters(lines):
+    """
+    Detect the real chapters of already-loaded markdown lines.
 
-    # Pattern for bold markdown in headings (e.g., # **Chương II.**)
-    bold_pattern = re.compile(r'\*\*(.*?)\*\*')
+    Parameters:
+    lines (list): Lines of the markdown document
 
+    Returns:
+    list: Filtered chapters sorted by line, with detection metadata
+    """
     chapter_candidates = []
 
-    for line_idx, line in enumerate(lines):
+    # Only lines classified by the lexer are looked at; line numbers are
+    # recovered by counting newlines between consecutive matches (the leading
+    # newline lets the lexer match the first line too)
+    content = '\n' + '\n'.join(lines)
+    line_idx = position = 0
+    for lexeme in HEADING_LEXER.finditer(content):
+        line_idx += content.count('\n', position, lexeme.start())
+        position = lexeme.start()
+        line = lines[line_idx]
+
         # Check if there's a blank line after this line (for confidence boosting)
         followed_by_blank_line = (line_idx < len(
             lines) - 1 and lines[line_idx + 1].strip() == '')
 
-        heading_match = heading_pattern.match(line)
-        if heading_match:
-            heading_level = len(heading_match.group(1))
-            heading_text = heading_match.group(2).strip()
+        # Method 1: Look for explicit markdown headings with chapter patterns
+        if lexeme.group("hashes"):
+            heading_level = len(lexeme.group("hashes"))
+            heading_text = lexeme.group("heading").strip()
 
             # Check for bold markdown in the heading
-            bold_match = bold_pattern.search(heading_text)
+            bold_match = BOLD_REGEX.search(heading_text)
             if bold_match:
                 # Extract the text within the bold markers
                 bold_text = bold_match.group(1).strip()
                 # Check if the bold text contains a chapter pattern
-                chapter_match = chapter_pattern.search(bold_text)
+                chapter_match = SMART_CHAPTER_REGEX.search(bold_text)
                 if chapter_match:
                     confidence = 0.9  # Higher confidence for bold chapter headings
 
@@ -248,7 +287,7 @@ def extract_chapter_smart(md_path, chapter_num=None, chapter_title=None):
                     continue  # Skip further processing of this line
 
             # Regular chapter heading check
-            chapter_match = chapter_pattern.search(heading_text)
+            chapter_match = SMART_CHAPTER_REGEX.search(heading_text)
             if chapter_match:
                 confidence = 0.8  # High confidence for standard markdown headings
 
@@ -289,7 +328,7 @@ def extract_chapter_smart(md_path, chapter_num=None, chapter_title=None):
                 })
 
         # Method 2: Check for chapter patterns without markdown headings
-        elif re.match(r'^(Chương|Chapter|CHƯƠNG|CHAPTER|Phần|PHẦN)\s+([0-9IVX]+)', line, re.IGNORECASE):
+        else:
             # Look for special formatting indicators
             is_capitalized = line.upper() == line
             # Indentation as centering proxy
@@ -302,7 +341,7 @@ def extract_chapter_smart(md_path, chapter_num=None, chapter_title=None):
                 confidence += 0.15  # Higher boost for plain text headings
 
             # Extract the chapter title part
-            chapter_match = chapter_pattern.search(line)
+            chapter_match = SMART_CHAPTER_REGEX.search(line)
             chapter_num_value = chapter_match.group(2)
             chapter_title_text = chapter_match.group(
                 3) if chapter_match.group(3) else ""
@@ -321,7 +360,7 @@ def extract_chapter_smart(md_path, chapter_num=None, chapter_title=None):
                 confidence += 0.1
 
             # Special check for "CHƯƠNG X" pattern (all uppercase)
-            if uppercase_chapter_pattern.search(line):
+            if UPPERCASE_CHAPTER_REGEX.search(line):
                 confidence += 0.1  # Additional bonus for uppercase "CHƯƠNG" keyword
 
             chapter_candidates.append({
@@ -341,7 +380,64 @@ def extract_chapter_smart(md_path, chapter_num=None, chapter_title=None):
         # Method 3: Check for bold chapter pattern without markdown headings
 
     # De-duplicate and merge results from different methods
-    merged_chapters = filter_real_chapters(chapter_candidates)
+    return filter_real_chapters(chapter_candidates)
+
+
+def chapter_content(lines, chapters, idx):
+    """
+    Slice the content of ``chapters[idx]`` out of the loaded lines: from its
+    heading up to the next chapter (or the end of the document).
+
+    Parameters:
+    lines (list): Lines of the markdown document
+    chapters (list): Chapters returned by detect_chapters
+    idx (int): Index of the chapter in ``chapters``
+
+    Returns:
+    dict: Chapter title, line range, content and detection metadata
+    """
+    target_chapter = chapters[idx]
+    start_line = target_chapter["content_start"]
+
+    if idx < len(chapters) - 1:
+        end_line = chapters[idx + 1]["content_start"]
+    else:
+        end_line = len(lines)
+
+    content = '\n'.join(lines[start_line:end_line])
+
+    return {
+        "title": target_chapter["title"],
+        "start_line": target_chapter["line"],
+        "end_line": end_line + 1 if idx < len(chapters) - 1 else end_line,
+        "content": content,
+        "detection_method": target_chapter["method"],
+        "confidence": target_chapter["confidence"],
+        "is_uppercase": target_chapter.get("is_uppercase", False),
+        "title_text": target_chapter.get("title_text", ""),
+        "title_is_uppercase": target_chapter.get("title_is_uppercase", False),
+        "followed_by_blank": target_chapter.get("followed_by_blank", False)
+    }
+
+
+def extract_chapter_smart(md_path, chapter_num=None, chapter_title=None):
+    """
+    Extract chapters using multiple detection methods for better accuracy.
+
+    Parameters:
+    md_path (str): Path to the markdown file
+    chapter_num (int, optional): The specific chapter number to extract
+    chapter_title (str, optional): The specific chapter title to extract (partial match)
+
+    Returns:
+    dict or list: Chapter info if chapter_num or chapter_title is specified,
+                  otherwise a list of all chapters with detection metadata
+    """
+    lines = read_markdown_lines(md_path)
+    if lines is None:
+        return None
+
+    merged_chapters = detect_chapters(lines)
 
     # Find specific chapter if requested
     if chapter_num is not None or chapter_title is not None:
@@ -351,8 +447,7 @@ def extract_chapter_smart(md_path, chapter_num=None, chapter_title=None):
         for idx, chapter in enumerate(merged_chapters):
             if chapter_num is not None:
                 # Try to extract chapter number
-                num_match = re.search(
-                    r"(Chương|Phần)\s+(\d+|[IVXLCDM]+)", chapter["title"], re.IGNORECASE)
+                num_match = CHAPTER_OR_PART_NUMBER_REGEX.search(chapter["title"])
                 if num_match:
                     ch_num = num_match.group(2)
                     if ch_num.isdigit() and int(ch_num) == chapter_num:
@@ -366,28 +461,7 @@ def extract_chapter_smart(md_path, chapter_num=None, chapter_title=None):
                 break
 
         if target_chapter:
-            # Extract chapter content
-            start_line = target_chapter["content_start"]
-
-            if target_idx < len(merged_chapters) - 1:
-                end_line = merged_chapters[target_idx + 1]["content_start"]
-            else:
-                end_line = len(lines)
-
-            content = '\n'.join(lines[start_line:end_line])
-
-            return {
-                "title": target_chapter["title"],
-                "start_line": target_chapter["line"],
-                "end_line": end_line + 1 if target_idx < len(merged_chapters) - 1 else end_line,
-                "content": content,
-                "detection_method": target_chapter["method"],
-                "confidence": target_chapter["confidence"],
-                "is_uppercase": target_chapter.get("is_uppercase", False),
-                "title_text": target_chapter.get("title_text", ""),
-                "title_is_uppercase": target_chapter.get("title_is_uppercase", False),
-                "followed_by_blank": target_chapter.get("followed_by_blank", False)
-            }
+            return chapter_content(lines, merged_chapters, target_idx)
 
         return None  # Chapter not found
 
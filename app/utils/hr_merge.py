@@ -0,0 +1,245 @@
+"""
+Deterministic merge of HR requirements extracted from several sources.
+
+The HR node and the technology node both extract personnel requirements
+(``{"position", "quantity", "requirements": [{"name", "description",
+"document_name"}]}``). Positions are merged locally instead of asking the
+model to union the two JSONs:
+
+1. Titles are normalised (NFC, lowercase, numbering, punctuation and a
+   leading "vị trí" / "chức danh" removed). Identical titles, or titles
+   scoring at least ``POSITION_MATCH_MIN_SCORE`` (RapidFuzz
+   ``token_sort_ratio``), with compatible quantities and the same numbers,
+   are the same position.
+2. Pairs that are only close (``token_set_ratio`` at least
+   ``POSITION_MATCH_MIN_SCORE``, ``token_sort_ratio`` at least
+   ``POSITION_AMBIGUOUS_MIN_SCORE``, or identical titles with different
+   quantities) are ambiguous. They are all sent to the model in one small
+   call (``llm_same_positions``); without an answer they stay separate, so
+   nothing is lost.
+3. Requirements of a merged position are merged by normalised name; their
+   distinct descriptions are joined as a bullet list ("• a\\n• b").
+
+Positions keep the order in which they first appear; a merged position
+takes the first title and the largest quantity. ``PositionGroups`` does step
+1 incrementally, so positions can be grouped while they are streamed.
+"""
+import json
+import re
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from langchain_core.prompts import PromptTemplate
+from rapidfuzz import fuzz
+
+from app.config.env import EnvSettings
+from app.model_ai import llm
+from app.utils.logger import get_logger
+from app.utils.metrics import HR_MERGE_DECISIONS
+from app.utils.requirement_merge import DistinctTexts, fuzzy_match, normalize_name
+
+logger = get_logger("hr_merge")
+
+# Điểm tương đồng (0-100) để coi hai vị trí là một mà không cần hỏi model
+POSITION_MATCH_MIN_SCORE = 92
+# Từ điểm này đến POSITION_MATCH_MIN_SCORE: cặp mơ hồ, hỏi model
+POSITION_AMBIGUOUS_MIN_SCORE = 75
+# Điểm tương đồng để coi hai tên yêu cầu của cùng vị trí là một
+REQUIREMENT_NAME_MIN_SCORE = 90
+DESCRIPTION_BULLET = "• "
+
+POSITION_PREFIX_PATTERN = re.compile(r"^(?:vị trí|chức danh|nhân sự)\s*:?\s*", re.IGNORECASE)
+NUMBER_PATTERN = re.compile(r"\d+")
+
+SAME_POSITION_PROMPT = PromptTemplate.from_template(
+    """
+        Bạn là chuyên gia phân tích hồ sơ mời thầu.
+        Mỗi cặp dưới đây gồm hai vị trí nhân sự được bóc tách từ cùng một hồ sơ (có thể từ hai chương khác nhau).
+        Với từng cặp, hãy xác định hai vị trí có phải là CÙNG MỘT vị trí nhân sự hay không.
+        Hai vị trí khác chuyên môn, khác cấp bậc hoặc là hai vị trí riêng biệt trong hồ sơ thì trả về false.
+
+        Các cặp:
+        {pairs}
+
+        Chỉ trả về JSON dạng: {{"same": [true, false, ...]}} theo đúng thứ tự các cặp.
+    """
+)
+
+
+class AmbiguousPair(NamedTuple):
+    first: dict
+    second: dict
+
+
+def normalize_position(position) -> str:
+    return normalize_name(POSITION_PREFIX_PATTERN.sub("", str(position or "").strip()))
+
+
+def parse_quantity(quantity) -> Optional[int]:
+    """Số lượng dạng số hoặc chuỗi ("02", "2 người"); None nếu không có số."""
+    if isinstance(quantity, (int, float)):
+        return int(quantity)
+    match = NUMBER_PATTERN.search(str(quantity or ""))
+    return int(match.group()) if match else None
+
+
+def _quantities_compatible(a, b) -> bool:
+    a, b = parse_quantity(a), parse_quantity(b)
+    return not a or not b or a == b
+
+
+def _compare_positions(first: dict, second: dict) -> str:
+    """same / ambiguous / different"""
+    a, b = normalize_position(first.get("position")), normalize_position(second.get("position"))
+    if not a or not b or NUMBER_PATTERN.findall(a) != NUMBER_PATTERN.findall(b):
+        return "same" if a == b and _quantities_compatible(first.get("quantity"), second.get("quantity")) \
+            else "different"
+    compatible = _quantities_compatible(first.get("quantity"), second.get("quantity"))
+    sort_score = fuzz.token_sort_ratio(a, b)
+    if sort_score >= POSITION_MATCH_MIN_SCORE:
+        return "same" if compatible else "ambiguous"
+    if sort_score >= POSITION_AMBIGUOUS_MIN_SCORE or fuzz.token_set_ratio(a, b) >= POSITION_MATCH_MIN_SCORE:
+        return "ambiguous"
+    return "different"
+
+
+def llm_same_positions(pairs: Sequence[AmbiguousPair], chat_model=None) -> List[bool]:
+    """One model call deciding every ambiguous pair; False for pairs it does not answer."""
+    lines = [
+        f"{i + 1}. A: {json.dumps(_summary(pair.first), ensure_ascii=False)}\n"
+        f"   B: {json.dumps(_summary(pair.second), ensure_ascii=False)}"
+        for i, pair in enumerate(pairs)
+    ]
+    try:
+        chat_model = chat_model or llm.chat_model_gpt_4o_mini()
+        chain = SAME_POSITION_PROMPT | chat_model.with_structured_output(None, method="json_mode")
+        answers = chain.invoke({"pairs": "\n".join(lines)}).get("same", [])
+    except Exception as e:
+        logger.warning(f"HR merge: model could not resolve {len(pairs)} ambiguous pairs, kept separate: {e}")
+        return [False] * len(pairs)
+    return [i < len(answers) and answers[i] is True for i in range(len(pairs))]
+
+
+def _summary(position: dict) -> dict:
+    return {
+        "position": position.get("position", ""),
+        "quantity": position.get("quantity", ""),
+        "requirements": [r.get("name", "") for r in position.get("requirements") or [] if isinstance(r, dict)],
+    }
+
+
+def _merge_group(positions: List[dict]) -> dict:
+    quantities = [q for q in (parse_quantity(p.get("quantity")) for p in positions) if q is not None]
+    requirements: List[dict] = []
+    name_keys: List[str] = []
+    descriptions: List[DistinctTexts] = []
+    for position in positions:
+        for requirement in position.get("requirements") or []:
+            if not isinstance(requirement, dict):
+                continue
+            key = normalize_name(requirement.get("name"))
+            index = name_keys.index(key) if key in name_keys else fuzzy_match(
+                key, name_keys, fuzz.token_sort_ratio, REQUIREMENT_NAME_MIN_SCORE) if key else None
+            if index is None:
+                requirements.append(dict(requirement))
+                name_keys.append(key)
+                descriptions.append(DistinctTexts())
+                index = len(requirements) - 1
+            elif not requirements[index].get("document_name") and requirement.get("document_name"):
+                requirements[index]["document_name"] = requirement["document_name"]
+            descriptions[index].add(str(requirement.get("description") or ""))
+
+    for requirement, texts in zip(requirements, descriptions):
+        if len(texts.texts) > 1:
+            requirement["description"] = "\n".join(
+                text if text.lstrip().startswith(DESCRIPTION_BULLET.strip()) else DESCRIPTION_BULLET + text
+                for text in texts.texts)
+        elif texts.texts:
+            requirement["description"] = texts.texts[0]
+    merged = dict(positions[0])
+    if quantities:
+        merged["quantity"] = str(max(quantities))
+    merged["requirements"] = requirements
+    return merged
+
+
+class PositionGroups:
+    """
+    Positions grouped as they are added: each joins the first group it surely
+    matches, pairs of groups that are only close are kept for ``merged``.
+    """
+
+    def __init__(self, positions: Sequence[dict] = ()):
+        self.positions: List[dict] = []
+        self.groups: List[List[int]] = []
+        self.ambiguous: Dict[tuple, None] = {}  # (nhóm trước, nhóm sau), giữ thứ tự
+        for position in positions:
+            self.add(position)
+
+    def add(self, position):
+        if not isinstance(position, dict):
+            return
+        i = len(self.positions)
+        self.positions.append(position)
+        target, candidates = None, []
+        for g, members in enumerate(self.groups):
+            decision = _compare_positions(self.positions[members[0]], position)
+            if decision == "same":
+                target = g
+                break
+            if decision == "ambiguous":
+                candidates.append(g)
+        HR_MERGE_DECISIONS.labels(decision="same" if target is not None else "new").inc()
+        if target is None:
+            target = len(self.groups)
+            self.groups.append([])
+        self.groups[target].append(i)
+        self.ambiguous.update(((g, target), None) for g in candidates if g != target)
+
+    def merged(self, resolve: Optional[Callable[[Sequence[AmbiguousPair]], List[bool]]] = None) -> List[dict]:
+        """Merged positions; ambiguous pairs are decided by ``resolve``, or stay separate."""
+        positions, groups = self.positions, self.groups
+        # Nhóm được model xác nhận trùng thì gộp vào nhóm xuất hiện trước (union-find)
+        parent = list(range(len(groups)))
+
+        def find(g: int) -> int:
+            while parent[g] != g:
+                g = parent[g]
+            return g
+
+        pairs = list(self.ambiguous)
+        if pairs and resolve:
+            answers = resolve([AmbiguousPair(positions[groups[a][0]], positions[groups[b][0]]) for a, b in pairs])
+            for (a, b), same in zip(pairs, answers):
+                HR_MERGE_DECISIONS.labels(decision="llm_same" if same else "llm_different").inc()
+                a, b = find(a), find(b)
+                if same and a != b:
+                    parent[max(a, b)] = min(a, b)
+        elif pairs:
+            HR_MERGE_DECISIONS.labels(decision="ambiguous_kept").inc(len(pairs))
+
+        members_of: Dict[int, List[int]] = {}
+        for g, members in enumerate(groups):
+            members_of.setdefault(find(g), []).extend(members)
+        merged = [_merge_group([positions[i] for i in sorted(members)]) for _, members in sorted(members_of.items())]
+        logger.info(f"HR merge: {len(positions)} positions -> {len(merged)} ({len(pairs)} ambiguous pairs)")
+        return merged
+
+
+def merge_hr_requirements(*sources: Sequence[dict],
+                          resolve: Optional[Callable[[Sequence[AmbiguousPair]], List[bool]]] = None) -> List[dict]:
+    """
+    Merge HR position lists (e.g. the HR node's and the technology node's).
+
+    Args:
+        sources: Lists of positions, in priority order.
+        resolve: Decides ambiguous pairs; defaults to ``llm_same_positions``
+            when ``HR_MERGE_LLM_FALLBACK`` is on, else they stay separate.
+
+    Returns:
+        List[dict]: Merged positions.
+    """
+    if resolve is None and EnvSettings().HR_MERGE_LLM_FALLBACK:
+        resolve = llm_same_positions
+    # Mỗi vị trí vào nhóm đầu tiên trùng khớp chắc chắn; cặp nhóm mơ hồ chờ model quyết định
+    groups = PositionGroups([p for source in sources for p in source or []])
+    return groups.merged(resolve)
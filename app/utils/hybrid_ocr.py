@@ -0,0 +1,317 @@
+"""
+Per-page OCR routing for PDFs.
+
+Every page goes to the cheapest engine that handles it well:
+
+- ``text_layer``: the page has a dense, valid native text layer and few
+  images -> ``pymupdf4llm`` (no OCR at all).
+- ``tesseract``: clean single-column scan -> local Tesseract (``vie``), kept
+  only when the mean word confidence is high enough.
+- ``gemini``: low-confidence, multi-column or table-heavy pages -> Gemini
+  Vision through ``convert_pdf_to_text``.
+
+Blank scanned pages are skipped and repeated ones (cover sheets, signature
+pages) OCR'd once, see ``page_fingerprint``. Runs of consecutive pages on the
+same engine are converted together and the results are merged in page
+order. A per-page provenance report is logged.
+"""
+import io
+import json
+from itertools import groupby
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import cv2
+import fitz
+import numpy as np
+import PIL.Image
+import pymupdf4llm
+import pytesseract
+
+from app.config.env import EnvSettings
+from app.utils.logger import get_logger
+from app.utils.metrics import OCR_PAGES, OCR_PAGES_SKIPPED
+from app.utils.orientation import correct_orientation
+from app.utils.page_fingerprint import plan_pages
+from app.utils.pdf_image_to_text_batch import convert_pdf_to_text
+from app.utils.profiler import ContextThreadPoolExecutor
+
+logger = get_logger(__name__)
+
+# Độ phân giải render trang cho Tesseract
+TESSERACT_DPI = 300
+# Trang có ít từ hơn thế này không đủ để tin điểm confidence
+TESSERACT_MIN_WORDS = 20
+# Text layer hợp lệ: tỷ lệ ký tự chữ/số tối thiểu và ký tự lỗi tối đa
+TEXT_LAYER_MIN_ALNUM_RATIO = 0.5
+TEXT_LAYER_MAX_REPLACEMENT_RATIO = 0.01
+# Bảng: số đường kẻ ngang/dọc tối thiểu
+TABLE_MIN_HORIZONTAL_LINES = 4
+TABLE_MIN_VERTICAL_LINES = 3
+# Nhiều cột: tỷ lệ dòng ngắn bắt đầu ở nửa phải trang
+MULTI_COLUMN_RIGHT_LINE_RATIO = 0.2
+
+
+class PageProvenance(NamedTuple):
+    page: int  # 1-based
+    engine: str  # text_layer / tesseract / gemini / blank / duplicate
+    reason: str
+    confidence: Optional[float] = None
+
+
+class HybridOCRResult(NamedTuple):
+    text: str
+    pages: List[PageProvenance]
+
+    def engine_counts(self) -> Dict[str, int]:
+        counts = {}
+        for page in self.pages:
+            counts[page.engine] = counts.get(page.engine, 0) + 1
+        return counts
+
+
+def classify_pdf_page(page, text_threshold=100, image_coverage_threshold=0.3) -> str:
+    """Trang ảnh nếu ít text hoặc ảnh phủ nhiều diện tích trang."""
+    # Không giữ ligature/khoảng trắng/ảnh: chỉ cần độ dài text
+    text_length = len(page.get_text("text", flags=fitz.TEXT_MEDIABOX_CLIP).strip())
+    if text_length < text_threshold:
+        return "image"
+    # Danh sách xref ảnh lấy từ resource của trang, không phải render
+    if not page.get_images():
+        return "text"
+
+    page_rect = page.rect
+    page_area = page_rect.width * page_rect.height
+    if page_area <= 0:
+        return "text"
+    # Một lần duyệt trang cho bbox của mọi ảnh thay vì get_image_bbox từng ảnh
+    images_area = 0
+    for info in page.get_image_info():
+        visible = fitz.Rect(info["bbox"]) & page_rect
+        if not visible.is_empty:
+            images_area += visible.width * visible.height
+    return "image" if images_area / page_area > image_coverage_threshold else "text"
+
+
+def _text_layer_is_valid(text: str) -> bool:
+    """Loại text layer rác (font không map Unicode, OCR nhúng kém chất lượng)."""
+    chars = [ch for ch in text if not ch.isspace()]
+    if not chars:
+        return False
+    alnum_ratio = sum(ch.isalnum() for ch in chars) / len(chars)
+    replacement_ratio = text.count("\ufffd") / len(chars)
+    return alnum_ratio >= TEXT_LAYER_MIN_ALNUM_RATIO and replacement_ratio <= TEXT_LAYER_MAX_REPLACEMENT_RATIO
+
+
+def _render_page(page) -> PIL.Image.Image:
+    pix = page.get_pixmap(matrix=fitz.Matrix(TESSERACT_DPI / 72, TESSERACT_DPI / 72))
+    return PIL.Image.open(io.BytesIO(pix.tobytes()))
+
+
+def _upright_gray(img: PIL.Image.Image) -> PIL.Image.Image:
+    return correct_orientation(img).convert("L")
+
+
+def _count_lines(binary: np.ndarray, kernel_size) -> int:
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, kernel_size)
+    lines = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
+    contours, _ = cv2.findContours(lines, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return len(contours)
+
+
+def _is_table_heavy(gray: np.ndarray) -> bool:
+    """Đếm đường kẻ dài ngang/dọc: trang có lưới bảng thì để Gemini giữ cấu trúc bảng."""
+    binary = cv2.adaptiveThreshold(
+        ~gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 15, -2)
+    height, width = binary.shape
+    horizontal = _count_lines(binary, (max(width // 15, 1), 1))
+    vertical = _count_lines(binary, (1, max(height // 30, 1)))
+    return horizontal >= TABLE_MIN_HORIZONTAL_LINES and vertical >= TABLE_MIN_VERTICAL_LINES
+
+
+def _tesseract_lines(data: dict) -> List[dict]:
+    """Gom các từ của ``image_to_data`` thành dòng (block, par, line)."""
+    lines = {}
+    for i, word in enumerate(data["text"]):
+        if not word.strip():
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        line = lines.setdefault(key, {"words": [], "left": data["left"][i], "right": 0})
+        line["words"].append(word)
+        line["left"] = min(line["left"], data["left"][i])
+        line["right"] = max(line["right"], data["left"][i] + data["width"][i])
+    return [lines[key] | {"key": key} for key in sorted(lines)]
+
+
+def _is_multi_column(lines: List[dict], width: int) -> bool:
+    if not lines:
+        return False
+    right_column = sum(
+        1 for line in lines
+        if line["left"] > width * 0.45 and line["right"] - line["left"] < width * 0.5
+    )
+    return right_column / len(lines) > MULTI_COLUMN_RIGHT_LINE_RATIO
+
+
+def _tesseract_page(img: PIL.Image.Image, lang: str, min_confidence: float):
+    """
+    OCR một trang đã render bằng Tesseract.
+
+    Returns:
+        tuple: (text hoặc None nếu phải chuyển Gemini, lý do, confidence)
+    """
+    gray_img = _upright_gray(img)
+    gray = np.array(gray_img)
+    if _is_table_heavy(gray):
+        return None, "table", None
+
+    data = pytesseract.image_to_data(gray_img, lang=lang, output_type=pytesseract.Output.DICT)
+    confidences = [float(c) for c, w in zip(data["conf"], data["text"]) if w.strip() and float(c) >= 0]
+    if len(confidences) < TESSERACT_MIN_WORDS:
+        return None, "few_words", None
+    confidence = sum(confidences) / len(confidences)
+    if confidence < min_confidence:
+        return None, "low_confidence", confidence
+
+    lines = _tesseract_lines(data)
+    if _is_multi_column(lines, gray.shape[1]):
+        return None, "multi_column", confidence
+
+    paragraphs, previous = [], None
+    for line in lines:
+        paragraph = line["key"][:2]
+        if paragraph != previous:
+            paragraphs.append([])
+            previous = paragraph
+        paragraphs[-1].append(" ".join(line["words"]))
+    return "\n\n".join("\n".join(p) for p in paragraphs), "clean_scan", confidence
+
+
+def _tesseract_pages(pdf_path: str, page_numbers: List[int], settings):
+    """
+    Render các trang ở thread hiện tại (PyMuPDF không an toàn đa luồng) và OCR
+    song song; mỗi lần gọi Tesseract là một tiến trình riêng. Số trang đã render
+    chờ OCR bị giới hạn để không giữ cả tài liệu 300 dpi trong bộ nhớ.
+    """
+    max_workers = max(1, settings.TESSERACT_MAX_WORKERS)
+    results = []
+
+    def page_result(page_num, future):
+        # Tesseract lỗi trên một trang (thiếu gói ngôn ngữ, ảnh hỏng...) chỉ chuyển trang đó sang Gemini
+        try:
+            return page_num, future.result()
+        except Exception as e:
+            logger.warning(f"Tesseract failed on page {page_num + 1} of {pdf_path}: {e}")
+            return page_num, (None, "tesseract_error", None)
+
+    with fitz.open(pdf_path) as pdf_document, \
+            ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = []
+        for page_num in page_numbers:
+            img = _render_page(pdf_document[page_num])
+            pending.append((page_num, executor.submit(
+                _tesseract_page, img, settings.TESSERACT_LANG, settings.TESSERACT_MIN_CONFIDENCE)))
+            if len(pending) >= 2 * max_workers:
+                results.append(page_result(*pending.pop(0)))
+        results.extend(page_result(page_num, future) for page_num, future in pending)
+    return results
+
+
+def convert_pdf(pdf_path: str, document_name: str = "", text_threshold=100,
+                image_coverage_threshold=0.3, pages: Optional[Sequence[int]] = None) -> HybridOCRResult:
+    """
+    Convert a PDF to markdown, routing each page to the text layer, Tesseract
+    or Gemini.
+
+    Args:
+        pdf_path: Path to the PDF file.
+        document_name: Used in the provenance log.
+        pages: Only convert these 0-based pages (a page range of a distributed OCR job).
+
+    Returns:
+        HybridOCRResult: Merged markdown and per-page provenance.
+    """
+    settings = EnvSettings()
+    with fitz.open(pdf_path) as pdf_document:
+        page_numbers = sorted(pages) if pages is not None else list(range(len(pdf_document)))
+        text_layer_pages = set()
+        for page_num in page_numbers:
+            page = pdf_document[page_num]
+            if classify_pdf_page(page, text_threshold, image_coverage_threshold) == "text" and \
+                    _text_layer_is_valid(page.get_text("text", flags=fitz.TEXT_MEDIABOX_CLIP)):
+                text_layer_pages.add(page_num)
+        # Trang scan trắng hoặc trùng trang trước: quyết định trên thumbnail, trước khi OCR
+        plan = plan_pages(pdf_document, [p for p in page_numbers if p not in text_layer_pages])
+
+    provenance: Dict[int, PageProvenance] = {}
+    page_texts: Dict[int, str] = {}
+    for page_num in text_layer_pages:
+        provenance[page_num] = PageProvenance(page_num + 1, "text_layer", "dense_text_layer")
+    for page_num in plan.blank_pages:
+        provenance[page_num] = PageProvenance(page_num + 1, "blank", "no_ink")
+    for page_num, source in plan.duplicates.items():
+        provenance[page_num] = PageProvenance(page_num + 1, "duplicate", f"same_as_page_{source + 1}")
+
+    scan_pages = plan.ocr_pages
+    if scan_pages and settings.TESSERACT_ENABLED:
+        for page_num, (text, reason, confidence) in _tesseract_pages(pdf_path, scan_pages, settings):
+            if text is not None:
+                page_texts[page_num] = text
+                provenance[page_num] = PageProvenance(page_num + 1, "tesseract", reason, confidence)
+            else:
+                provenance[page_num] = PageProvenance(page_num + 1, "gemini", reason, confidence)
+    else:
+        for page_num in scan_pages:
+            provenance[page_num] = PageProvenance(page_num + 1, "gemini", "tesseract_disabled")
+
+    # Ghép theo thứ tự trang, mỗi đoạn trang liên tiếp cùng engine chuyển đổi một lần.
+    # Trang gốc của trang trùng qua Gemini được chuyển đổi riêng để dùng lại text
+    duplicate_sources = plan.duplicate_sources
+
+    def run_key(page_num):
+        engine = provenance[page_num].engine
+        return engine, page_num if engine == "gemini" and page_num in duplicate_sources else None
+
+    parts = []
+    for (engine, _), run in groupby(page_numbers, key=run_key):
+        run_pages = list(run)
+        if engine == "text_layer":
+            parts.append(pymupdf4llm.to_markdown(pdf_path, pages=run_pages))
+        elif engine == "gemini":
+            # Các trang này đã qua plan_pages ở trên: dùng lại plan, không render thumbnail lần nữa
+            text = convert_pdf_to_text(pdf_path, pages=run_pages, plan=plan)
+            if len(run_pages) == 1:
+                page_texts[run_pages[0]] = text
+            parts.append(text)
+        elif engine == "duplicate":
+            parts.append("\n\n".join(page_texts.get(plan.duplicates[p], "") for p in run_pages))
+        elif engine == "tesseract":
+            parts.append("\n\n".join(page_texts[p] for p in run_pages))
+
+    result = HybridOCRResult(
+        text="\n\n".join(part for part in parts if part),
+        pages=[provenance[p] for p in page_numbers],
+    )
+    for engine, count in result.engine_counts().items():
+        if engine in ("blank", "duplicate"):
+            OCR_PAGES_SKIPPED.labels(reason=engine).inc(count)
+        else:
+            OCR_PAGES.labels(engine=engine).inc(count)
+    _log_provenance(document_name or pdf_path, result)
+    return result
+
+
+def _log_provenance(document_name: str, result: HybridOCRResult):
+    record = {
+        "document": document_name,
+        "engines": result.engine_counts(),
+        "pages": [
+            {
+                "page": p.page,
+                "engine": p.engine,
+                "reason": p.reason,
+                "confidence": round(p.confidence, 1) if p.confidence is not None else None,
+            }
+            for p in result.pages
+        ],
+    }
+    logger.info("OCR_PROVENANCE " + json.dumps(record, ensure_ascii=False))
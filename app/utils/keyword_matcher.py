@@ -0,0 +1,151 @@
+"""
+Keyword matching for classification.
+
+``document_type`` classifies a whole document with the chain of ``in``
+checks of ``classify_document_from_text``; its regexes are compiled once and
+anchored on a rare character. A single-pass Aho-Corasick scan of every
+signal was measured slower (~20 vs ~6 ms/MB, see
+``benchmarks/bench_keyword_matcher.py``) because the chain stops at the first
+decisive rule and ``in`` is memchr-accelerated.
+
+``ChapterTypeMatcher`` maps chapter titles to chapter types for the chapter
+splitter. Titles and keywords are folded the same way (no diacritics, no
+markdown/punctuation, "Chương III" == "CHUONG 3"), so OCR variants of a
+heading still match its keyword.
+"""
+import json
+import re
+import unicodedata
+from functools import lru_cache
+from typing import List, Optional, Sequence, Union
+
+import ahocorasick
+
+
+# Từ mở đầu tiêu đề chương/phần, theo sau là số La Mã hoặc số Ả Rập
+_NUMBERED_HEADING = re.compile(r"\b(chuong|phan|chapter|part|muc)\s+([ivxlc]+|\d+)\b")
+_ROMAN_VALUES = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100}
+# Ký tự markdown / dấu câu coi như khoảng trắng
+_TITLE_PUNCTUATION = re.compile(r"[#*_`>|\[\]().,:;\-–—/\\]+")
+
+
+def _roman_to_int(numeral: str) -> Optional[int]:
+    total = 0
+    for current, following in zip(numeral, numeral[1:] + " "):
+        value = _ROMAN_VALUES[current]
+        total += -value if _ROMAN_VALUES.get(following, 0) > value else value
+    return total or None
+
+
+def _arabic_number(match: re.Match) -> str:
+    numeral = match.group(2)
+    number = int(numeral) if numeral.isdigit() else _roman_to_int(numeral)
+    return f"{match.group(1)} {number}" if number else match.group(0)
+
+
+def fold_title(text: str) -> str:
+    """
+    Fold a heading for matching: lowercase, no diacritics (``đ`` -> ``d``),
+    markdown and punctuation as spaces, numbers after Chương/Phần in arabic
+    without leading zeros.
+    """
+    text = unicodedata.normalize("NFD", text or "").lower().replace("đ", "d")
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = " ".join(_TITLE_PUNCTUATION.sub(" ", text).split())
+    return _NUMBERED_HEADING.sub(_arabic_number, text)
+
+
+class ChapterTypeMatcher:
+    """
+    Compile a chapter keyword/type map once.
+
+    Args:
+        keyword_type_map: ``[{"keyword": str | [str], "type": str}, ...]`` (or a
+            single dict). When a title matches several entries the first entry
+            wins, as with the former loop over the map.
+    """
+
+    def __init__(self, keyword_type_map: Union[dict, Sequence[dict]]):
+        if isinstance(keyword_type_map, dict):
+            keyword_type_map = [keyword_type_map]
+        self.types = [entry.get("type", "default_type") for entry in keyword_type_map]
+        self._automaton = ahocorasick.Automaton()
+        for priority, entry in enumerate(keyword_type_map):
+            keywords = entry.get("keyword", "")
+            for keyword in [keywords] if isinstance(keywords, str) else keywords:
+                key = fold_title(keyword)
+                if not key:
+                    continue
+                if self._automaton.exists(key):
+                    # Cùng keyword ở nhiều mục: giữ mục đứng trước
+                    continue
+                self._automaton.add_word(key, (len(key), priority))
+        self._empty = not len(self._automaton)
+        if not self._empty:
+            self._automaton.make_automaton()
+
+    def classify(self, title: str) -> Optional[str]:
+        """Type of the first map entry with a keyword in ``title``, or None."""
+        if self._empty:
+            return None
+        folded = fold_title(title)
+        best = None
+        for end, (length, priority) in self._automaton.iter(folded):
+            # "chuong 1" không được khớp "chuong 12"
+            if folded[end].isdigit() and end + 1 < len(folded) and folded[end + 1].isdigit():
+                continue
+            if best is None or priority < best:
+                best = priority
+        return None if best is None else self.types[best]
+
+    def classify_all(self, titles: Sequence[str]) -> List[Optional[str]]:
+        return [self.classify(title) for title in titles]
+
+
+@lru_cache(maxsize=8)
+def _compiled_chapter_matcher(config: str) -> ChapterTypeMatcher:
+    return ChapterTypeMatcher(json.loads(config))
+
+
+def get_chapter_type_matcher(keyword_type_map: Union[dict, Sequence[dict]]) -> ChapterTypeMatcher:
+    """Matcher compiled once per process for a given map, recompiled when the map changes."""
+    return _compiled_chapter_matcher(json.dumps(keyword_type_map, sort_keys=True, ensure_ascii=False))
+
+
+# Tín hiệu phân loại hồ sơ (HSMT / TBMT / HSKT / TCDGKT), dùng bởi classify_document_from_text
+HSMT_SECTION_KEYWORDS = ["chỉ dẫn nhà thầu", "chỉ dẫn đối với nhà thầu", "bảng dữ liệu đấu thầu", "phần 1:", "phần 2:"]
+TBMT_DETAIL_KEYWORDS = [
+    "gói thầu", "đóng thầu", "mở thầu", "ngày tháng năm", "đấu thầu", "giá dự toán",
+    "địa điểm phát hành", "địa điểm nộp", "bảo đảm dự thầu", "thời gian thực hiện",
+]
+# Ngày "12/05/2025" và giờ "09:30". Bắt đầu bằng dấu phân cách (hiếm) rồi mới nhìn lại chữ số
+# phía trước: cùng kết quả với \d{1,2}[/-]\d{1,2}[/-]\d{2,4} và \d{1,2}:\d{2}, nhưng không thử lại
+# ở mọi chữ số trong bảng
+DATE_PATTERN = re.compile(r"[/-](?<=\d[/-])\d{1,2}[/-]\d{2,4}")
+TIME_PATTERN = re.compile(r":(?<=\d:)\d{2}")
+# Bao gồm "hồ sơ kỹ thuật", "yêu cầu về kỹ thuật", "thuyết minh kỹ thuật"...
+KY_THUAT_PATTERN = re.compile(r"k[ỹy]\s*thu[ậa]t")
+
+
+def document_type(text: str) -> str:
+    """
+    Document type (TCDGKT / HSMT / TBMT / HSKT / unknown) of a whole text.
+
+    Chain of ``in`` checks on the lowercased text, evaluated lazily: it stops
+    at the first decisive rule, and ``in`` is faster per megabyte than a
+    single Aho-Corasick pass over every signal.
+    """
+    text_lower = (text or "").lower()
+    if "tiêu chuẩn đánh giá về kỹ thuật" in text_lower and "chỉ dẫn nhà thầu" not in text_lower:
+        return "TCDGKT"
+    # HSMT phải có các mục đặc trưng ngoài tiêu đề
+    if "hồ sơ mời thầu" in text_lower and any(keyword in text_lower for keyword in HSMT_SECTION_KEYWORDS):
+        return "HSMT"
+    # TBMT: tiêu đề mời thầu kèm ngày giờ hoặc chi tiết gói thầu
+    if "thông báo mời thầu" in text_lower and (
+            any(keyword in text_lower for keyword in TBMT_DETAIL_KEYWORDS)
+            or DATE_PATTERN.search(text_lower) or TIME_PATTERN.search(text_lower)):
+        return "TBMT"
+    if "tiêu chuẩn đánh giá" not in text_lower and KY_THUAT_PATTERN.search(text_lower):
+        return "HSKT"
+    return "unknown"
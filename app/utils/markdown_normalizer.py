@@ -0,0 +1,194 @@
+"""
+Token-reducing normalisation of OCR / PDF markdown before it is stored in the
+``markdown`` bucket.
+
+- Unicode NFC (Vietnamese diacritics from OCR often arrive decomposed),
+  zero-width characters and non-breaking spaces removed.
+- Page markers ("--- PAGE BREAK ---", "## Pages 1 to 2", pymupdf4llm "-----")
+  and page-number lines removed.
+- Header/footer lines repeated across pages removed (first occurrence kept).
+- Markdown table padding compacted, whitespace runs and blank lines collapsed.
+"""
+import re
+import unicodedata
+from collections import Counter
+from typing import List, NamedTuple
+
+from app.utils.logger import get_logger
+from app.utils.metrics import MARKDOWN_NORMALIZER_TOKENS
+from app.utils.tokens import count_tokens
+
+logger = get_logger(__name__)
+
+PAGE_MARKER_PATTERN = re.compile(
+    r"^\s*(?:-{3,}\s*PAGE\s*BREAK\s*-{3,}|-{5,}|#{1,6}\s*Pages?\s+\d+(?:\s+to\s+\d+)?)\s*$",
+    re.IGNORECASE,
+)
+# "12", "- 12 -", "Trang 3", "Trang 3/45", "Page 3 of 45", "3 / 45"
+PAGE_NUMBER_PATTERN = re.compile(
+    r"^\s*[-–—]?\s*(?:trang|page)?\s*\d{1,4}\s*(?:(?:/|of|trên)\s*\d{1,4})?\s*[-–—]?\s*$",
+    re.IGNORECASE,
+)
+EXPLICIT_PAGE_NUMBER_PATTERN = re.compile(
+    r"^\s*(?:trang|page)\s+\d{1,4}\s*(?:(?:/|of|trên)\s*\d{1,4})?\s*$", re.IGNORECASE
+)
+ZERO_WIDTH_PATTERN = re.compile("[\u200b\u200c\u200d\u2060\ufeff]")
+INLINE_SPACES_PATTERN = re.compile(r"(?<=\S)[ \t]{2,}")
+BLANK_LINES_PATTERN = re.compile(r"\n{3,}")
+TABLE_CELL_SPLIT_PATTERN = re.compile(r"(?<!\\)\|")
+TABLE_SEPARATOR_CELL_PATTERN = re.compile(r"^:?-{1,}:?$")
+
+# Số dòng đầu/cuối tối đa mỗi trang được xét là header/footer
+EDGE_LINES = 2
+# Header/footer phải có ít nhất chừng này chữ cái (tránh xóa nhầm dòng số liệu)
+MIN_LETTERS = 4
+# Một dòng xuất hiện ở đầu/cuối >= tỷ lệ số trang này thì là header/footer lặp lại
+REPEAT_RATIO = 0.5
+MIN_PAGES_FOR_REPEAT = 3
+
+
+class NormalizationResult(NamedTuple):
+    text: str
+    tokens_before: int
+    tokens_after: int
+    pages: int
+    header_footer_lines_removed: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+def _line_key(line: str) -> str:
+    """Khóa so sánh header/footer: bỏ số (số trang thay đổi), chữ thường, gộp khoảng trắng."""
+    key = re.sub(r"\d+", "#", line.strip().lower())
+    return re.sub(r"\s+", " ", key)
+
+
+def _split_pages(lines: List[str]) -> List[List[str]]:
+    pages, current = [], []
+    for line in lines:
+        if PAGE_MARKER_PATTERN.match(line):
+            pages.append(current)
+            current = []
+        else:
+            current.append(line)
+    pages.append(current)
+    return [page for page in pages if any(l.strip() for l in page)]
+
+
+def _edge_indexes(page: List[str]) -> List[int]:
+    """
+    Vị trí các dòng không rỗng nằm trong vùng header/footer của trang.
+    Trang ngắn chỉ xét ít dòng hơn để không chạm vào nội dung chính.
+    """
+    non_empty = [i for i, line in enumerate(page) if line.strip()]
+    edge = max(1, min(EDGE_LINES, len(non_empty) // 4))
+    return sorted(set(non_empty[:edge] + non_empty[-edge:]))
+
+
+def _is_header_footer_candidate(line: str) -> bool:
+    """Dòng bảng và dòng gần như chỉ có số không bao giờ được coi là header/footer."""
+    stripped = line.strip()
+    if stripped.startswith("|"):
+        return False
+    return sum(ch.isalpha() for ch in stripped) >= MIN_LETTERS
+
+
+def _remove_headers_footers(pages: List[List[str]]):
+    removed = 0
+    if len(pages) >= MIN_PAGES_FOR_REPEAT:
+        counts = Counter()
+        for page in pages:
+            counts.update({
+                _line_key(page[i]) for i in _edge_indexes(page)
+                if _is_header_footer_candidate(page[i])
+            })
+        threshold = max(MIN_PAGES_FOR_REPEAT, REPEAT_RATIO * len(pages))
+        repeated = {key for key, n in counts.items() if n >= threshold}
+    else:
+        repeated = set()
+
+    seen = set()
+    for page in pages:
+        drop = set()
+        for i in _edge_indexes(page):
+            line = page[i]
+            if PAGE_NUMBER_PATTERN.match(line):
+                drop.add(i)
+                continue
+            key = _line_key(line)
+            if key in repeated and _is_header_footer_candidate(line):
+                if key in seen:
+                    drop.add(i)
+                    removed += 1
+                seen.add(key)
+        if drop:
+            page[:] = [line for i, line in enumerate(page) if i not in drop]
+    return removed
+
+
+def _compact_table_row(line: str) -> str:
+    stripped = line.strip()
+    cells = [cell.strip() for cell in TABLE_CELL_SPLIT_PATTERN.split(stripped)]
+    # Bỏ phần tử rỗng do dấu | ở đầu/cuối dòng
+    if cells and cells[0] == "":
+        cells = cells[1:]
+    if cells and cells[-1] == "" and stripped.endswith("|"):
+        cells = cells[:-1]
+    cells = [
+        (cell[0] if cell.startswith(":") else "") + "---" + (":" if cell.endswith(":") else "")
+        if TABLE_SEPARATOR_CELL_PATTERN.match(cell) else INLINE_SPACES_PATTERN.sub(" ", cell)
+        for cell in cells
+    ]
+    return "|" + "|".join(cells) + "|"
+
+
+def _compact_line(line: str) -> str:
+    line = line.rstrip()
+    if line.lstrip().startswith("|"):
+        return _compact_table_row(line)
+    return INLINE_SPACES_PATTERN.sub(" ", line)
+
+
+def normalize_markdown(text: str, document_name: str = "") -> NormalizationResult:
+    """
+    Normalise markdown produced by OCR or ``pymupdf4llm`` to reduce tokens.
+
+    Args:
+        text: Markdown/plain text of one document.
+        document_name: Used in the log line.
+
+    Returns:
+        NormalizationResult: Normalised text and token statistics.
+    """
+    if not text:
+        return NormalizationResult(text or "", 0, 0, 0, 0)
+    tokens_before = count_tokens(text)
+
+    text = unicodedata.normalize("NFC", text)
+    text = ZERO_WIDTH_PATTERN.sub("", text).replace("\u00a0", " ")
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+
+    pages = _split_pages(text.split("\n"))
+    removed = _remove_headers_footers(pages)
+
+    lines = []
+    for page in pages:
+        lines.extend(
+            _compact_line(line) for line in page
+            if not EXPLICIT_PAGE_NUMBER_PATTERN.match(line)
+        )
+        lines.append("")
+    normalized = BLANK_LINES_PATTERN.sub("\n\n", "\n".join(lines)).strip() + "\n"
+
+    tokens_after = count_tokens(normalized)
+    MARKDOWN_NORMALIZER_TOKENS.labels(kind="before").inc(tokens_before)
+    MARKDOWN_NORMALIZER_TOKENS.labels(kind="after").inc(tokens_after)
+    saved_pct = (tokens_before - tokens_after) / tokens_before * 100 if tokens_before else 0
+    logger.info(
+        f"Normalized markdown {document_name}: {len(pages)} pages, "
+        f"{removed} header/footer lines removed, tokens {tokens_before} -> {tokens_after} "
+        f"(saved {tokens_before - tokens_after}, {saved_pct:.1f}%)"
+    )
+    return NormalizationResult(normalized, tokens_before, tokens_after, len(pages), removed)
@@ -0,0 +1,445 @@
+"""
+Prometheus metrics for the proposal pipeline.
+
+Every consumer process (classify, chapter splitter, extraction, sql answer,
+send mail) exposes a ``/metrics`` endpoint through ``start_metrics_server``.
+The helpers below are the single instrumentation layer used by the queue
+consumers, the LangGraph nodes, the LLM/OCR calls, the Postgres helpers and
+the MinIO helpers, and the ``histories`` table is written from the same
+``PipelineStep`` timer.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+from app.config.env import EnvSettings
+from app.utils.logger import get_logger
+from app.utils.profiler import begin_span, end_span, span
+
+logger = get_logger(__name__)
+
+# Buckets tuned for the pipeline: queue messages and graph nodes take seconds
+# to tens of minutes, DB statements and object store calls take milliseconds.
+LONG_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+SHORT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LLM_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+MESSAGE_LATENCY = Histogram(
+    "ai_proposal_message_processing_seconds",
+    "Thời gian xử lý một message theo queue",
+    ["queue", "status"],
+    buckets=LONG_BUCKETS,
+)
+MESSAGES_IN_FLIGHT = Gauge(
+    "ai_proposal_messages_in_flight",
+    "Số message đang được xử lý theo queue",
+    ["queue"],
+)
+PIPELINE_STEP_DURATION = Histogram(
+    "ai_proposal_pipeline_step_seconds",
+    "Thời gian của từng bước được ghi vào bảng histories",
+    ["step", "status"],
+    buckets=LONG_BUCKETS,
+)
+NODE_DURATION = Histogram(
+    "ai_proposal_graph_node_seconds",
+    "Thời gian chạy của từng node LangGraph",
+    ["graph", "node", "status"],
+    buckets=LONG_BUCKETS,
+)
+NODES_IN_FLIGHT = Gauge(
+    "ai_proposal_graph_nodes_in_flight",
+    "Số node LangGraph đang chạy",
+    ["graph", "node"],
+)
+LLM_LATENCY = Histogram(
+    "ai_proposal_llm_call_seconds",
+    "Độ trễ của từng lần gọi LLM (OpenAI/Gemini)",
+    ["provider", "model", "node", "status"],
+    buckets=LLM_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "ai_proposal_llm_tokens_total",
+    "Số token đã dùng theo node",
+    ["provider", "model", "node", "kind"],
+)
+LLM_IN_FLIGHT = Gauge(
+    "ai_proposal_llm_calls_in_flight",
+    "Số lần gọi LLM đang chờ kết quả",
+    ["provider"],
+)
+DB_LATENCY = Histogram(
+    "ai_proposal_db_statement_seconds",
+    "Độ trễ của câu lệnh Postgres",
+    ["operation", "status"],
+    buckets=SHORT_BUCKETS,
+)
+OBJECT_STORE_LATENCY = Histogram(
+    "ai_proposal_object_store_seconds",
+    "Thời gian truyền file với MinIO",
+    ["operation", "bucket", "status"],
+    buckets=SHORT_BUCKETS + (30, 60, 120),
+)
+OBJECT_STORE_BYTES = Counter(
+    "ai_proposal_object_store_bytes_total",
+    "Số byte truyền với MinIO",
+    ["operation", "bucket"],
+)
+MARKDOWN_NORMALIZER_TOKENS = Counter(
+    "ai_proposal_markdown_normalizer_tokens_total",
+    "Số token markdown trước/sau khi chuẩn hóa",
+    ["kind"],
+)
+OCR_PAGES = Counter(
+    "ai_proposal_ocr_pages_total",
+    "Số trang PDF đã chuyển đổi theo engine (text_layer, tesseract, gemini)",
+    ["engine"],
+)
+
+OCR_PAGES_SKIPPED = Counter(
+    "ai_proposal_ocr_pages_skipped_total",
+    "Số trang không render/OCR vì là trang trắng hoặc trùng một trang trước trong tài liệu",
+    ["reason"],
+)
+
+OCR_DISTRIBUTED_PARTS = Counter(
+    "ai_proposal_ocr_distributed_parts_total",
+    "Các phần OCR phân tán theo kết quả (completed, redispatched, local_fallback, no_consumer)",
+    ["outcome"],
+)
+
+OCR_BATCH_RETRIES = Counter(
+    "ai_proposal_ocr_batch_retries_total",
+    "Số lần retry request OCR Gemini theo lý do (loại lỗi, hoặc split khi chia đôi batch)",
+    ["reason"],
+)
+SECTION_STORE_LOOKUPS = Counter(
+    "ai_proposal_section_store_lookups_total",
+    "Số mục tra trong kho fingerprint theo node (hit: dùng lại kết quả bóc tách, miss: gửi cho model)",
+    ["node", "outcome"],
+)
+DOSSIER_FINGERPRINT_LOOKUPS = Counter(
+    "ai_proposal_dossier_fingerprint_lookups_total",
+    "Tra cứu fingerprint hồ sơ (file: dùng lại markdown đã chuyển đổi; dossier: duplicate, amendment, new)",
+    ["kind", "outcome"],
+)
+HR_MERGE_DECISIONS = Counter(
+    "ai_proposal_hr_merge_decisions_total",
+    "Quyết định gộp vị trí nhân sự (same/new: cục bộ; llm_same/llm_different: cặp mơ hồ do model quyết định)",
+    ["decision"],
+)
+LLM_CASCADE_ATTEMPTS = Counter(
+    "ai_proposal_llm_cascade_attempts_total",
+    "Số lần gọi model trong cascade theo node, model và kết quả (accepted, invalid, empty, truncated, error, repaired, continuation_*)",
+    ["node", "model", "outcome"],
+)
+LLM_CASCADE_CALLS = Counter(
+    "ai_proposal_llm_cascade_calls_total",
+    "Số lần bóc tách qua cascade theo node (first_try, escalated, partial, failed); tỷ lệ nâng cấp = (tổng - first_try) / tổng",
+    ["node", "result"],
+)
+LLM_STREAM_FIRST_ITEM = Histogram(
+    "ai_proposal_llm_stream_first_item_seconds",
+    "Thời gian từ lúc gọi model đến khi phần tử đầu tiên của kết quả stream đóng lại, theo node",
+    ["node"],
+    buckets=LLM_BUCKETS,
+)
+LLM_STREAM_ABORTS = Counter(
+    "ai_proposal_llm_stream_aborts_total",
+    "Số lần dừng stream do model bị lặp (repeated_item: phần tử lặp lại, looping_text: văn bản lặp)",
+    ["node", "reason"],
+)
+CLASSIFY_TRIAGE_DECISIONS = Counter(
+    "ai_proposal_classify_triage_decisions_total",
+    "Quyết định phân loại nhanh trước khi chuyển đổi toàn bộ file",
+    ["decision", "reason"],
+)
+
+# Node đang chạy trong thread hiện tại, dùng để gán nhãn cho các lần gọi LLM
+# khi callback không mang theo metadata của LangGraph.
+current_node: ContextVar[str] = ContextVar("current_node", default="unknown")
+
+_server_lock = threading.Lock()
+_server_port = None
+
+
+def start_metrics_server(default_port: int):
+    """
+    Start the ``/metrics`` HTTP endpoint for this process.
+
+    Args:
+        default_port: Port used when ``METRICS_PORT`` is not set. Each consumer
+            passes its own default so several consumers can share a host.
+
+    Returns:
+        int | None: The port the endpoint listens on, or None when disabled.
+    """
+    global _server_port
+    settings = EnvSettings()
+    if not settings.METRICS_ENABLED:
+        logger.info("Metrics endpoint disabled (METRICS_ENABLED=false)")
+        return None
+    with _server_lock:
+        if _server_port is not None:
+            return _server_port
+        port = settings.METRICS_PORT or default_port
+        try:
+            start_http_server(port)
+        except OSError as e:
+            logger.error(f"Could not start metrics endpoint on port {port}: {e}")
+            return None
+        _server_port = port
+        logger.info(f"Metrics endpoint listening on :{port}/metrics")
+        return port
+
+
+@contextmanager
+def observe_message(queue: str):
+    """Time the processing of one queue message and track in-flight count."""
+    MESSAGES_IN_FLIGHT.labels(queue=queue).inc()
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        MESSAGE_LATENCY.labels(queue=queue, status=status).observe(
+            time.perf_counter() - start)
+        MESSAGES_IN_FLIGHT.labels(queue=queue).dec()
+
+
+@contextmanager
+def observe_db(operation: str):
+    """Time one Postgres statement, labelled by its leading SQL keyword."""
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        with span(f"sql {operation}", "db"):
+            yield
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        DB_LATENCY.labels(operation=operation, status=status).observe(
+            time.perf_counter() - start)
+
+
+class ObjectStoreTransfer:
+    """Mutable holder so callers can report the transferred size once known."""
+
+    def __init__(self):
+        self.bytes = 0
+
+
+@contextmanager
+def observe_object_store(operation: str, bucket: str):
+    """
+    Time one MinIO upload/download.
+
+    Usage:
+        with observe_object_store("upload", bucket) as transfer:
+            ...
+            transfer.bytes = os.path.getsize(path)
+    """
+    transfer = ObjectStoreTransfer()
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        with span(f"{operation} {bucket}", "object_store") as current:
+            yield transfer
+            if current is not None:
+                current.args["bytes"] = transfer.bytes
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        OBJECT_STORE_LATENCY.labels(
+            operation=operation, bucket=bucket or "", status=status
+        ).observe(time.perf_counter() - start)
+        if transfer.bytes:
+            OBJECT_STORE_BYTES.labels(
+                operation=operation, bucket=bucket or "").inc(transfer.bytes)
+
+
+class LLMCall:
+    """Holder for the token usage of one LLM call."""
+
+    def __init__(self, provider: str, model: str, node: str):
+        self.provider = provider
+        self.model = model
+        self.node = node
+
+    def record_tokens(self, prompt_tokens=0, completion_tokens=0):
+        """Add token usage reported by the provider."""
+        record_llm_tokens(self.provider, self.model, self.node,
+                          prompt_tokens, completion_tokens)
+
+
+def record_llm_tokens(provider, model, node, prompt_tokens=0, completion_tokens=0):
+    """Add prompt/completion token counts for one call."""
+    if prompt_tokens:
+        LLM_TOKENS.labels(provider=provider, model=model, node=node,
+                          kind="prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(provider=provider, model=model, node=node,
+                          kind="completion").inc(completion_tokens)
+
+
+@contextmanager
+def observe_llm_call(provider: str, model: str, node: str = None):
+    """Time one direct LLM call (used for Gemini OCR, which has no callbacks)."""
+    call = LLMCall(provider, model, node or current_node.get())
+    LLM_IN_FLIGHT.labels(provider=provider).inc()
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        with span(f"{provider}:{model}", "llm", node=call.node):
+            yield call
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        LLM_LATENCY.labels(provider=provider, model=model, node=call.node,
+                           status=status).observe(time.perf_counter() - start)
+        LLM_IN_FLIGHT.labels(provider=provider).dec()
+
+
+class LLMMetricsCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback that records latency and token usage of chat model calls.
+
+    The node label comes from the ``langgraph_node`` metadata LangGraph attaches
+    to every run, falling back to the node recorded by ``instrument_node``.
+    """
+
+    def __init__(self, provider: str = "openai"):
+        self.provider = provider
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._start_run(serialized, run_id, metadata, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._start_run(serialized, run_id, metadata, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run = self._finish_run(run_id, "ok")
+        if run is None:
+            return
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        end_span(run["span"], prompt_tokens=usage.get("prompt_tokens", 0),
+                 completion_tokens=usage.get("completion_tokens", 0))
+        record_llm_tokens(self.provider, run["model"], run["node"],
+                          usage.get("prompt_tokens", 0),
+                          usage.get("completion_tokens", 0))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        run = self._finish_run(run_id, "error")
+        if run is not None:
+            end_span(run["span"], error=str(error)[:200])
+
+    def _start_run(self, serialized, run_id, metadata, kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = (params.get("model_name") or params.get("model")
+                 or (metadata or {}).get("ls_model_name") or "unknown")
+        node = (metadata or {}).get("langgraph_node") or current_node.get()
+        with self._lock:
+            self._runs[run_id] = {"model": model, "node": node,
+                                  "start": time.perf_counter(),
+                                  "span": begin_span(f"{self.provider}:{model}",
+                                                     "llm", node=node)}
+        LLM_IN_FLIGHT.labels(provider=self.provider).inc()
+
+    def _finish_run(self, run_id, status):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return None
+        LLM_IN_FLIGHT.labels(provider=self.provider).dec()
+        LLM_LATENCY.labels(provider=self.provider, model=run["model"],
+                           node=run["node"], status=status).observe(
+            time.perf_counter() - run["start"])
+        return run
+
+
+def instrument_node(graph: str, node):
+    """
+    Wrap a LangGraph node so its duration and in-flight count are recorded.
+
+    Args:
+        graph: Name of the graph, used as a label.
+        node: Node instance (callable with a ``name`` attribute).
+
+    Returns:
+        Callable[[dict], dict]: Callable to pass to ``builder.add_node``.
+    """
+    name = getattr(node, "name", type(node).__name__)
+
+    def run_node(state):
+        token = current_node.set(name)
+        NODES_IN_FLIGHT.labels(graph=graph, node=name).inc()
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            with span(name, "node", graph=graph):
+                result = node(state)
+            # Các node tự bắt lỗi và trả về error_messages thay vì raise
+            if isinstance(result, dict) and result.get("error_messages"):
+                status = "error"
+            return result
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            NODE_DURATION.labels(graph=graph, node=name, status=status).observe(
+                time.perf_counter() - start)
+            NODES_IN_FLIGHT.labels(graph=graph, node=name).dec()
+            current_node.reset(token)
+
+    run_node.__name__ = name
+    return run_node
+
+
+class PipelineStep:
+    """
+    One row of the ``histories`` table together with its duration metric.
+
+    The row is inserted on creation; ``finish()`` writes ``endDate`` and records
+    the step duration. A step that is never finished keeps an open row, as
+    before, and is recorded with status ``unfinished`` by ``close()``.
+    """
+
+    def __init__(self, hs_id: str, step: str):
+        # Import muộn để tránh vòng lặp import (postgre dùng observe_db)
+        from app.storage import postgre
+
+        self._postgre = postgre
+        self.hs_id = hs_id
+        self.step = step
+        self.done = False
+        self._start = time.perf_counter()
+        self.history_id = postgre.insertHistorySQL(hs_id=hs_id, step=step)
+
+    def finish(self):
+        """Mark the step as completed in ``histories`` and record its duration."""
+        if self.done:
+            return
+        self.done = True
+        PIPELINE_STEP_DURATION.labels(step=self.step, status="ok").observe(
+            time.perf_counter() - self._start)
+        self._postgre.updateHistoryEndDateSQL(self.history_id)
+
+    def close(self):
+        """Record the duration of a step that ended without ``finish()``."""
+        if self.done:
+            return
+        self.done = True
+        PIPELINE_STEP_DURATION.labels(step=self.step, status="unfinished").observe(
+            time.perf_counter() - self._start)
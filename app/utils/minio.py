@@ -1,5 +1,8 @@
 import os
+import threading
 from datetime import datetime
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
 
 import boto3
 
@@ -7,10 +10,60 @@ import boto3
 from botocore.client import Config
 
 from app.utils.logger import get_logger
+from app.utils.metrics import observe_object_store
+from app.utils.profiler import ContextThreadPoolExecutor
 
 # Initialize logger
 logger = get_logger(__name__)
 
+# Bucket đã kiểm tra/tạo trong process này: không head_bucket lại mỗi lần upload
+_known_buckets = set()
+_known_buckets_lock = threading.Lock()
+
+
+@lru_cache(maxsize=8)
+def get_s3_client(minio_endpoint, access_key, secret_key, region=None):
+    """
+    Shared boto3 S3 client for a MinIO endpoint (boto3 clients are thread-safe).
+    Created once per process and credentials instead of once per upload.
+    """
+    return boto3.client(
+        's3',
+        endpoint_url=minio_endpoint,
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+        region_name=region,
+        config=Config(signature_version='s3v4', max_pool_connections=32)
+    )
+
+
+def ensure_bucket(s3_client, bucket_name):
+    """Create the bucket if it does not exist (checked once per process)."""
+    with _known_buckets_lock:
+        if bucket_name in _known_buckets:
+            return
+    try:
+        s3_client.head_bucket(Bucket=bucket_name)
+    except Exception:
+        s3_client.create_bucket(Bucket=bucket_name)
+        logger.info(f"Created bucket: {bucket_name}")
+    with _known_buckets_lock:
+        _known_buckets.add(bucket_name)
+
+
+def _content_type(file_name):
+    """Guess content type based on file extension"""
+    file_ext = os.path.splitext(file_name)[1].lower()
+    if file_ext in ['.pdf']:
+        return 'application/pdf'
+    if file_ext in ['.jpg', '.jpeg']:
+        return 'image/jpeg'
+    if file_ext in ['.png']:
+        return 'image/png'
+    if file_ext in ['.txt']:
+        return 'text/plain'
+    return None
+
 
 def download_from_minio(object_name, download_path, bucket_name, minio_endpoint,
                         access_key, secret_key, region=None):
@@ -55,7 +108,9 @@ def download_from_minio(object_name, download_path, bucket_name, minio_endpoint,
             return None
 
         # Download the file
-        s3_client.download_file(bucket_name, object_name, download_path)
+        with observe_object_store("download", bucket_name) as transfer:
+            s3_client.download_file(bucket_name, object_name, download_path)
+            transfer.bytes = obj_size
 
         # Verify download
         if not os.path.exists(download_path):
@@ -101,25 +156,14 @@ def upload_to_minio(file_paths, bucket_name, minio_endpoint, access_key, secret_
     if isinstance(file_paths, str):
         file_paths = [file_paths]
 
-    # Create S3 client for MinIO
-    s3_client = boto3.client(
-        's3',
-        endpoint_url=minio_endpoint,
-        aws_access_key_id=access_key,
-        aws_secret_access_key=secret_key,
-        region_name=region,
-        config=Config(signature_version='s3v4')
-    )
+    # Shared S3 client for MinIO
+    s3_client = get_s3_client(minio_endpoint, access_key, secret_key, region)
 
     uploaded_urls = []
 
     try:
         # Create bucket if it doesn't exist
-        try:
-            s3_client.head_bucket(Bucket=bucket_name)
-        except Exception:
-            s3_client.create_bucket(Bucket=bucket_name)
-            logger.info(f"Created bucket: {bucket_name}")
+        ensure_bucket(s3_client, bucket_name)
 
         # Upload each file
         for file_path in file_paths:
@@ -137,29 +181,19 @@ def upload_to_minio(file_paths, bucket_name, minio_endpoint, access_key, secret_
             if make_public:
                 extra_args['ACL'] = 'public-read'
 
-            # Guess content type based on file extension
-            file_ext = os.path.splitext(file_path)[1].lower()
-            content_type = None
-
-            if file_ext in ['.pdf']:
-                content_type = 'application/pdf'
-            elif file_ext in ['.jpg', '.jpeg']:
-                content_type = 'image/jpeg'
-            elif file_ext in ['.png']:
-                content_type = 'image/png'
-            elif file_ext in ['.txt']:
-                content_type = 'text/plain'
-
+            content_type = _content_type(file_name)
             if content_type:
                 extra_args['ContentType'] = content_type
 
             # Upload the file
-            s3_client.upload_file(
-                file_path,
-                bucket_name,
-                object_name,
-                ExtraArgs=extra_args
-            )
+            with observe_object_store("upload", bucket_name) as transfer:
+                s3_client.upload_file(
+                    file_path,
+                    bucket_name,
+                    object_name,
+                    ExtraArgs=extra_args
+                )
+                transfer.bytes = os.path.getsize(file_path)
 
             # Generate appropriate return value based on simple_path parameter
             if simple_path:
@@ -184,3 +218,54 @@ def upload_to_minio(file_paths, bucket_name, minio_endpoint, access_key, secret_
     except Exception as e:
         logger.error(f"Error uploading to MinIO: {e}")
         return []
+
+
+def upload_objects_to_minio(objects: Sequence[Tuple[str, bytes]], bucket_name, minio_endpoint, access_key,
+                            secret_key, region=None, prefix="", max_workers=8) -> List[Optional[str]]:
+    """
+    Upload in-memory objects to MinIO concurrently with one shared client
+
+    Args:
+        objects: (file_name, content) pairs; object names get the same timestamp
+            prefix as ``upload_to_minio``
+        bucket_name (str): Name of the bucket to upload to
+        minio_endpoint (str): MinIO server endpoint URL (e.g., "http://localhost:9000")
+        access_key (str): MinIO access key
+        secret_key (str): MinIO secret key
+        region (str, optional): Region name, if applicable
+        prefix (str, optional): Prefix to add to the object name in MinIO
+        max_workers (int): Maximum concurrent uploads
+
+    Returns:
+        list: ``bucket/object`` path per input object, in input order (None if that upload failed)
+    """
+    if not objects:
+        return []
+    s3_client = get_s3_client(minio_endpoint, access_key, secret_key, region)
+    try:
+        ensure_bucket(s3_client, bucket_name)
+    except Exception as e:
+        logger.error(f"Error preparing bucket {bucket_name}: {e}")
+        return [None] * len(objects)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    def upload(item):
+        file_name, content = item
+        object_name = f"{prefix}/{timestamp}_{file_name}" if prefix else f"{timestamp}_{file_name}"
+        extra_args = {}
+        content_type = _content_type(file_name)
+        if content_type:
+            extra_args['ContentType'] = content_type
+        try:
+            with observe_object_store("upload", bucket_name) as transfer:
+                s3_client.put_object(Bucket=bucket_name, Key=object_name, Body=content, **extra_args)
+                transfer.bytes = len(content)
+        except Exception as e:
+            logger.error(f"Error uploading {file_name} to MinIO: {e}")
+            return None
+        logger.info(f"Uploaded {file_name} to MinIO as {object_name}")
+        return f"{bucket_name}/{object_name}"
+
+    with ContextThreadPoolExecutor(max_workers=max(1, min(max_workers, len(objects)))) as executor:
+        return list(executor.map(upload, objects))
@@ -0,0 +1,189 @@
+"""
+Async Gemini OCR client.
+
+- ``generate_content_async`` calls limited by a semaphore
+  (``OCR_MAX_CONCURRENCY`` per deployment), all running on one background
+  event loop so the async gRPC client and the limit are shared by every
+  worker thread.
+- Per-call timeout and jittered exponential backoff on retryable errors
+  (429, 5xx, timeouts).
+- A batch that still fails, or whose output was cut at
+  ``max_output_tokens`` (``finish_reason == MAX_TOKENS``), is split in halves
+  and each half retried; a single page that cannot be OCR'd raises
+  ``OCRError`` instead of putting error text into the markdown.
+"""
+import asyncio
+import random
+import threading
+from typing import Callable, List, Optional, Sequence
+
+from google.api_core import exceptions as google_exceptions
+
+from app.config.env import EnvSettings
+from app.utils.logger import get_logger
+from app.utils.metrics import OCR_BATCH_RETRIES, observe_llm_call
+
+logger = get_logger(__name__)
+
+RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+
+class OCRError(Exception):
+    """A page or batch could not be OCR'd after retries and splitting."""
+
+
+class OCRTruncatedError(OCRError):
+    """The response stopped at ``max_output_tokens``; ``partial_text`` is what came back."""
+
+    def __init__(self, message: str, partial_text: str):
+        super().__init__(message)
+        self.partial_text = partial_text
+
+
+def _finish_reason(response) -> Optional[str]:
+    candidates = getattr(response, "candidates", None)
+    if not candidates:
+        return None
+    finish_reason = candidates[0].finish_reason
+    return getattr(finish_reason, "name", str(finish_reason))
+
+
+class _BackgroundLoop:
+    """Event loop chạy trên một daemon thread, nhận coroutine từ các thread đồng bộ."""
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def run(self, coro):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="ocr-event-loop", daemon=True).start()
+        # run_coroutine_threadsafe chạy coroutine trong bản sao context của thread gọi
+        # (span profiler, nhãn metric đi theo)
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+
+_background_loop = _BackgroundLoop()
+
+
+class GeminiOCRClient:
+    """
+    Run OCR requests against a ``genai.GenerativeModel`` concurrently.
+
+    Args:
+        model: Gemini model (``google.generativeai.GenerativeModel``).
+        max_concurrency: Maximum in-flight requests.
+        max_retries: Retries per request on retryable errors.
+        timeout: Seconds allowed for one request.
+        base_delay: First backoff delay in seconds (doubled every retry, full jitter).
+    """
+
+    def __init__(self, model, max_concurrency: Optional[int] = None, max_retries: Optional[int] = None,
+                 timeout: Optional[float] = None, base_delay: float = 1.0, max_delay: float = 30.0):
+        settings = EnvSettings()
+        self.model = model
+        self.max_concurrency = max_concurrency or settings.OCR_MAX_CONCURRENCY
+        self.max_retries = settings.OCR_MAX_RETRIES if max_retries is None else max_retries
+        self.timeout = timeout or settings.OCR_TIMEOUT
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Chỉ dùng trên background loop
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def _generate(self, prompt: str, img_base64: str, generation_config: dict) -> str:
+        """One request with timeout and retries."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    with observe_llm_call("gemini", self.model.model_name, node="ocr") as call:
+                        response = await asyncio.wait_for(
+                            self.model.generate_content_async(
+                                contents=[prompt, {"mime_type": "image/png", "data": img_base64}],
+                                generation_config=generation_config,
+                            ),
+                            timeout=self.timeout,
+                        )
+                        usage = getattr(response, "usage_metadata", None)
+                        if usage:
+                            call.record_tokens(usage.prompt_token_count,
+                                               usage.candidates_token_count)
+                        if _finish_reason(response) == "MAX_TOKENS":
+                            raise OCRTruncatedError("OCR output truncated at max_output_tokens", response.text)
+                        return response.text
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise OCRError(f"OCR request failed after {attempt + 1} attempts: {e!r}") from e
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                OCR_BATCH_RETRIES.labels(reason=type(e).__name__).inc()
+                logger.warning(
+                    f"Retryable OCR error ({type(e).__name__}), attempt {attempt + 1}/{self.max_retries + 1}, "
+                    f"retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            except ValueError as e:
+                # response.text không có nội dung (bị chặn / finish_reason bất thường): không retry
+                raise OCRError(f"OCR response has no text: {e}") from e
+
+    async def _ocr_batch(self, images: Sequence, prompt: str,
+                         encode: Callable[[Sequence], List[str]], generation_config: dict) -> str:
+        """OCR một batch; nếu vẫn lỗi hoặc output bị cắt thì chia đôi batch và xử lý từng nửa."""
+        try:
+            payloads = encode(images)
+            parts = [await self._generate(prompt, payload, generation_config) for payload in payloads]
+            return "\n\n".join(parts)
+        except OCRTruncatedError as e:
+            if len(images) <= 1:
+                # Một trang vẫn vượt max_output_tokens: giữ phần đã nhận thay vì bỏ cả trang
+                OCR_BATCH_RETRIES.labels(reason="truncated_page").inc()
+                logger.warning("OCR output of a single page truncated at max_output_tokens, keeping partial text")
+                return e.partial_text
+            reason = "truncated"
+        except OCRError:
+            if len(images) <= 1:
+                raise
+            reason = "split"
+        OCR_BATCH_RETRIES.labels(reason=reason).inc()
+        mid_point = len(images) // 2
+        logger.warning(f"OCR batch of {len(images)} pages {reason}, splitting into halves")
+        first_half, second_half = await asyncio.gather(
+            self._ocr_batch(images[:mid_point], prompt, encode, generation_config),
+            self._ocr_batch(images[mid_point:], prompt, encode, generation_config),
+        )
+        return first_half + "\n\n" + second_half
+
+    async def ocr_batches(self, batches: Sequence[Sequence], prompt: str,
+                          encode: Callable[[Sequence], List[str]], generation_config: dict) -> List[str]:
+        """
+        OCR every batch concurrently.
+
+        Args:
+            batches: Batches of page images.
+            prompt: OCR prompt.
+            encode: Turns a batch into one or more base64 PNG payloads.
+            generation_config: Passed to ``generate_content_async``.
+
+        Returns:
+            List[str]: Text of each batch, in input order.
+
+        Raises:
+            OCRError: A single page could not be OCR'd.
+        """
+        return await asyncio.gather(*[
+            self._ocr_batch(batch, prompt, encode, generation_config) for batch in batches
+        ])
+
+    def run(self, batches: Sequence[Sequence], prompt: str,
+            encode: Callable[[Sequence], List[str]], generation_config: dict) -> List[str]:
+        """Synchronous entry point for consumers and worker threads."""
+        return _background_loop.run(self.ocr_batches(batches, prompt, encode, generation_config))
@@ -0,0 +1,142 @@
+"""
+Pre-OCR page triage on tiny thumbnails.
+
+Every page is rendered once in grayscale at ``FINGERPRINT_THUMBNAIL_SIDE``
+pixels (long side) to compute:
+
+- ink density: share of pixels clearly darker than the page background;
+  pages under ``PAGE_BLANK_MAX_INK`` (blank separators, empty backs of
+  scanned sheets) are skipped before any full-resolution rendering.
+- a 64-bit perceptual hash (DCT of a 32x32 reduction). Pages whose hash is
+  within ``PAGE_DUPLICATE_MAX_DISTANCE`` bits of an earlier page and whose
+  thumbnails also match pixel-wise (repeated cover sheets, signature/stamp
+  pages) are OCR'd once; callers reuse the text at the duplicate's position.
+
+The pixel-wise check keeps different pages with the same layout (two dense
+text pages) from being merged on a hash collision.
+"""
+from typing import Dict, List, NamedTuple, Sequence
+
+import cv2
+import fitz
+import numpy as np
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Cạnh dài của thumbnail (pixel)
+FINGERPRINT_THUMBNAIL_SIDE = 256
+# Điểm ảnh tối hơn nền (trung vị) ít nhất chừng này mới tính là mực
+INK_CONTRAST = 60
+# Trang có tỷ lệ mực thấp hơn thế này là trang trắng
+PAGE_BLANK_MAX_INK = 0.001
+# Trùng lặp: khoảng cách Hamming tối đa của pHash và chênh lệch điểm ảnh trung bình tối đa (0-255)
+PAGE_DUPLICATE_MAX_DISTANCE = 4
+PAGE_DUPLICATE_MAX_PIXEL_DIFF = 4.0
+
+
+class PageFingerprint(NamedTuple):
+    page: int  # 0-based
+    phash: int
+    ink_density: float
+    thumbnail: np.ndarray
+
+    @property
+    def is_blank(self) -> bool:
+        return self.ink_density < PAGE_BLANK_MAX_INK
+
+
+class PagePlan(NamedTuple):
+    ocr_pages: List[int]  # trang cần OCR, theo thứ tự
+    blank_pages: List[int]
+    duplicates: Dict[int, int]  # trang trùng -> trang gốc (đã có trong ocr_pages)
+    ink_density: Dict[int, float]  # mọi trang đã phân tích, dùng để ước lượng độ dài output OCR
+
+    @property
+    def duplicate_sources(self) -> set:
+        return set(self.duplicates.values())
+
+    def restrict(self, page_numbers: Sequence[int]) -> "PagePlan":
+        """The plan of ``page_numbers`` only; a duplicate whose source is not among them is OCR'd."""
+        pages = set(page_numbers)
+        duplicates = {p: s for p, s in self.duplicates.items() if p in pages and s in pages}
+        blank_pages = [p for p in self.blank_pages if p in pages]
+        skipped = set(blank_pages) | set(duplicates)
+        return PagePlan(
+            [p for p in sorted(pages) if p not in skipped], blank_pages, duplicates,
+            {p: d for p, d in self.ink_density.items() if p in pages})
+
+
+def render_thumbnail(page, side: int = FINGERPRINT_THUMBNAIL_SIDE) -> np.ndarray:
+    """Render a page straight to a small grayscale array (no full-size pixmap)."""
+    zoom = side / max(page.rect.width, page.rect.height, 1)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+
+
+def perceptual_hash(gray: np.ndarray) -> int:
+    """64-bit pHash: low-frequency 8x8 DCT coefficients compared with their median."""
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    # Bỏ hệ số DC khi tính trung vị: chỉ phản ánh độ sáng trung bình
+    bits = low > np.median(low[1:])
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def ink_density(gray: np.ndarray) -> float:
+    background = float(np.median(gray))
+    return float(np.count_nonzero(gray < background - INK_CONTRAST)) / gray.size
+
+
+def fingerprint_page(page, page_num: int) -> PageFingerprint:
+    gray = render_thumbnail(page)
+    return PageFingerprint(page_num, perceptual_hash(gray), ink_density(gray), gray)
+
+
+def _same_page(a: PageFingerprint, b: PageFingerprint) -> bool:
+    if bin(a.phash ^ b.phash).count("1") > PAGE_DUPLICATE_MAX_DISTANCE:
+        return False
+    if a.thumbnail.shape != b.thumbnail.shape:
+        return False
+    diff = np.abs(a.thumbnail.astype(np.int16) - b.thumbnail.astype(np.int16))
+    return float(diff.mean()) <= PAGE_DUPLICATE_MAX_PIXEL_DIFF
+
+
+def plan_pages(pdf_document, page_numbers: Sequence[int], deduplicate: bool = True) -> PagePlan:
+    """
+    Split ``page_numbers`` into pages to OCR, blank pages and duplicates of
+    an earlier page.
+
+    Args:
+        pdf_document: Open ``fitz.Document``.
+        page_numbers: 0-based pages, in document order.
+        deduplicate: False keeps every page (only ink density is measured).
+
+    Returns:
+        PagePlan
+    """
+    ocr_pages, blank_pages, duplicates, densities = [], [], {}, {}
+    kept: List[PageFingerprint] = []
+    for page_num in page_numbers:
+        fingerprint = fingerprint_page(pdf_document[page_num], page_num)
+        densities[page_num] = fingerprint.ink_density
+        if not deduplicate:
+            ocr_pages.append(page_num)
+            continue
+        if fingerprint.is_blank:
+            blank_pages.append(page_num)
+            continue
+        source = next((k.page for k in kept if _same_page(k, fingerprint)), None)
+        if source is not None:
+            duplicates[page_num] = source
+            continue
+        kept.append(fingerprint)
+        ocr_pages.append(page_num)
+
+    if blank_pages or duplicates:
+        duplicate_pages = {p + 1: s + 1 for p, s in duplicates.items()}
+        logger.info(
+            f"Page triage: {len(ocr_pages)} to OCR, blank {[p + 1 for p in blank_pages]}, "
+            f"duplicate of {duplicate_pages}")
+    return PagePlan(ocr_pages, blank_pages, duplicates, densities)
@@ -1,5 +1,4 @@
 import base64
-import concurrent.futures
 import io
 from datetime import datetime
 from functools import partial
@@ -14,6 +13,10 @@ from PIL import Image
 
 from app.config.env import EnvSettings
 from app.utils.logger import get_logger
+from app.utils.metrics import OCR_PAGES_SKIPPED
+from app.utils.ocr_client import GeminiOCRClient
+from app.utils.orientation import correct_orientation
+from app.utils.page_fingerprint import plan_pages
 
 # Initialize logger
 logger = get_logger(__name__)
@@ -30,7 +33,18 @@ model = genai.GenerativeModel('gemini-1.5-flash')
 # Define input and output directories
 DATA_DIR = Path("data")
 RESULTS_DIR = Path("results")
-BATCH_SIZE = 2  # Number of images per batch
+# Estimating the OCR output of one page (tokens), used to pack batches under OCR_OUTPUT_TOKEN_BUDGET
+OCR_CHARS_PER_TOKEN = 3.0
+OCR_TOKENS_PER_INK = 20000  # dense text page, ~8% ink on the thumbnail -> ~1600 tokens
+OCR_PAGE_TOKEN_OVERHEAD = 100  # headings, page break markers, markdown table syntax
+GENERATION_CONFIG = {
+    "temperature": 0.1,
+    "top_p": 0.95,
+    "max_output_tokens": 8192,
+}
+
+# Shared client: one concurrency limit (OCR_MAX_CONCURRENCY) for every caller
+ocr_client = GeminiOCRClient(model)
 
 
 def convert_image_to_base64(image):
@@ -186,32 +200,23 @@ def enhance_image(img_pil):
     return enhanced_img_pil
 
 
-def process_image_batch(images, prompt, batch_size=None, save_debug=False):
+def encode_image_batch(images, save_debug=False):
     """
-    Process a batch of images with Google Gemini API
+    Combine a batch of images into base64 PNG payloads for the Gemini API
 
     Args:
         images: List of PIL Image objects
-        prompt: Prompt for the Gemini API
-        batch_size: Override batch size if needed
         save_debug: Save debug images to disk
 
     Returns:
-        Text extracted from the combined image
+        List of base64 strings; more than one when the combined image is too
+        large and the batch had to be divided
     """
-    # Check if batch needs to be further divided (based on total dimensions)
-    if batch_size is not None and len(images) > batch_size:
-        results = []
-        for i in range(0, len(images), batch_size):
-            sub_batch = images[i:i+batch_size]
-            results.append(process_image_batch(sub_batch, prompt))
-        return "\n\n".join(results)
-
     # Combine images into a single image
     combined_img = combine_images_vertically(
         images, add_separators=True, save_debug=save_debug)
     if combined_img is None:
-        return ""
+        return []
 
     # Save debug image if requested
     if save_debug:
@@ -228,31 +233,40 @@ def process_image_batch(images, prompt, batch_size=None, save_debug=False):
     file_size_mb = img_buffer.getbuffer().nbytes / (1024 * 1024)
 
     # If file is too large, reduce batch size and retry
-    if file_size_mb > 20:  # 20MB is a reasonable limit
+    if file_size_mb > 20 and len(images) > 1:  # 20MB is a reasonable limit
         logger.info(
             f"Combined image too large: {file_size_mb:.2f}MB. Reducing batch size.")
         mid_point = len(images) // 2
-        first_half = process_image_batch(images[:mid_point], prompt)
-        second_half = process_image_batch(images[mid_point:], prompt)
-        return first_half + "\n\n" + second_half
+        return encode_image_batch(images[:mid_point], save_debug) + \
+            encode_image_batch(images[mid_point:], save_debug)
 
-    # Convert combined image to base64
-    img_base64 = convert_image_to_base64(combined_img)
+    # The PNG is already encoded: reuse the buffer
+    return [base64.b64encode(img_buffer.getvalue()).decode()]
 
-    try:
-        # Generate content using Gemini API
-        response = model.generate_content(
-            contents=[prompt, {"mime_type": "image/png", "data": img_base64}],
-            generation_config={
-                "temperature": 0.1,
-                "top_p": 0.95,
-                "max_output_tokens": 8192,
-            }
-        )
-        return response.text
-    except Exception as e:
-        logger.error(f"Error processing batch: {str(e)}")
-        return f"[Error processing batch: {str(e)}]"
+
+def process_image_batch(images, prompt, batch_size=None, save_debug=False):
+    """
+    Process a batch of images with Google Gemini API
+
+    Args:
+        images: List of PIL Image objects
+        prompt: Prompt for the Gemini API
+        batch_size: Override batch size if needed
+        save_debug: Save debug images to disk
+
+    Returns:
+        Text extracted from the combined image
+
+    Raises:
+        OCRError: A page could not be OCR'd after retries
+    """
+    if batch_size is not None and len(images) > batch_size:
+        batches = [images[i:i+batch_size] for i in range(0, len(images), batch_size)]
+    else:
+        batches = [images]
+    results = ocr_client.run(
+        batches, prompt, partial(encode_image_batch, save_debug=save_debug), GENERATION_CONFIG)
+    return "\n\n".join(results)
 
 
 def enhance_table_image(img_pil):
@@ -325,127 +339,24 @@ def validate_image_for_processing(image, min_content_percent=0):
         return False, f"Error validating image: {str(e)}"
 
 
-def rotate_table_image(img, debug_mode=False):
-    """
-    Specialized function for rotating table images with better quality preservation
-    :param img: PIL Image containing a table
-    :param debug_mode: Whether to save debug images
-    :return: Rotated PIL Image
+def estimate_page_tokens(page, ink_density):
     """
-    # Convert PIL to OpenCV format
-    img_cv = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-
-    # Convert to grayscale
-    gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
-
-    # For tables, we can detect lines better with Canny edge detection
-    edges = cv2.Canny(gray, 50, 150, apertureSize=3)
-
-    # Apply HoughLinesP to detect lines - works better for tables than morphology
-    lines = cv2.HoughLinesP(edges, 1, np.pi/180, 80,
-                            minLineLength=100, maxLineGap=10)
-
-    # Count horizontal and vertical lines
-    h_count = 0
-    v_count = 0
-
-    if lines is not None:
-        for line in lines:
-            x1, y1, x2, y2 = line[0]
-            # Calculate line angle
-            if abs(x2 - x1) > abs(y2 - y1):
-                # More horizontal than vertical
-                h_count += 1
-            else:
-                # More vertical than horizontal
-                v_count += 1
-
-    if debug_mode:
-        logger.debug(
-            f"Table detection - Horizontal lines: {h_count}, Vertical lines: {v_count}")
-
-    # Determine if rotation needed
-    rotation_needed = False
-    if h_count > 0 and v_count > 0:
-        # For tables, if we have more vertical than horizontal lines,
-        # it's likely rotated 90 degrees
-        rotation_needed = v_count > h_count * 1.2
-
-    if rotation_needed:
-        angle = -90  # Clockwise 90 degrees
-
-        # Get original dimensions
-        height, width = img_cv.shape[:2]
-
-        # Add padding to prevent cropping
-        padding = 10  # Add extra padding to prevent edge loss
-        padded_img = cv2.copyMakeBorder(
-            img_cv,
-            padding, padding, padding, padding,
-            cv2.BORDER_CONSTANT,
-            value=(255, 255, 255)
-        )
-
-        # Get new dimensions with padding
-        padded_height, padded_width = padded_img.shape[:2]
-        center = (padded_width // 2, padded_height // 2)
-
-        # Create rotation matrix
-        rotation_matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
-
-        # Calculate new dimensions after rotation
-        # For 90 degrees, we swap width and height
-        new_width = padded_height
-        new_height = padded_width
-
-        # Adjust the translation part of the rotation matrix to ensure nothing gets cropped
-        rotation_matrix[0, 2] += (new_width - padded_width) / 2
-        rotation_matrix[1, 2] += (new_height - padded_height) / 2
-
-        # Perform the rotation with high quality interpolation
-        rotated = cv2.warpAffine(
-            padded_img,
-            rotation_matrix,
-            (new_width, new_height),
-            flags=cv2.INTER_CUBIC,
-            borderMode=cv2.BORDER_CONSTANT,
-            borderValue=(255, 255, 255)
-        )
-
-        # Sharpen the rotated image to improve text clarity
-        kernel = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
-        rotated = cv2.filter2D(rotated, -1, kernel)
-
-        # Convert back to PIL Image
-        result_img = PIL.Image.fromarray(
-            cv2.cvtColor(rotated, cv2.COLOR_BGR2RGB))
-
-        # Save intermediate images if debug mode is enabled
-        if debug_mode:
-            debug_dir = Path("debug/rotation")
-            debug_dir.mkdir(exist_ok=True, parents=True)
-
-            # Save padded image
-            pad_img_pil = PIL.Image.fromarray(
-                cv2.cvtColor(padded_img, cv2.COLOR_BGR2RGB))
-            pad_path = debug_dir / \
-                f"padded_table_{datetime.now().strftime('%H%M%S')}.png"
-            pad_img_pil.save(pad_path)
+    Estimate the OCR output of a page in tokens
 
-            # Save rotated image
-            rot_path = debug_dir / \
-                f"rotated_table_{datetime.now().strftime('%H%M%S')}.png"
-            result_img.save(rot_path)
-
-            logger.debug(
-                f"Original size: {width}x{height}, Rotated size: {new_width}x{new_height}")
-
-        return result_img
+    Args:
+        page: fitz Page
+        ink_density: Share of ink pixels on the page thumbnail
 
-    return img
+    Returns:
+        Estimated output tokens (text layer or ink, whichever is larger)
+    """
+    text_length = len(page.get_text("text", flags=fitz.TEXT_MEDIABOX_CLIP).strip())
+    estimate = max(text_length / OCR_CHARS_PER_TOKEN, ink_density * OCR_TOKENS_PER_INK)
+    return int(estimate) + OCR_PAGE_TOKEN_OVERHEAD
 
 
-def convert_pdf_to_text(pdf_path, output_format='text', batch_size=BATCH_SIZE, debug_mode=False, max_workers=2):
+def convert_pdf_to_text(pdf_path, output_format='text', batch_size=None, debug_mode=False, max_workers=None,
+                        max_pages=None, pages=None, deduplicate=True, plan=None):
     """
     Convert PDF images to text or markdown using Google Gemini Vision API
     Processing pages in batches in parallel while preserving order
@@ -453,12 +364,22 @@ def convert_pdf_to_text(pdf_path, output_format='text', batch_size=BATCH_SIZE, d
     Args:
         pdf_path: Path to PDF file
         output_format: 'text' or 'markdown'
-        batch_size: Number of pages to process in each batch
+        batch_size: Maximum pages per batch (default OCR_MAX_PAGES_PER_BATCH); batches are
+            packed up to OCR_OUTPUT_TOKEN_BUDGET estimated output tokens
         debug_mode: Save debug images during processing
-        max_workers: Maximum number of parallel workers
+        max_workers: Maximum concurrent Gemini requests for this document
+            (default: the shared client, limited by OCR_MAX_CONCURRENCY)
+        max_pages: Only convert the first ``max_pages`` pages (sampling)
+        pages: Only convert these 0-based page numbers (e.g. the image pages of a mixed PDF)
+        deduplicate: Skip blank pages and OCR repeated pages only once
+        plan: ``PagePlan`` already computed by the caller for these pages (hybrid OCR);
+            reused instead of fingerprinting the pages again
 
     Returns:
         Converted text content
+
+    Raises:
+        OCRError: A page could not be OCR'd after retries and batch splitting
     """
     # Create the prompt for Gemini
     prompt = """Please extract all content from this image with precise formatting:
@@ -499,20 +420,58 @@ If an image is unclear, indicate this in your output rather than guessing the co
     # Open PDF file
     pdf_document = fitz.open(pdf_path)
     total_pages = len(pdf_document)
+    page_numbers = sorted(pages) if pages is not None else list(range(total_pages))
+    if max_pages:
+        page_numbers = page_numbers[:max_pages]
+    if not page_numbers:
+        pdf_document.close()
+        return ""
 
-    # Adjust batch size based on document complexity
-    if total_pages > 20:
-        # For large documents, use smaller batches
-        batch_size = min(batch_size, 2)
+    # Blank pages are dropped and repeated pages OCR'd once, decided on thumbnails
+    # before any page is rendered at full resolution
+    if plan is not None:
+        plan = plan.restrict(page_numbers)
+    else:
+        plan = plan_pages(pdf_document, page_numbers, deduplicate=deduplicate)
+    if plan.blank_pages:
+        OCR_PAGES_SKIPPED.labels(reason="blank").inc(len(plan.blank_pages))
+    if plan.duplicates:
+        OCR_PAGES_SKIPPED.labels(reason="duplicate").inc(len(plan.duplicates))
+    blank_pages = set(plan.blank_pages)
+    duplicate_sources = plan.duplicate_sources
+
+    # Pack pages into batches by estimated output size: sparse pages share a call,
+    # dense table pages go alone instead of being cut at max_output_tokens
+    max_pages_per_batch = batch_size or env.OCR_MAX_PAGES_PER_BATCH
+    token_budget = env.OCR_OUTPUT_TOKEN_BUDGET
 
     # Prepare batches for parallel processing
     batches = []
     batch_info = []  # Store start/end page info for each batch
+    segments = []  # Output order: ("batch", batch index) or ("duplicate", page, source page)
+    source_batch = {}  # Page repeated later in the document -> its single-page batch
 
     current_batch = []
-    batch_start_page = 0
+    current_pages = []
+    current_tokens = []
+
+    def flush_batch():
+        if current_batch:
+            segments.append(("batch", len(batches)))
+            batches.append(list(current_batch))
+            batch_info.append((current_pages[0]+1, current_pages[-1]+1))
+            current_batch.clear()
+            current_pages.clear()
+            current_tokens.clear()
+
+    for page_num in page_numbers:
+        if page_num in plan.duplicates:
+            flush_batch()
+            segments.append(("duplicate", page_num, plan.duplicates[page_num]))
+            continue
+        if page_num in blank_pages:
+            continue
 
-    for page_num in range(total_pages):
         # Get the page
         page = pdf_document[page_num]
 
@@ -532,12 +491,8 @@ If an image is unclear, indicate this in your output rather than guessing the co
             img.save(original_path, format="PNG")
             logger.info(f"Saved original image: {original_path}")
 
-        img_rot = rotate_table_image(img, debug_mode=debug_mode)
-
-        # If the table rotation didn't make changes, fall back to general orientation detection
-        if img_rot == img:
-            img_rot = detect_and_correct_orientation(
-                img, debug_mode=debug_mode)
+        # Orientation is decided on a thumbnail and applied once at full resolution
+        img_rot = correct_orientation(img, debug_mode=debug_mode)
 
         # Save rotated image if debug_mode is enabled
         if debug_mode:
@@ -567,177 +522,58 @@ If an image is unclear, indicate this in your output rather than guessing the co
             img_enhanced.save(enhanced_path, format="PNG")
             logger.info(f"Saved enhanced image: {enhanced_path}")
 
+        # Start a new batch when this page would exceed the page or token budget
+        page_tokens = estimate_page_tokens(page, plan.ink_density.get(page_num, 0.0))
+        if len(current_batch) >= max_pages_per_batch or sum(current_tokens) + page_tokens > token_budget:
+            flush_batch()
+
+        # A page repeated later is OCR'd alone so its text can be reused as is
+        if page_num in duplicate_sources:
+            flush_batch()
+            source_batch[page_num] = len(batches)
+
         # Add to current batch
         current_batch.append(img_enhanced)
+        current_pages.append(page_num)
+        current_tokens.append(page_tokens)
 
-        # Complete batch if it reaches batch_size or this is the last page
-        if len(current_batch) >= batch_size or page_num == total_pages - 1:
-            batches.append(current_batch)
-            batch_info.append((batch_start_page+1, page_num+1))
-
-            # Reset for next batch
-            current_batch = []
-            batch_start_page = page_num + 1
+        if page_num in duplicate_sources:
+            flush_batch()
 
+    flush_batch()
     pdf_document.close()
 
-    # Process batches in parallel while maintaining order
-    process_batch_func = partial(
-        process_batch_with_info,
-        prompt=prompt,
-        output_format=output_format,
-        debug_mode=debug_mode
-    )
-
-    results = []
-    # Use ThreadPoolExecutor instead of ProcessPoolExecutor since the Google API might not be multiprocess-safe
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Map batches with their info for processing
-        batch_data = list(zip(batches, batch_info))
-        future_to_batch = {executor.submit(
-            process_batch_func, b_data): i for i, b_data in enumerate(batch_data)}
-
-        # Collect results in order
-        for future in concurrent.futures.as_completed(future_to_batch):
-            batch_idx = future_to_batch[future]
-            try:
-                result = future.result()
-                # Store result with its index to maintain order
-                results.append((batch_idx, result))
-            except Exception as e:
-                logger.error(f"Error in batch {batch_idx}: {str(e)}")
-                results.append(
-                    (batch_idx, f"[Error processing batch: {str(e)}]"))
-
-    # Sort results by original batch index to maintain document order
-    results.sort(key=lambda x: x[0])
-
-    # Extract just the text content
-    full_text = [r[1] for r in results]
+    # All batches go out concurrently on the async client; results keep batch order
+    client = ocr_client if max_workers is None else GeminiOCRClient(model, max_concurrency=max_workers)
+    logger.info(f"OCR {len(batches)} batches ({len(plan.ocr_pages)}/{len(page_numbers)} pages) of {pdf_path}")
+    results = client.run(
+        batches, prompt, partial(encode_image_batch, save_debug=debug_mode), GENERATION_CONFIG)
+
+    full_text = []
+    for segment in segments:
+        if segment[0] == "batch":
+            batch_text = results[segment[1]]
+            batch_start, batch_end = batch_info[segment[1]]
+        else:
+            _, page_num, source = segment
+            if source not in source_batch:  # source page was skipped as invalid
+                continue
+            batch_text = results[source_batch[source]]
+            batch_start = batch_end = page_num+1
+        if output_format == 'markdown':
+            # Add page markers in markdown
+            batch_text = f"## Pages {batch_start} to {batch_end}\n\n{batch_text}\n\n"
+        full_text.append(batch_text)
 
     return '\n'.join(full_text)
 
 
-def process_batch_with_info(batch_data, prompt, output_format, debug_mode):
-    """Process a single batch with page info for parallel execution"""
-    images, page_info = batch_data
-    batch_start, batch_end = page_info
-
-    logger.info(f"Processing batch of pages {batch_start} to {batch_end}...")
-
-    # Process the batch
-    batch_text = process_image_batch(images, prompt, save_debug=debug_mode)
-
-    if output_format == 'markdown':
-        # Add page markers in markdown
-        batch_text = f"## Pages {batch_start} to {batch_end}\n\n{batch_text}\n\n"
-
-    return batch_text
-
-
 def save_output(content, output_path):
     """Save the converted content to a file with UTF-8 encoding"""
     with open(output_path, 'w', encoding='utf-8') as f:
         f.write(content)
 
 
-def detect_and_correct_orientation(img, debug_mode=False):
-    """
-    Detect and correct the orientation of an image using OpenCV
-    :param img: PIL Image
-    :param debug_mode: Whether to log debugging information
-    :return: Corrected PIL Image
-    """
-    # Convert PIL to OpenCV format
-    img_cv = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-
-    # Convert to grayscale
-    gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
-
-    # Apply Gaussian blur to reduce noise before thresholding
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-
-    # Apply adaptive threshold with better parameters
-    thresh = cv2.adaptiveThreshold(
-        blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 15, 2)
-
-    # Use multiple kernel sizes for more robust line detection
-    horizontal_kernels = [
-        cv2.getStructuringElement(cv2.MORPH_RECT, (20, 1)),
-        cv2.getStructuringElement(cv2.MORPH_RECT, (40, 1))
-    ]
-    vertical_kernels = [
-        cv2.getStructuringElement(cv2.MORPH_RECT, (1, 20)),
-        cv2.getStructuringElement(cv2.MORPH_RECT, (1, 40))
-    ]
-
-    # Combine results from multiple kernels
-    h_lines_total = 0
-    v_lines_total = 0
-
-    # Debug images
-    if debug_mode:
-        debug_dir = Path("debug/orientation")
-        debug_dir.mkdir(exist_ok=True, parents=True)
-        cv2.imwrite(str(debug_dir / "threshold.png"), thresh)
-
-    for h_kernel in horizontal_kernels:
-        horizontal_lines = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, h_kernel)
-        h_lines_total += cv2.countNonZero(horizontal_lines)
-        if debug_mode:
-            cv2.imwrite(str(
-                debug_dir / f"h_lines_{h_kernel.shape[0]}x{h_kernel.shape[1]}.png"), horizontal_lines)
-
-    for v_kernel in vertical_kernels:
-        vertical_lines = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, v_kernel)
-        v_lines_total += cv2.countNonZero(vertical_lines)
-        if debug_mode:
-            cv2.imwrite(str(
-                debug_dir / f"v_lines_{v_kernel.shape[0]}x{v_kernel.shape[1]}.png"), vertical_lines)
-
-    # Log line counts if debug mode is enabled
-    if debug_mode:
-        logger.debug(
-            f"Horizontal lines: {h_lines_total}, Vertical lines: {v_lines_total}, "
-            f"Ratio (V/H): {v_lines_total/h_lines_total if h_lines_total > 0 else 'infinite'}")
-
-    # Use a more sensitive threshold (1.1 instead of 1.2)
-    angle = 0
-    if h_lines_total > v_lines_total * 1.1:  # More horizontal than vertical lines
-        angle = 0  # Correctly oriented
-    elif v_lines_total > h_lines_total * 1.1:  # More vertical than horizontal lines
-        # For 90 degree rotated tables, we want clockwise rotation
-        # Rotated 90 degrees clockwise (negative for clockwise in OpenCV)
-        angle = -90
-
-    # Log detected angle if debug mode is enabled
-    if debug_mode:
-        logger.debug(f"Detected rotation angle: {angle}")
-
-    # Rotate if needed
-    if angle != 0:
-        height, width = img_cv.shape[:2]
-        center = (width // 2, height // 2)
-
-        # Create rotation matrix
-        rotation_matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
-
-        # Get new dimensions
-        if abs(angle) == 90:
-            new_width, new_height = height, width
-        else:
-            new_width, new_height = width, height
-
-        # Perform rotation
-        rotated = cv2.warpAffine(
-            img_cv, rotation_matrix, (new_width, new_height))
-
-        # Convert back to PIL Image
-        return PIL.Image.fromarray(cv2.cvtColor(rotated, cv2.COLOR_BGR2RGB))
-
-    return img
-
-
 def main_test():
     # Create results directory if it doesn't exist
     RESULTS_DIR.mkdir(exist_ok=True)
@@ -753,7 +589,6 @@ def main_test():
         content = convert_pdf_to_text(
             str(pdf_file),
             output_format='text',
-            batch_size=BATCH_SIZE,
             debug_mode=True,
             max_workers=4  # Adjust based on your machine's capabilities
         )
@@ -0,0 +1,281 @@
+"""
+Per-dossier critical-path profiler.
+
+A profile is enabled per queue message (``"profile": true``) and records spans
+for graph nodes, thread-pool tasks, LLM calls, Postgres statements and MinIO
+transfers. Parent/child links follow the current ``contextvars`` context, so
+work submitted through ``ContextThreadPoolExecutor`` is attached to the span
+that submitted it. When the run ends a Chrome trace-event JSON file is written
+to ``logs/profiles`` (open it in chrome://tracing, Perfetto or speedscope) and
+the critical path is logged.
+
+When no profile is active every helper is a no-op.
+"""
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from datetime import datetime
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+PROFILE_DIR = os.path.join("logs", "profiles")
+
+_current_trace: ContextVar["Trace | None"] = ContextVar("profiler_trace", default=None)
+_current_span: ContextVar["Span | None"] = ContextVar("profiler_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class Span:
+    """One timed unit of work."""
+
+    __slots__ = ("id", "name", "category", "parent_id", "start", "end",
+                 "thread_id", "thread_name", "args")
+
+    def __init__(self, name: str, category: str, parent_id, args=None):
+        thread = threading.current_thread()
+        self.id = next(_span_ids)
+        self.name = name
+        self.category = category
+        self.parent_id = parent_id
+        self.start = time.perf_counter()
+        self.end = None
+        self.thread_id = thread.ident
+        self.thread_name = thread.name
+        self.args = dict(args or {})
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+
+class Trace:
+    """All spans recorded for one message of one pipeline stage."""
+
+    def __init__(self, hs_id: str, stage: str):
+        self.hs_id = hs_id
+        self.stage = stage
+        self.spans = []
+        self.started_at = datetime.now()
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+
+def is_profiling() -> bool:
+    """True when the current context belongs to a profiled run."""
+    return _current_trace.get() is not None
+
+
+@contextmanager
+def profile_run(hs_id: str, stage: str, enabled: bool = True):
+    """
+    Profile everything executed inside the block for one dossier.
+
+    Args:
+        hs_id: Dossier id, used in the output file name.
+        stage: Pipeline stage (queue name).
+        enabled: When False the block runs without profiling.
+
+    Yields:
+        Trace | None: The active trace, or None when disabled.
+    """
+    if not enabled or is_profiling():
+        yield None
+        return
+    trace = Trace(hs_id=str(hs_id), stage=stage)
+    trace_token = _current_trace.set(trace)
+    root = Span(stage, "message", None, {"hs_id": str(hs_id)})
+    trace.add(root)
+    span_token = _current_span.set(root)
+    try:
+        yield trace
+    finally:
+        root.end = time.perf_counter()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        try:
+            path = write_chrome_trace(trace, root)
+            logger.info(f"Profile for hs_id {hs_id} ({stage}) written to {path}")
+        except Exception as e:
+            logger.error(f"Could not write profile for hs_id {hs_id}: {e}")
+
+
+@contextmanager
+def span(name: str, category: str, **args):
+    """Record a child span of the current span. No-op outside a profiled run."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _current_span.get()
+    current = Span(name, category, parent.id if parent else None, args)
+    trace.add(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def begin_span(name: str, category: str, **args):
+    """
+    Open a span without making it current, for start/end callback pairs
+    (e.g. LangChain ``on_llm_start``/``on_llm_end``). Close it with ``end_span``.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    parent = _current_span.get()
+    current = Span(name, category, parent.id if parent else None, args)
+    trace.add(current)
+    return current
+
+
+def end_span(current, **args):
+    """Close a span opened with ``begin_span``."""
+    if current is None:
+        return
+    current.args.update(args)
+    current.end = time.perf_counter()
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    ThreadPoolExecutor that runs each task in a copy of the submitter's context,
+    so profiler spans and metric labels follow the work into the pool.
+    """
+
+    def submit(self, fn, /, *args, **kwargs):
+        context = copy_context()
+        parent = context.get(_current_span)
+        if context.get(_current_trace) is None:
+            return super().submit(context.run, fn, *args, **kwargs)
+        task_name = getattr(fn, "__name__", "task")
+        return super().submit(context.run, _run_task, task_name, parent, fn,
+                              *args, **kwargs)
+
+
+def _run_task(task_name, parent, fn, *args, **kwargs):
+    with span(task_name, "thread_pool",
+              submitted_from=parent.name if parent else ""):
+        return fn(*args, **kwargs)
+
+
+def critical_path(spans, root):
+    """
+    Compute the critical path below ``root``.
+
+    Starting at the end of a span, the child that finished last is the one the
+    parent waited for; before that child started, the latest child that had
+    already finished is the previous link, and so on. Each chosen child is
+    expanded recursively.
+
+    Returns:
+        list[Span]: Spans on the critical path, in start order.
+    """
+    children = {}
+    for item in spans:
+        if item.end is not None:
+            children.setdefault(item.parent_id, []).append(item)
+
+    def walk(node):
+        path = [node]
+        cursor = node.end
+        candidates = sorted(children.get(node.id, []), key=lambda s: s.end,
+                            reverse=True)
+        for child in candidates:
+            if child.end <= cursor + 1e-6:
+                path.extend(walk(child))
+                cursor = child.start
+        return path
+
+    return sorted(walk(root), key=lambda s: s.start)
+
+
+def write_chrome_trace(trace: Trace, root: Span) -> str:
+    """
+    Write ``trace`` as a Chrome trace-event JSON file.
+
+    Critical-path spans are duplicated on a dedicated "critical path" track
+    and summarised under ``otherData``.
+
+    Returns:
+        str: Path of the written file.
+    """
+    path_spans = critical_path(trace.spans, root)
+    on_path = {s.id for s in path_spans}
+    origin = root.start
+    thread_ids = {}
+    events = []
+
+    def tid_of(item):
+        if item.thread_id not in thread_ids:
+            thread_ids[item.thread_id] = len(thread_ids) + 1
+            events.append({"name": "thread_name", "ph": "M", "pid": 1,
+                           "tid": thread_ids[item.thread_id],
+                           "args": {"name": item.thread_name}})
+        return thread_ids[item.thread_id]
+
+    for item in trace.spans:
+        if item.end is None:
+            continue
+        event = {
+            "name": item.name,
+            "cat": item.category,
+            "ph": "X",
+            "ts": round((item.start - origin) * 1e6),
+            "dur": round(item.duration * 1e6),
+            "pid": 1,
+            "tid": tid_of(item),
+            "args": {**item.args, "critical": item.id in on_path},
+        }
+        events.append(event)
+        if item.id in on_path:
+            events.append({**event, "tid": 0})
+    events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": 0,
+                   "args": {"name": "critical path"}})
+
+    by_category = {}
+    for item in path_spans:
+        # Thời gian "tự thân" của span trên đường găng (trừ các con cũng nằm trên đường găng)
+        child_time = sum(c.duration for c in path_spans if c.parent_id == item.id)
+        by_category[item.category] = by_category.get(item.category, 0.0) + max(
+            item.duration - child_time, 0.0)
+
+    summary = {
+        "hs_id": trace.hs_id,
+        "stage": trace.stage,
+        "started_at": trace.started_at.isoformat(),
+        "total_seconds": round(root.duration, 3),
+        "critical_path": [
+            {"name": s.name, "category": s.category,
+             "start_seconds": round(s.start - origin, 3),
+             "duration_seconds": round(s.duration, 3)}
+            for s in path_spans
+        ],
+        "critical_path_self_seconds_by_category": {
+            k: round(v, 3) for k, v in sorted(by_category.items(),
+                                              key=lambda kv: kv[1], reverse=True)
+        },
+    }
+    logger.info(f"Critical path for hs_id {trace.hs_id} ({trace.stage}): "
+                f"{summary['critical_path_self_seconds_by_category']}")
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    timestamp = trace.started_at.strftime("%Y%m%d_%H%M%S")
+    file_path = os.path.join(PROFILE_DIR,
+                             f"{trace.hs_id}_{trace.stage}_{timestamp}.json")
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                   "otherData": summary}, f, ensure_ascii=False)
+    return file_path
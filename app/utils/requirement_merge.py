@@ -0,0 +1,247 @@
+"""
+Deterministic merge of technical requirement trees extracted chunk by chunk.
+
+The technology node splits documents into overlapping chunks, so a
+requirement straddling a chunk boundary is extracted twice, often once with
+its descriptions cut at the boundary. Trees are merged node by node:
+
+- a node is keyed by its normalised ``muc`` and ``requirement_name``
+  (NFC, lowercase, leading numbering and punctuation removed). A node with
+  no exact key match joins a sibling with a compatible ``muc`` whose name
+  scores at least ``NAME_MATCH_MIN_SCORE`` (RapidFuzz ``token_sort_ratio``);
+- descriptions are de-duplicated by the SHA-1 of their normalised text,
+  then fuzzily: near-identical texts (``DESCRIPTION_MATCH_MIN_SCORE``) and
+  texts contained in a longer one (cut at a chunk boundary) keep only the
+  longest version, at the position of the first;
+- fuzzy matches require the same numbers in both texts, so "Máy chủ loại 1"
+  and "Máy chủ loại 2", or "RAM 16GB" and "RAM 32GB", stay apart;
+- the tree is rebuilt canonically: ``requirement_level_<depth>`` keys,
+  siblings ordered by ``muc`` when every sibling has a distinct numeric one
+  (else in document order: numbering restarted in a chunk), empty ``description`` / ``sub_requirements`` dropped.
+
+The result only depends on the chunk results and their order.
+"""
+import hashlib
+import re
+import unicodedata
+from typing import Dict, List, Optional
+
+from rapidfuzz import fuzz, process
+
+# Điểm tương đồng tối thiểu (0-100) để coi hai tên yêu cầu là một
+NAME_MATCH_MIN_SCORE = 90
+# Điểm tương đồng tối thiểu để coi hai mô tả là một
+DESCRIPTION_MATCH_MIN_SCORE = 95
+# Mô tả bị cắt ở biên chunk: phần ngắn hơn phải đủ dài mới so khớp chứa trong
+DESCRIPTION_CONTAINED_MIN_CHARS = 40
+
+LEVEL_KEY_PATTERN = re.compile(r"^requirement_level_(\d+)$")
+LEADING_NUMBERING_PATTERN = re.compile(r"^\s*(?:[ivxlcdm]+[.)]|[a-zđ][.)]|\d+(?:\.\d+)*[.)]?|[-+*•])\s+", re.IGNORECASE)
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s]+", re.UNICODE)
+MUC_NUMBERS_PATTERN = re.compile(r"^\d+(?:\.\d+)*$")
+NUMBER_PATTERN = re.compile(r"\d+")
+
+
+def normalize_text(text) -> str:
+    text = unicodedata.normalize("NFC", str(text or "")).lower()
+    return " ".join(PUNCTUATION_PATTERN.sub(" ", text).split())
+
+
+def normalize_name(name) -> str:
+    name = unicodedata.normalize("NFC", str(name or "")).strip()
+    while True:
+        stripped = LEADING_NUMBERING_PATTERN.sub("", name, count=1)
+        if stripped == name:
+            break
+        name = stripped
+    return normalize_text(name)
+
+
+def normalize_muc(muc) -> str:
+    return re.sub(r"\s+", "", str(muc or "")).strip(".").lower()
+
+
+def _numbers(normalized: str) -> tuple:
+    return tuple(NUMBER_PATTERN.findall(normalized))
+
+
+def fuzzy_match(query: str, choices: List[str], scorer, score_cutoff: int) -> Optional[int]:
+    """Index of the best choice with the same numbers as ``query`` scoring at least ``score_cutoff``."""
+    numbers = _numbers(query)
+    indexes = [i for i, choice in enumerate(choices) if _numbers(choice) == numbers]
+    match = process.extractOne(query, [choices[i] for i in indexes], scorer=scorer, score_cutoff=score_cutoff)
+    return None if match is None else indexes[match[2]]
+
+
+def _muc_sort_key(muc: str) -> Optional[tuple]:
+    return tuple(int(part) for part in muc.split(".")) if MUC_NUMBERS_PATTERN.match(muc) else None
+
+
+def _description_text(item) -> str:
+    if isinstance(item, dict):
+        return str(item.get("description_detail") or "")
+    return str(item or "")
+
+
+class DistinctTexts:
+    """
+    Texts in first-seen order without duplicates: same normalised text (SHA-1),
+    near-identical text, or text contained in a longer one. The longest
+    version is kept at the position of the first.
+    """
+
+    def __init__(self, texts=()):
+        self.texts: List[str] = []
+        self._normalized: List[str] = []
+        self._keys: Dict[str, int] = {}  # sha1 văn bản chuẩn hóa -> vị trí
+        for text in texts:
+            self.add(text)
+
+    def add(self, text: str):
+        normalized = normalize_text(text)
+        if not normalized:
+            return
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        if digest in self._keys:
+            return
+        existing = self._normalized
+        index = fuzzy_match(normalized, existing, fuzz.ratio, DESCRIPTION_MATCH_MIN_SCORE)
+        if index is None and len(normalized) >= DESCRIPTION_CONTAINED_MIN_CHARS:
+            index = next(
+                (i for i, other in enumerate(existing)
+                 if len(other) >= DESCRIPTION_CONTAINED_MIN_CHARS and (normalized in other or other in normalized)),
+                None)
+        if index is None:
+            self._keys[digest] = len(self.texts)
+            self.texts.append(text)
+            existing.append(normalized)
+            return
+        self._keys[digest] = index
+        # Giữ bản đầy đủ nhất tại vị trí của lần xuất hiện đầu tiên
+        if len(normalized) > len(existing[index]):
+            self.texts[index] = text
+            existing[index] = normalized
+
+
+class _Node:
+    __slots__ = ("muc", "name", "muc_key", "name_key", "descriptions", "children", "child_keys")
+
+    def __init__(self, muc, name):
+        self.muc = muc
+        self.name = name
+        self.muc_key = normalize_muc(muc)
+        self.name_key = normalize_name(name)
+        self.descriptions = DistinctTexts()
+        self.children: List["_Node"] = []
+        self.child_keys: Dict[tuple, "_Node"] = {}
+
+    def child(self, muc, name) -> "_Node":
+        muc_key, name_key = normalize_muc(muc), normalize_name(name)
+        node = self.child_keys.get((muc_key, name_key))
+        if node is None and name_key:
+            candidates = [c for c in self.children if not muc_key or not c.muc_key or c.muc_key == muc_key]
+            index = fuzzy_match(name_key, [c.name_key for c in candidates], fuzz.token_sort_ratio,
+                                 NAME_MATCH_MIN_SCORE)
+            if index is not None:
+                node = candidates[index]
+        if node is None:
+            node = _Node(muc, name)
+            self.children.append(node)
+        elif not node.muc_key and muc_key:
+            node.muc, node.muc_key = muc, muc_key
+        self.child_keys[(muc_key, name_key)] = node
+        return node
+
+    def to_dict(self, depth: int) -> dict:
+        data = {}
+        if self.muc not in (None, ""):
+            data["muc"] = self.muc
+        data["requirement_name"] = self.name
+        if self.descriptions.texts:
+            data["description"] = [{"description_detail": d} for d in self.descriptions.texts]
+        if self.children:
+            data["sub_requirements"] = [
+                {f"requirement_level_{depth + 1}": child.to_dict(depth + 1)} for child in _ordered(self.children)
+            ]
+        return data
+
+
+def _ordered(children: List[_Node]) -> List[_Node]:
+    keys = [_muc_sort_key(c.muc_key) for c in children]
+    if all(key is not None for key in keys) and len(set(keys)) == len(keys):
+        return [c for _, c in sorted(zip(keys, children), key=lambda pair: pair[0])]
+    return children
+
+
+def _requirement_data(item) -> Optional[dict]:
+    """``{"requirement_level_N": {...}}`` -> ``{...}``; None for anything else."""
+    if not isinstance(item, dict):
+        return None
+    for key, value in item.items():
+        if LEVEL_KEY_PATTERN.match(key) and isinstance(value, dict):
+            return value
+    return None
+
+
+def _merge_into(parent: _Node, items):
+    for item in items or []:
+        data = _requirement_data(item)
+        if data is None:
+            continue
+        name = data.get("requirement_name") or ""
+        node = parent.child(data.get("muc"), name)
+        for description in data.get("description") or []:
+            node.descriptions.add(_description_text(description))
+        _merge_into(node, data.get("sub_requirements"))
+
+
+class RequirementTree:
+    """
+    Merged requirement tree built incrementally: ``requirement_level_N``
+    items are merged as they are added (e.g. as they are streamed).
+    """
+
+    def __init__(self, muc: str = "1.", requirement_name: str = "Yêu cầu về kỹ thuật"):
+        self._root = _Node(muc, requirement_name)
+
+    def add(self, items):
+        """Merge ``{"requirement_level_N": {...}}`` items under the root."""
+        _merge_into(self._root, items)
+
+    def add_root(self, data):
+        """Merge the children of a ``requirement_level_0`` value."""
+        if isinstance(data, dict):
+            self.add(data.get("sub_requirements"))
+
+    def to_dict(self) -> dict:
+        merged = self._root.to_dict(0)
+        merged.setdefault("sub_requirements", [])
+        return merged
+
+
+def merge_requirement_trees(roots: List[dict], muc: str = "1.", requirement_name: str = "Yêu cầu về kỹ thuật") -> dict:
+    """
+    Merge the ``requirement_level_0`` trees of all chunk results under one
+    canonical root.
+
+    Args:
+        roots: ``requirement_level_0`` values (``{"sub_requirements": [...]}``).
+        muc, requirement_name: Root of the merged tree.
+
+    Returns:
+        dict: Root data, to be stored under ``requirement_level_0``.
+    """
+    tree = RequirementTree(muc, requirement_name)
+    for data in roots:
+        tree.add_root(data)
+    return tree.to_dict()
+
+
+def count_requirements(tree) -> int:
+    """Number of requirement nodes (rows of ``technical_requirement``) in a tree."""
+    if isinstance(tree, list):
+        return sum(count_requirements(item) for item in tree)
+    data = _requirement_data(tree)
+    if data is None:
+        return 0
+    return 1 + count_requirements(data.get("sub_requirements") or [])
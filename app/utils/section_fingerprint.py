@@ -0,0 +1,318 @@
+"""
+Fingerprint store of already-extracted HSMT sections.
+
+HSMTs follow national templates, so many sections routed to the finance and
+experience nodes are (near-)identical from one tender to the next. Each
+section is normalised (NFC, lowercase, markdown stripped) and fingerprinted:
+
+- ``text_hash``: SHA-1 of the normalised text (exact match);
+- ``simhash``: 64-bit SimHash of word 3-shingles (near-duplicates);
+- ``numbers_hash``: SHA-1 of the numbers of the section, in order. A
+  near-duplicate is only reused when its numbers are identical, so a
+  template filled with another revenue threshold or another year is always
+  re-extracted.
+
+The items the model extracted from a section are stored with its fingerprint
+in ``section_fingerprints``. Lookup is LSH: the SimHash is cut into
+``LSH_BANDS`` bands of 16 bits, candidates share at least one band (any
+fingerprint within 3 bits does), then the Hamming distance is checked.
+Sections found in the store are answered from it; only the others are sent
+to the model.
+
+Entries are keyed by ``version``, a hash of the node's prompt and output
+schema (``extraction_version``): changing either starts from an empty store.
+They expire ``SECTION_STORE_TTL_DAYS`` after they were written. Sections the
+model returned no item for are not stored, and stored items that no longer
+validate against the node's item schema count as a miss.
+"""
+import hashlib
+import json
+import re
+import threading
+import unicodedata
+from typing import List, NamedTuple, Optional, Sequence, Type
+
+import numpy as np
+from pydantic import BaseModel, ValidationError
+
+from app.config.env import EnvSettings
+from app.storage import postgre
+from app.utils.logger import get_logger
+from app.utils.metrics import SECTION_STORE_LOOKUPS
+from app.utils.section_router import Section
+
+logger = get_logger("section_fingerprint")
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)*")
+MARKDOWN_PATTERN = re.compile(r"[|*#_>`~\-]+")
+
+SIMHASH_BITS = 64
+# 4 dải 16 bit: hai SimHash lệch nhau <= 3 bit chắc chắn trùng ít nhất một dải
+LSH_BANDS = 4
+LSH_BAND_BITS = SIMHASH_BITS // LSH_BANDS
+# Dưới số từ này SimHash không ổn định: chỉ dùng khớp chính xác
+SIMHASH_MIN_WORDS = 50
+# Tỷ lệ từ của "Mô tả" phải nằm trong một mục để gán item cho mục đó
+ITEM_ATTRIBUTION_MIN_OVERLAP = 0.8
+
+_table_lock = threading.Lock()
+_table_ready: Optional[bool] = None
+
+
+class SectionFingerprint(NamedTuple):
+    text_hash: str
+    simhash: int
+    numbers_hash: str
+    words: int
+
+    @property
+    def bands(self) -> List[int]:
+        mask = (1 << LSH_BAND_BITS) - 1
+        return [(self.simhash >> (band * LSH_BAND_BITS)) & mask for band in range(LSH_BANDS)]
+
+
+class KnownSections(NamedTuple):
+    items: List[BaseModel]  # item đã bóc tách trước đây, theo thứ tự các mục
+    pending: List[Section]  # các mục vẫn phải gửi cho model
+    fingerprints: List[SectionFingerprint]  # fingerprint của ``pending``
+    version: str  # phiên bản prompt/schema của node
+
+
+def extraction_version(prompt: str, schema: Type[BaseModel]) -> str:
+    """Short hash of a node's prompt text and output JSON schema."""
+    payload = prompt + json.dumps(schema.model_json_schema(), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def normalize_section(text: str) -> str:
+    text = unicodedata.normalize("NFC", text or "").lower()
+    return " ".join(MARKDOWN_PATTERN.sub(" ", text).split())
+
+
+def simhash(words: Sequence[str]) -> int:
+    """64-bit SimHash of the word 3-shingles (each shingle weighs 1)."""
+    if not words:
+        return 0
+    shingles = [" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))]
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles),
+        dtype=np.uint64, count=len(shingles))
+    # Cột j = bit j của mỗi hash; bit của SimHash là bit chiếm đa số
+    bits = np.unpackbits(hashes.astype("<u8").view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    majority = np.flatnonzero(bits.sum(axis=0) * 2 > len(shingles))
+    return sum(1 << int(bit) for bit in majority)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def fingerprint_section(text: str) -> SectionFingerprint:
+    normalized = normalize_section(text)
+    words = WORD_PATTERN.findall(normalized)
+    numbers = "\x1f".join(NUMBER_PATTERN.findall(normalized))
+    return SectionFingerprint(
+        hashlib.sha1(normalized.encode("utf-8")).hexdigest(),
+        simhash(words),
+        hashlib.sha1(numbers.encode("utf-8")).hexdigest(),
+        len(words),
+    )
+
+
+def to_signed(value: int) -> int:
+    """Postgres BIGINT là số có dấu."""
+    return value - (1 << SIMHASH_BITS) if value >= 1 << (SIMHASH_BITS - 1) else value
+
+
+def _ensure_table() -> bool:
+    """Tạo bảng (một lần mỗi process). Không tạo được thì tắt store cho process này."""
+    global _table_ready
+    with _table_lock:
+        if _table_ready is None:
+            try:
+                postgre.executeSQL("""
+                    CREATE TABLE IF NOT EXISTS section_fingerprints (
+                        id BIGSERIAL PRIMARY KEY,
+                        route TEXT NOT NULL,
+                        version TEXT NOT NULL,
+                        text_hash TEXT NOT NULL,
+                        simhash BIGINT NOT NULL,
+                        band0 INTEGER NOT NULL,
+                        band1 INTEGER NOT NULL,
+                        band2 INTEGER NOT NULL,
+                        band3 INTEGER NOT NULL,
+                        numbers_hash TEXT NOT NULL,
+                        words INTEGER NOT NULL,
+                        items JSONB NOT NULL,
+                        hits INTEGER NOT NULL DEFAULT 0,
+                        created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                        updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                        UNIQUE (route, version, text_hash)
+                    );
+                    CREATE INDEX IF NOT EXISTS section_fingerprints_band0 ON section_fingerprints (route, band0);
+                    CREATE INDEX IF NOT EXISTS section_fingerprints_band1 ON section_fingerprints (route, band1);
+                    CREATE INDEX IF NOT EXISTS section_fingerprints_band2 ON section_fingerprints (route, band2);
+                    CREATE INDEX IF NOT EXISTS section_fingerprints_band3 ON section_fingerprints (route, band3);
+                """)
+                _table_ready = True
+            except Exception as e:
+                logger.warning(f"Section fingerprint store disabled: {e}")
+                _table_ready = False
+        return _table_ready
+
+
+def _enabled() -> bool:
+    return EnvSettings().SECTION_STORE_ENABLED and _ensure_table()
+
+
+def lookup(route: str, version: str, fingerprints: Sequence[SectionFingerprint]) -> List[Optional[list]]:
+    """
+    Stored items of each fingerprint (None when unknown), in one query.
+
+    A stored section matches when its text is identical, or when it is within
+    ``SECTION_STORE_MAX_DISTANCE`` bits with identical numbers and both
+    sections are long enough for SimHash to be meaningful. Only non-empty
+    entries of ``version`` younger than ``SECTION_STORE_TTL_DAYS`` are used.
+    """
+    if not fingerprints:
+        return []
+    settings = EnvSettings()
+    bands = [sorted({f.bands[band] for f in fingerprints}) for band in range(LSH_BANDS)]
+    rows = postgre.selectSQL("""
+        SELECT text_hash, simhash, band0, band1, band2, band3, numbers_hash, words, items
+        FROM section_fingerprints
+        WHERE route = %s AND version = %s
+          AND updated_at > NOW() - make_interval(days => %s)
+          AND jsonb_array_length(items) > 0
+          AND (band0 = ANY(%s) OR band1 = ANY(%s) OR band2 = ANY(%s) OR band3 = ANY(%s));
+    """, (route, version, settings.SECTION_STORE_TTL_DAYS, *bands))
+    max_distance = settings.SECTION_STORE_MAX_DISTANCE
+    results, hit_hashes = [], set()
+    for fingerprint in fingerprints:
+        best, best_distance = None, None
+        for row in rows:
+            if row["text_hash"] == fingerprint.text_hash:
+                best, best_distance = row, 0
+                break
+            if row["numbers_hash"] != fingerprint.numbers_hash \
+                    or min(row["words"], fingerprint.words) < SIMHASH_MIN_WORDS:
+                continue
+            if not any(row[f"band{band}"] == value for band, value in enumerate(fingerprint.bands)):
+                continue
+            distance = hamming(row["simhash"] % (1 << SIMHASH_BITS), fingerprint.simhash)
+            if distance <= max_distance and (best_distance is None or distance < best_distance):
+                best, best_distance = row, distance
+        results.append(None if best is None else best["items"])
+        if best is not None:
+            hit_hashes.add(best["text_hash"])
+    if hit_hashes:
+        postgre.executeSQL(
+            "UPDATE section_fingerprints SET hits = hits + 1 "
+            "WHERE route = %s AND version = %s AND text_hash = ANY(%s);",
+            (route, version, sorted(hit_hashes)))
+    return results
+
+
+def store(route: str, version: str, fingerprints: Sequence[SectionFingerprint],
+          items_per_section: Sequence[list]):
+    """Upsert the extraction of each section; sections without items are not stored."""
+    params_list = [
+        (route, version, f.text_hash, to_signed(f.simhash), *f.bands, f.numbers_hash, f.words,
+         json.dumps(items, ensure_ascii=False))
+        for f, items in zip(fingerprints, items_per_section)
+        if items
+    ]
+    if not params_list:
+        return
+    postgre.executeManySQL("""
+        INSERT INTO section_fingerprints
+            (route, version, text_hash, simhash, band0, band1, band2, band3, numbers_hash, words, items)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::jsonb)
+        ON CONFLICT (route, version, text_hash) DO UPDATE SET items = EXCLUDED.items, updated_at = NOW();
+    """, params_list)
+
+
+def attribute_items(sections: Sequence[Section], items: Sequence[dict], key: str = "description") -> Optional[List[list]]:
+    """
+    Assign every extracted item to the section its ``key`` text was copied
+    from (word overlap). None when an item cannot be placed confidently: the
+    extraction of these sections is then not stored.
+    """
+    section_words = [set(WORD_PATTERN.findall(normalize_section(s.text))) for s in sections]
+    per_section = [[] for _ in sections]
+    for item in items:
+        words = set(WORD_PATTERN.findall(normalize_section(item.get(key) or item.get("requirement") or "")))
+        if not words:
+            return None
+        overlaps = [len(words & candidate) / len(words) for candidate in section_words]
+        best = max(range(len(sections)), key=overlaps.__getitem__, default=None)
+        if best is None or overlaps[best] < ITEM_ATTRIBUTION_MIN_OVERLAP:
+            return None
+        per_section[best].append(item)
+    return per_section
+
+
+def _rebuild(item_type: Type[BaseModel], stored: Optional[list], node: str) -> Optional[List[BaseModel]]:
+    """Items of a stored section, None when missing or no longer valid for ``item_type``."""
+    if not stored:
+        return None
+    try:
+        return [item_type.model_validate(item) for item in stored]
+    except (ValidationError, TypeError) as e:
+        logger.warning(f"SECTION_STORE node={node}: stored items do not match {item_type.__name__}, "
+                       f"re-extracting: {e}")
+        return None
+
+
+def partition_sections(route: str, sections: Sequence[Section], node: str,
+                       item_type: Type[BaseModel], version: str) -> KnownSections:
+    """
+    Split routed sections into items already known from the store (rebuilt
+    as ``item_type``) and the sections still to extract. Hit rate is counted
+    per node (``SECTION_STORE_LOOKUPS``) and logged.
+    """
+    fingerprints = [fingerprint_section(s.text) for s in sections]
+    if not sections or not _enabled():
+        return KnownSections([], list(sections), fingerprints, version)
+    try:
+        stored = lookup(route, version, fingerprints)
+    except Exception as e:
+        logger.warning(f"Section fingerprint lookup failed ({node}): {e}")
+        return KnownSections([], list(sections), fingerprints, version)
+
+    items, pending, pending_fingerprints = [], [], []
+    saved_tokens = 0
+    for section, fingerprint, stored_items in zip(sections, fingerprints, stored):
+        known = _rebuild(item_type, stored_items, node)
+        if known is None:
+            pending.append(section)
+            pending_fingerprints.append(fingerprint)
+        else:
+            items.extend(known)
+            saved_tokens += section.tokens
+    hits = len(sections) - len(pending)
+    SECTION_STORE_LOOKUPS.labels(node=node, outcome="hit").inc(hits)
+    SECTION_STORE_LOOKUPS.labels(node=node, outcome="miss").inc(len(pending))
+    logger.info(f"SECTION_STORE node={node} route={route} sections={len(sections)} hits={hits} "
+                f"hit_rate={hits / len(sections):.0%} tokens_saved={saved_tokens}")
+    return KnownSections(items, pending, pending_fingerprints, version)
+
+
+def remember_sections(route: str, known: KnownSections, items: Sequence[dict], node: str) -> bool:
+    """
+    Store the model's extraction of ``known.pending``, section by section.
+    Returns False (nothing stored) when the items cannot be attributed.
+    """
+    if not known.pending or not _enabled():
+        return False
+    per_section = attribute_items(known.pending, items)
+    if per_section is None:
+        logger.info(f"SECTION_STORE node={node}: items not attributable to sections, not stored")
+        return False
+    try:
+        store(route, known.version, known.fingerprints, per_section)
+    except Exception as e:
+        logger.warning(f"Section fingerprint store failed ({node}): {e}")
+        return False
+    return True
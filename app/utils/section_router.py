@@ -0,0 +1,318 @@
+"""
+Relevance-filtered section routing for the extraction nodes.
+
+Markdown chapters are split into headed sections once per content hash. For
+each route (finance, experience, technology, summary) sections are scored
+with BM25 against the route's query plus a weighted Vietnamese keyword
+lexicon, and the best sections are kept within the route's token budget, in
+their original order. Every routing decision is logged for audit.
+"""
+import hashlib
+import json
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from rank_bm25 import BM25Okapi
+
+from app.config.env import EnvSettings
+from app.utils.logger import get_logger
+from app.utils.tokens import count_tokens, truncate_to_tokens
+
+logger = get_logger("section_router")
+
+# Heading markdown (#...), dòng in đậm đứng riêng, dòng "Mục 2", "Chương III", hoặc dòng đánh số
+# kiểu "1.", "2.3", "I." ngắn và không kết thúc bằng dấu câu (mục liệt kê trong danh sách yêu cầu
+# thường dài hoặc kết thúc bằng dấu câu, không được tách thành mục riêng)
+HEADING_PATTERN = re.compile(
+    r"^\s*(?:#{1,6}\s+\S.*"
+    r"|\*\*[^*\n]{3,200}\*\*\s*:?\s*"
+    r"|(?:\d{1,2}(?:\.\d{1,2}){0,3}\.?|[IVXLC]{1,6}\.)\s+[^\s|](?:.{0,78}[^\s.;,!?…])?\s*"
+    r"|(?:Mục|Chương|Phần|Điều)\s+[\dIVXLC]+\b.{0,200})$",
+    re.IGNORECASE,
+)
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+class RouteProfile:
+    """
+    Scoring configuration of one extraction node.
+
+    Args:
+        query: Free-text query describing what the node extracts.
+        lexicon: Keyword/phrase -> weight.
+        token_budget: Maximum tokens passed to the node.
+        min_score: Sections scoring below this are never selected.
+        position_weight: Bonus for early sections (front matter).
+    """
+
+    def __init__(self, query: str, lexicon: Dict[str, float], token_budget: int,
+                 min_score: float = 0.05, position_weight: float = 0.0):
+        self.query = query
+        self.lexicon = lexicon
+        self.token_budget = token_budget
+        self.min_score = min_score
+        self.position_weight = position_weight
+
+
+ROUTES: Dict[str, RouteProfile] = {
+    "finance": RouteProfile(
+        query="yêu cầu năng lực tài chính doanh thu bình quân tài sản ròng báo cáo tài chính nghĩa vụ thuế",
+        lexicon={
+            "tài chính": 3.0, "năng lực tài chính": 4.0, "doanh thu": 3.0,
+            "tài sản ròng": 4.0, "báo cáo tài chính": 3.0, "nghĩa vụ thuế": 3.0,
+            "nguồn lực tài chính": 3.0, "kết quả hoạt động tài chính": 4.0,
+            "khả năng thanh toán": 2.0, "vốn lưu động": 2.0, "lợi nhuận": 1.5,
+            "tín dụng": 1.5, "quyết toán thuế": 2.0, "kiểm toán": 1.0,
+        },
+        token_budget=8000,
+    ),
+    "experience": RouteProfile(
+        query="yêu cầu năng lực kinh nghiệm hợp đồng tương tự số năm hoạt động lịch sử không hoàn thành hợp đồng",
+        lexicon={
+            "kinh nghiệm": 3.0, "hợp đồng tương tự": 4.0, "năng lực": 2.0,
+            "năng lực và kinh nghiệm": 4.0, "số năm": 2.0, "hoạt động": 1.0,
+            "không hoàn thành hợp đồng": 3.0, "kiện tụng": 2.0, "dự án tương tự": 3.0,
+            "giá trị hợp đồng": 2.0, "quy mô": 1.5, "tính chất tương tự": 3.0,
+            "nhà thầu chính": 1.5, "liên danh": 1.0,
+        },
+        token_budget=8000,
+    ),
+    "technology": RouteProfile(
+        query="yêu cầu về kỹ thuật thông số kỹ thuật cấu hình tính năng thiết bị phần mềm giải pháp triển khai",
+        lexicon={
+            "yêu cầu kỹ thuật": 4.0, "yêu cầu về kỹ thuật": 4.0, "thông số": 3.0,
+            "cấu hình": 2.5, "tính năng": 2.5, "chức năng": 2.0, "thiết bị": 2.0,
+            "phần mềm": 2.0, "hệ thống": 1.5, "giải pháp": 2.0, "triển khai": 1.5,
+            "bảo hành": 2.0, "bảo trì": 2.0, "lắp đặt": 1.5, "đào tạo": 1.5,
+            "tiêu chuẩn": 1.0, "nhân sự": 2.0, "chứng chỉ": 1.5, "hàng hóa": 1.5,
+        },
+        # Node kỹ thuật cần gần như toàn bộ HSKT: chỉ loại các phần rõ ràng không liên quan
+        token_budget=60000,
+        min_score=0.02,
+    ),
+    "summary": RouteProfile(
+        query="chủ đầu tư bên mời thầu tên gói thầu dự án số hiệu gói thầu ngày phát hành quyết định phê duyệt",
+        lexicon={
+            "chủ đầu tư": 4.0, "bên mời thầu": 3.0, "gói thầu": 3.0, "tên gói thầu": 4.0,
+            "dự án": 2.0, "số hiệu": 3.0, "phát hành": 3.0, "quyết định": 2.5,
+            "phê duyệt": 2.5, "hồ sơ mời thầu": 1.5, "ngày": 0.5,
+        },
+        token_budget=6000,
+        position_weight=0.5,
+    ),
+}
+
+
+class Section:
+    """One headed section of a markdown document."""
+
+    __slots__ = ("doc_index", "index", "heading", "text", "tokens", "terms", "heading_terms")
+
+    def __init__(self, doc_index: int, index: int, heading: str, text: str):
+        self.doc_index = doc_index
+        self.index = index
+        self.heading = heading
+        self.text = text
+        self.tokens = count_tokens(text)
+        self.terms = tokenize(text)
+        self.heading_terms = set(tokenize(heading))
+
+
+def normalize_text(text: str) -> str:
+    return unicodedata.normalize("NFC", text).lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """Âm tiết + cặp âm tiết liền kề (tiếng Việt ghép từ nhiều âm tiết)."""
+    words = WORD_PATTERN.findall(normalize_text(text))
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+
+def split_sections(markdown: str) -> List[tuple]:
+    """
+    Split markdown into ``(heading, text)`` sections. Text before the first
+    heading forms a section with an empty heading. Table rows never start a
+    section.
+    """
+    sections = []
+    heading, lines = "", []
+    for line in markdown.splitlines():
+        stripped = line.strip()
+        if stripped and not stripped.startswith("|") and HEADING_PATTERN.match(stripped):
+            if any(l.strip() for l in lines) or heading:
+                sections.append((heading, "\n".join(lines)))
+            heading, lines = stripped, [line]
+        else:
+            lines.append(line)
+    if any(l.strip() for l in lines) or heading:
+        sections.append((heading, "\n".join(lines)))
+    return sections
+
+
+class _SectionIndex:
+    """Sections + BM25 index of a set of documents (query independent)."""
+
+    def __init__(self, documents: List[str]):
+        self.sections: List[Section] = []
+        for doc_index, document in enumerate(documents):
+            for index, (heading, text) in enumerate(split_sections(document)):
+                self.sections.append(Section(doc_index, index, heading, text))
+        self.total_tokens = sum(s.tokens for s in self.sections)
+        self.bm25 = BM25Okapi([s.terms or ["_"] for s in self.sections]) if self.sections else None
+
+
+_INDEX_CACHE: "OrderedDict[tuple, _SectionIndex]" = OrderedDict()
+_INDEX_CACHE_SIZE = 32
+_index_lock = threading.Lock()
+
+
+def _get_index(documents: List[str]) -> _SectionIndex:
+    key = tuple(hashlib.sha1(d.encode("utf-8")).hexdigest() for d in documents)
+    with _index_lock:
+        if key in _INDEX_CACHE:
+            _INDEX_CACHE.move_to_end(key)
+            return _INDEX_CACHE[key]
+    index = _SectionIndex(documents)
+    with _index_lock:
+        _INDEX_CACHE[key] = index
+        while len(_INDEX_CACHE) > _INDEX_CACHE_SIZE:
+            _INDEX_CACHE.popitem(last=False)
+    return index
+
+
+def _lexicon_score(section: Section, lexicon: Dict[str, float]) -> float:
+    text = normalize_text(section.text)
+    heading = normalize_text(section.heading)
+    score = 0.0
+    for phrase, weight in lexicon.items():
+        hits = text.count(phrase)
+        if hits:
+            # Bão hòa theo số lần xuất hiện; xuất hiện ở tiêu đề được nhân 3
+            score += weight * (1 + min(hits, 5) / 5)
+        if phrase in heading:
+            score += 3 * weight
+    return score
+
+
+def score_sections(index: _SectionIndex, profile: RouteProfile) -> List[float]:
+    """Combined score in [0, ~1.5]: normalised BM25, lexicon and position prior."""
+    if not index.sections:
+        return []
+    bm25_scores = index.bm25.get_scores(tokenize(profile.query))
+    lexicon_scores = [_lexicon_score(s, profile.lexicon) for s in index.sections]
+    max_bm25 = max(max(bm25_scores), 1e-9)
+    max_lexicon = max(max(lexicon_scores), 1e-9)
+    scores = []
+    for section, bm25, lexicon in zip(index.sections, bm25_scores, lexicon_scores):
+        score = 0.6 * max(bm25, 0.0) / max_bm25 + 0.4 * lexicon / max_lexicon
+        if profile.position_weight and section.doc_index == 0:
+            score += profile.position_weight / (1 + section.index)
+        scores.append(score)
+    return scores
+
+
+def route_sections(documents: List[str], route: str, hs_id: Optional[str] = None) -> List[str]:
+    """
+    Keep only the sections of ``documents`` relevant to ``route``.
+
+    Args:
+        documents: Markdown documents (one per chapter/file).
+        route: Key of ``ROUTES``.
+        hs_id: Dossier id, for the audit log.
+
+    Returns:
+        List[str]: One string per document that kept at least one section, with
+        sections in their original order. Documents are returned unchanged when
+        routing is disabled or they already fit the budget.
+    """
+    documents = [d for d in documents if d and d.strip()]
+    if not documents or not EnvSettings().SECTION_ROUTER_ENABLED:
+        return documents
+    index = _get_index(documents)
+    if index.total_tokens <= ROUTES[route].token_budget:
+        _audit(hs_id, route, ROUTES[route], index, None, index.total_tokens)
+        return documents
+    selected = _select(index, route, hs_id)
+
+    routed = []
+    for doc_index in range(len(documents)):
+        parts = [selected[i] for i, s in enumerate(index.sections)
+                 if s.doc_index == doc_index and i in selected]
+        if parts:
+            routed.append("\n".join(parts))
+    return routed
+
+
+def select_sections(documents: List[str], route: str, hs_id: Optional[str] = None) -> List[Section]:
+    """
+    Same selection as ``route_sections``, returned as ``Section`` objects in
+    document order (for callers working per section). A section truncated to
+    the budget is returned with its truncated text.
+    """
+    documents = [d for d in documents if d and d.strip()]
+    if not documents:
+        return []
+    index = _get_index(documents)
+    if not EnvSettings().SECTION_ROUTER_ENABLED:
+        return list(index.sections)
+    if index.total_tokens <= ROUTES[route].token_budget:
+        _audit(hs_id, route, ROUTES[route], index, None, index.total_tokens)
+        return list(index.sections)
+    selected = _select(index, route, hs_id)
+    return [
+        section if selected[i] is section.text else Section(section.doc_index, section.index, section.heading, selected[i])
+        for i, section in enumerate(index.sections) if i in selected
+    ]
+
+
+def _select(index: _SectionIndex, route: str, hs_id: Optional[str]) -> Dict[int, str]:
+    """Section index -> kept text, best scores first within the route's token budget."""
+    profile = ROUTES[route]
+    scores = score_sections(index, profile)
+    ranked = sorted(range(len(index.sections)), key=lambda i: scores[i], reverse=True)
+    selected, used = {}, 0
+    for i in ranked:
+        section = index.sections[i]
+        if scores[i] < profile.min_score and selected:
+            break
+        if used + section.tokens <= profile.token_budget:
+            selected[i] = section.text
+            used += section.tokens
+        elif not selected:
+            # Phần liên quan nhất lớn hơn budget: cắt bớt thay vì bỏ trống
+            selected[i] = truncate_to_tokens(section.text, profile.token_budget)
+            used = profile.token_budget
+
+    _audit(hs_id, route, profile, index, (scores, selected), used)
+    return selected
+
+
+def _audit(hs_id, route, profile, index, decision, tokens_after):
+    record = {
+        "hs_id": hs_id,
+        "route": route,
+        "token_budget": profile.token_budget,
+        "tokens_before": index.total_tokens,
+        "tokens_after": tokens_after,
+        "sections_total": len(index.sections),
+    }
+    if decision is None:
+        record["decision"] = "passthrough"
+    else:
+        scores, selected = decision
+        record["decision"] = "routed"
+        record["sections"] = [
+            {
+                "doc": s.doc_index,
+                "idx": s.index,
+                "heading": s.heading[:80],
+                "tokens": s.tokens,
+                "score": round(scores[i], 3),
+                "kept": i in selected,
+            }
+            for i, s in enumerate(index.sections)
+        ]
+    logger.info("SECTION_ROUTING " + json.dumps(record, ensure_ascii=False))
@@ -0,0 +1,47 @@
+from functools import lru_cache
+
+import tiktoken
+
+from app.utils.logger import get_logger
+
+logger = get_logger("tokens")
+
+# Ước lượng khi không nạp được bảng BPE (worker offline, cache chưa có): tiếng Việt ~3 ký tự/token
+APPROX_CHARS_PER_TOKEN = 3
+
+
+@lru_cache(maxsize=4)
+def get_encoding(encoding_name: str = "o200k_base"):
+    """
+    Return (and cache) a tiktoken encoding. ``o200k_base`` is used by gpt-4o/gpt-4o-mini.
+
+    The BPE file is read from ``TIKTOKEN_CACHE_DIR`` (pre-fetched in the Docker
+    image). When it cannot be loaded, None is cached and tokens are estimated
+    from the text length, so an offline worker does not fail inside a node.
+    """
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        logger.warning(f"tiktoken encoding {encoding_name} unavailable, estimating tokens from length: {e}")
+        return None
+
+
+def count_tokens(text: str, encoding_name: str = "o200k_base") -> int:
+    """Count the tokens of ``text`` as the OpenAI model would."""
+    if not text:
+        return 0
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return -(-len(text) // APPROX_CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, encoding_name: str = "o200k_base") -> str:
+    """Cut ``text`` to at most ``max_tokens`` tokens."""
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return text[:max_tokens * APPROX_CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
@@ -0,0 +1,262 @@
+"""
+Benchmark: chapter detection helpers of ``app.utils.extract_by_chapter_md``
+on large markdown, legacy per-line loop (patterns compiled per call, two or
+three regexes per line) vs. the module-level registry and the single-pass
+``HEADING_LEXER``. Checks that both detect the same chapters, and compares
+the detection cost with reading the file from disk.
+
+Usage:
+    python -m benchmarks.bench_chapter_detection [--sizes 1 2 4 8] [--runs 5]
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import tempfile
+import time
+
+from app.utils.extract_by_chapter_md import (
+    detect_chapters,
+    filter_real_chapters,
+    get_chapter_pattern,
+    is_chapter_heading,
+    read_markdown_lines,
+)
+
+FILLER = [
+    "Nhà thầu phải cung cấp đầy đủ tài liệu chứng minh năng lực theo quy định.",
+    "| STT | Hạng mục | Đơn vị | Số lượng | Ghi chú |",
+    "|---|---|---|---|---|",
+    "| 1 | Máy chủ ứng dụng | Bộ | 2 | Theo cấu hình đề xuất |",
+    "",
+    "### 1.2. Yêu cầu chung",
+    "- Thời hạn có hiệu lực của hồ sơ dự thầu là 90 ngày kể từ ngày đóng thầu.",
+    "**Ghi chú:** các tài liệu được lập bằng tiếng Việt.",
+    "Chương này quy định các bước đánh giá hồ sơ dự thầu.",
+]
+HEADINGS = [
+    "# **Chương I. CHỈ DẪN NHÀ THẦU**", "# Chương II. BẢNG DỮ LIỆU ĐẤU THẦU",
+    "## Chương III: Tiêu chuẩn đánh giá hồ sơ dự thầu", "CHƯƠNG IV. BIỂU MẪU DỰ THẦU",
+    "Phần 2 - YÊU CẦU VỀ KỸ THUẬT", "# **Chương V.** Yêu cầu về kỹ thuật", "Chapter 6 Contract",
+]
+
+
+def legacy_detect_chapters(lines):
+    """Bản sao vòng lặp phát hiện chương cũ: biên dịch regex mỗi lần gọi, 2-3 regex mỗi dòng."""
+    # Method 1: Look for explicit markdown headings with chapter patterns
+    heading_pattern = re.compile(r'^(#{1,3})\s+(.*?)$', re.MULTILINE)
+
+   # Updated chapter pattern to better match Vietnamese documents
+    chapter_pattern = re.compile(
+        r'^(Chương|Chapter|CHƯƠNG|CHAPTER|Phần|PHẦN)\s+([0-9IVX]+)(?:[\s\.:\-]+(.*))?', re.IGNORECASE)
+
+    # New pattern for uppercase chapter titles
+    uppercase_chapter_pattern = re.compile(
+        r'^(CHƯƠNG|CHAPTER|PHẦN)\s+([0-9IVX]+)', re.MULTILINE)
+
+    # Pattern for bold markdown in headings (e.g., # **Chương II.**)
+    bold_pattern = re.compile(r'\*\*(.*?)\*\*')
+
+    chapter_candidates = []
+
+    for line_idx, line in enumerate(lines):
+        # Check if there's a blank line after this line (for confidence boosting)
+        followed_by_blank_line = (line_idx < len(
+            lines) - 1 and lines[line_idx + 1].strip() == '')
+
+        heading_match = heading_pattern.match(line)
+        if heading_match:
+            heading_level = len(heading_match.group(1))
+            heading_text = heading_match.group(2).strip()
+
+            # Check for bold markdown in the heading
+            bold_match = bold_pattern.search(heading_text)
+            if bold_match:
+                # Extract the text within the bold markers
+                bold_text = bold_match.group(1).strip()
+                # Check if the bold text contains a chapter pattern
+                chapter_match = chapter_pattern.search(bold_text)
+                if chapter_match:
+                    confidence = 0.9  # Higher confidence for bold chapter headings
+
+                    # Boost confidence if followed by blank line
+                    if followed_by_blank_line:
+                        confidence += 0.05
+
+                    # Extract the chapter details
+                    chapter_num_value = chapter_match.group(2)
+                    chapter_title_text = chapter_match.group(
+                        3) if chapter_match.group(3) else ""
+                    chapter_title_text = chapter_title_text.strip()
+
+                    chapter_candidates.append({
+                        "title": line.strip(),
+                        "line": line_idx + 1,
+                        "content_start": line_idx,
+                        "confidence": confidence,
+                        "method": "bold_heading",
+                        "heading_level": heading_level,
+                        "chapter_num": chapter_num_value,
+                        "is_uppercase": bold_text.upper() == bold_text,
+                        "title_text": chapter_title_text,
+                        "title_is_uppercase": chapter_title_text.upper() == chapter_title_text if chapter_title_text else False,
+                        "followed_by_blank": followed_by_blank_line
+                    })
+                    continue  # Skip further processing of this line
+
+            # Regular chapter heading check
+            chapter_match = chapter_pattern.search(heading_text)
+            if chapter_match:
+                confidence = 0.8  # High confidence for standard markdown headings
+
+                # Adjust confidence based on heading level
+                if heading_level == 1:
+                    confidence += 0.1  # Highest for H1 headings
+                elif heading_level == 2:
+                    confidence += 0.05  # Good for H2 headings
+
+                # Boost confidence if followed by blank line
+                if followed_by_blank_line:
+                    confidence += 0.05
+
+                # Extract the actual chapter title (text after chapter number)
+                chapter_num_value = chapter_match.group(2)
+                chapter_title_text = chapter_match.group(
+                    3) if chapter_match.group(3) else ""
+                chapter_title_text = chapter_title_text.strip()
+
+                # Check if the chapter title part is uppercase
+                title_is_uppercase = False
+                if chapter_title_text and chapter_title_text.upper() == chapter_title_text:
+                    confidence += 0.15  # Bonus for uppercase title text
+                    title_is_uppercase = True
+
+                chapter_candidates.append({
+                    "title": line.strip(),
+                    "line": line_idx + 1,
+                    "content_start": line_idx,
+                    "confidence": confidence,
+                    "method": "heading",
+                    "heading_level": heading_level,
+                    "chapter_num": chapter_num_value,
+                    "is_uppercase": heading_text.upper() == heading_text,
+                    "title_text": chapter_title_text,
+                    "title_is_uppercase": title_is_uppercase,
+                    "followed_by_blank": followed_by_blank_line
+                })
+
+        # Method 2: Check for chapter patterns without markdown headings
+        elif re.match(r'^(Chương|Chapter|CHƯƠNG|CHAPTER|Phần|PHẦN)\s+([0-9IVX]+)', line, re.IGNORECASE):
+            # Look for special formatting indicators
+            is_capitalized = line.upper() == line
+            # Indentation as centering proxy
+            is_centered = line.startswith(' ' * 4)
+
+            confidence = 0.5  # Base confidence
+
+            # Boost confidence if followed by blank line
+            if followed_by_blank_line:
+                confidence += 0.15  # Higher boost for plain text headings
+
+            # Extract the chapter title part
+            chapter_match = chapter_pattern.search(line)
+            chapter_num_value = chapter_match.group(2)
+            chapter_title_text = chapter_match.group(
+                3) if chapter_match.group(3) else ""
+            chapter_title_text = chapter_title_text.strip()
+
+            # Check if the chapter title part is uppercase
+            title_is_uppercase = False
+            if chapter_title_text and chapter_title_text.upper() == chapter_title_text:
+                confidence += 0.2  # Increased bonus for uppercase title text
+                title_is_uppercase = True
+
+            if is_capitalized:
+                confidence += 0.1  # Bonus for entire line being uppercase
+
+            if is_centered:
+                confidence += 0.1
+
+            # Special check for "CHƯƠNG X" pattern (all uppercase)
+            if uppercase_chapter_pattern.search(line):
+                confidence += 0.1  # Additional bonus for uppercase "CHƯƠNG" keyword
+
+            chapter_candidates.append({
+                "title": line.strip(),
+                "line": line_idx + 1,
+                "content_start": line_idx,
+                "confidence": confidence,
+                "method": "text_pattern",
+                "is_uppercase": is_capitalized,
+                "is_centered": is_centered,
+                "title_text": chapter_title_text,
+                "title_is_uppercase": title_is_uppercase,
+                "chapter_num": chapter_num_value,
+                "followed_by_blank": followed_by_blank_line
+            })
+
+        # Method 3: Check for bold chapter pattern without markdown headings
+
+    # De-duplicate and merge results from different methods
+    return filter_real_chapters(chapter_candidates)
+
+
+def make_lines(size_mb: float, rng: random.Random):
+    """Markdown tổng hợp ~size_mb MB; các tiêu đề chương rải đều, mỗi tiêu đề theo sau bởi dòng trống."""
+    lines, size = [], 0
+    target = int(size_mb * 1024 * 1024)
+    while size < target:
+        line = rng.choice(FILLER)
+        lines.append(line)
+        size += len(line.encode("utf-8")) + 1
+    step = max(1, len(lines) // (len(HEADINGS) + 1))
+    for i, heading in enumerate(HEADINGS):
+        position = (i + 1) * step + i * 2
+        lines[position:position] = [heading, ""]
+    return lines
+
+
+def timed(func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def legacy_is_chapter_heading(line):
+    """is_chapter_heading cũ: dựng lại chuỗi pattern và tra cache của re ở mỗi lần gọi."""
+    return bool(re.match(get_chapter_pattern("any"), line, re.MULTILINE))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 2, 4, 8], help="Kích thước markdown (MB)")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    print(f"{'MB':>5} {'read (ms)':>10} {'legacy (ms)':>12} {'lexer (ms)':>11} {'speedup':>8} "
+          f"{'heading legacy/new (ms)':>24} {'same':>5}")
+    for size in args.sizes:
+        lines = make_lines(size, rng)
+        with tempfile.NamedTemporaryFile("w", suffix=".md", encoding="utf-8", delete=False) as file:
+            file.write("\n".join(lines))
+        try:
+            read = timed(lambda: read_markdown_lines(file.name), args.runs)
+        finally:
+            os.remove(file.name)
+        same = legacy_detect_chapters(lines) == detect_chapters(lines)
+        legacy = timed(lambda: legacy_detect_chapters(lines), args.runs)
+        lexer = timed(lambda: detect_chapters(lines), args.runs)
+        heading_legacy = timed(lambda: [legacy_is_chapter_heading(line) for line in lines], args.runs)
+        heading_new = timed(lambda: [is_chapter_heading(line) for line in lines], args.runs)
+        print(f"{size:>5.1f} {read * 1000:>10.1f} {legacy * 1000:>12.1f} {lexer * 1000:>11.1f} "
+              f"{legacy / max(lexer, 1e-9):>7.1f}x {heading_legacy * 1000:>11.1f} / {heading_new * 1000:<10.1f} "
+              f"{'yes' if same else 'NO':>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark: document-type classification on large markdown, legacy chain of
+``lower()`` + ``in`` / ``re.search`` checks vs. ``keyword_matcher.document_type``
+(same chain, one anchored regex per signal). Also checks that both give the
+same document type on whole documents of several hundred KB, with titles and
+keywords anywhere, including far from the start.
+
+Usage:
+    python -m benchmarks.bench_keyword_matcher [--sizes 1 2 4 8] [--runs 5]
+"""
+import argparse
+import random
+import re
+import statistics
+import time
+
+from app.utils.keyword_matcher import document_type
+
+FILLER = [
+    "Nhà thầu phải cung cấp đầy đủ tài liệu chứng minh năng lực theo quy định.",
+    "| STT | Hạng mục | Đơn vị | Số lượng | Ghi chú |",
+    "|---|---|---|---|---|",
+    "| 1 | Máy chủ ứng dụng | Bộ | 2 | Theo cấu hình đề xuất |",
+    "Thời hạn có hiệu lực của hồ sơ dự thầu là 90 ngày kể từ ngày có thời điểm đóng thầu.",
+    "Bên mời thầu sẽ xem xét, đánh giá theo các bước quy định tại Chương này.",
+    "Các tài liệu được lập bằng tiếng Việt, đóng thành quyển và có mục lục.",
+]
+SIGNAL_LINES = [
+    "# HỒ SƠ MỜI THẦU", "Chương I. Chỉ dẫn nhà thầu", "Chương II. Bảng dữ liệu đấu thầu",
+    "Mục 3. Tiêu chuẩn đánh giá về kỹ thuật", "THÔNG BÁO MỜI THẦU", "Thời điểm đóng thầu: 09:30 ngày 12/05/2025",
+    "Chương V. Yêu cầu về kỹ thuật", "Phần 2: Yêu cầu về phạm vi cung cấp",
+]
+
+
+def legacy_classify(text):
+    """Bản sao chuỗi điều kiện cũ của classify_document_from_text (chỉ để so sánh)."""
+    text_lower = text.lower()
+    if "tiêu chuẩn đánh giá về kỹ thuật" in text_lower and "chỉ dẫn nhà thầu" not in text_lower:
+        return "TCDGKT"
+    if "hồ sơ mời thầu" in text_lower and any(keyword in text_lower for keyword in
+                                              ["chỉ dẫn nhà thầu", "chỉ dẫn đối với nhà thầu", "bảng dữ liệu đấu thầu", "phần 1:", "phần 2:"]):
+        return "HSMT"
+    if "thông báo mời thầu" in text_lower and (
+        any(keyword in text_lower for keyword in ["gói thầu", "đóng thầu", "mở thầu",
+                                                  "ngày tháng năm", "đấu thầu", "giá dự toán",
+                                                  "địa điểm phát hành", "địa điểm nộp",
+                                                  "bảo đảm dự thầu", "thời gian thực hiện"]) or
+        re.search(r"\d{1,2}[/-]\d{1,2}[/-]\d{2,4}", text_lower) or
+        re.search(r"\d{1,2}:\d{2}", text_lower)
+    ):
+        return "TBMT"
+    if (re.search(r"hồ\s+sơ\s+k[ỹy]\s*thu[ậa]t", text_lower) or
+            re.search(r"yêu\s+cầu\s+k[ỹy]\s*thu[ậa]t\s+chi\s+tiết", text_lower) or
+            re.search(r"thuyết\s+minh\s+k[ỹy]\s*thu[ậa]t", text_lower) or
+            re.search(r"k[ỹy]\s*thu[ậa]t", text_lower) or
+            re.search(r"yêu\s+cầu\s+về\s+k[ỹy]\s*thu[ậa]t", text_lower)) and "tiêu chuẩn đánh giá" not in text_lower:
+        return "HSKT"
+    return "unknown"
+
+
+def make_document(size_mb: float, rng: random.Random, signals=None, after: float = 0.0) -> str:
+    """
+    Markdown tổng hợp ~size_mb MB, chèn các dòng tín hiệu ở vị trí ngẫu nhiên
+    trong phần sau tỷ lệ ``after`` của văn bản (``after=0.9``: tín hiệu nằm ở cuối).
+    """
+    lines, size = [], 0
+    target = int(size_mb * 1024 * 1024)
+    while size < target:
+        line = rng.choice(FILLER)
+        lines.append(line)
+        size += len(line.encode("utf-8")) + 1
+    for signal in signals if signals is not None else SIGNAL_LINES:
+        lines.insert(rng.randrange(int(len(lines) * after), len(lines) + 1), signal)
+    return "\n".join(lines)
+
+
+def timed(func, text, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func(text)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def check_agreement(rng: random.Random, cases: int = 200) -> int:
+    """Số tài liệu 0.1-0.6 MB mà hai cách phân loại khác nhau (tín hiệu ở bất kỳ đâu, kể cả cuối văn bản)."""
+    mismatches = 0
+    for _ in range(cases):
+        signals = rng.sample(SIGNAL_LINES, rng.randint(0, len(SIGNAL_LINES)))
+        text = make_document(rng.uniform(0.1, 0.6), rng, signals, after=rng.choice([0.0, 0.5, 0.9]))
+        if legacy_classify(text) != document_type(text):
+            mismatches += 1
+    return mismatches
+
+
+def check_late_titles(rng: random.Random) -> int:
+    """Các trường hợp tiêu đề xuất hiện muộn: mục tiêu chuẩn đánh giá kỹ thuật, HSMT sau 30k ký tự."""
+    cases = [
+        make_document(0.45, rng, ["Chương V. Yêu cầu về kỹ thuật", "Mục 3. Tiêu chuẩn đánh giá về kỹ thuật"], after=0.9),
+        make_document(0.3, rng, ["# HỒ SƠ MỜI THẦU", "Chương I. Chỉ dẫn nhà thầu"], after=0.2),
+        make_document(0.3, rng, ["THÔNG BÁO MỜI THẦU", "Thời điểm đóng thầu: 09:30 ngày 12/05/2025"], after=0.8),
+    ]
+    return sum(legacy_classify(text) != document_type(text) for text in cases)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 2, 4, 8], help="Kích thước markdown (MB)")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    print(f"Agreement check: {check_agreement(rng)} mismatches / 200 random 0.1-0.6 MB documents, "
+          f"{check_late_titles(rng)} mismatches / 3 late-title documents")
+    # Trường hợp xấu nhất của chuỗi cũ: không có tín hiệu nào, mọi điều kiện đều quét hết văn bản
+    for label, signals in (("with signals", None), ("no signals", [])):
+        print(f"\n[{label}]")
+        print(f"{'MB':>6} {'legacy (ms)':>12} {'document_type (ms)':>19} {'ms/MB':>7}")
+        for size in args.sizes:
+            text = make_document(size, rng, signals)
+            legacy = timed(legacy_classify, text, args.runs)
+            current = timed(document_type, text, args.runs)
+            print(f"{size:>6.1f} {legacy * 1000:>12.1f} {current * 1000:>19.1f} {current * 1000 / size:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
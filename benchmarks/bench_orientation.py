@@ -0,0 +1,190 @@
+"""
+Benchmark: page orientation detection, legacy full-resolution checks
+(``rotate_table_image`` then ``detect_and_correct_orientation`` on the page
+rendered at zoom 3.5) vs. ``app.utils.orientation.correct_orientation``
+(decision on a thumbnail, one rotation at full resolution).
+
+Reports, per sample page, the rotation decided by each and the CPU time per
+page. Sample scans are given as PDFs; without ``--pdf`` synthetic pages are
+used (text, table, and both turned on their side).
+
+Usage:
+    python -m benchmarks.bench_orientation [--pdf scan1.pdf scan2.pdf] [--max-pages 10] [--runs 3]
+"""
+import argparse
+import io
+import random
+import statistics
+import time
+
+import cv2
+import fitz
+import numpy as np
+import PIL.Image
+from PIL import ImageDraw, ImageFont
+
+from app.utils.orientation import correct_orientation, detect_orientation
+
+ZOOM = 3.5
+A4_SIZE = (int(595 * ZOOM), int(842 * ZOOM))
+
+
+def legacy_rotate_table_image(img):
+    """Bản sao rotate_table_image cũ (bỏ phần debug), chạy trên ảnh độ phân giải đầy đủ."""
+    img_cv = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+    gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(gray, 50, 150, apertureSize=3)
+    lines = cv2.HoughLinesP(edges, 1, np.pi/180, 80, minLineLength=100, maxLineGap=10)
+    h_count = v_count = 0
+    if lines is not None:
+        for line in lines:
+            x1, y1, x2, y2 = line[0]
+            if abs(x2 - x1) > abs(y2 - y1):
+                h_count += 1
+            else:
+                v_count += 1
+    if not (h_count > 0 and v_count > 0 and v_count > h_count * 1.2):
+        return img
+    padding = 10
+    padded_img = cv2.copyMakeBorder(img_cv, padding, padding, padding, padding,
+                                    cv2.BORDER_CONSTANT, value=(255, 255, 255))
+    padded_height, padded_width = padded_img.shape[:2]
+    rotation_matrix = cv2.getRotationMatrix2D((padded_width // 2, padded_height // 2), -90, 1.0)
+    rotation_matrix[0, 2] += (padded_height - padded_width) / 2
+    rotation_matrix[1, 2] += (padded_width - padded_height) / 2
+    rotated = cv2.warpAffine(padded_img, rotation_matrix, (padded_height, padded_width),
+                             flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_CONSTANT, borderValue=(255, 255, 255))
+    rotated = cv2.filter2D(rotated, -1, np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]]))
+    return PIL.Image.fromarray(cv2.cvtColor(rotated, cv2.COLOR_BGR2RGB))
+
+
+def legacy_detect_and_correct_orientation(img):
+    """Bản sao detect_and_correct_orientation cũ (bỏ phần debug)."""
+    img_cv = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+    gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 15, 2)
+    h_lines_total = v_lines_total = 0
+    for length in (20, 40):
+        h_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (length, 1))
+        v_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, length))
+        h_lines_total += cv2.countNonZero(cv2.morphologyEx(thresh, cv2.MORPH_OPEN, h_kernel))
+        v_lines_total += cv2.countNonZero(cv2.morphologyEx(thresh, cv2.MORPH_OPEN, v_kernel))
+    if not v_lines_total > h_lines_total * 1.1:
+        return img
+    height, width = img_cv.shape[:2]
+    rotation_matrix = cv2.getRotationMatrix2D((width // 2, height // 2), -90, 1.0)
+    rotated = cv2.warpAffine(img_cv, rotation_matrix, (height, width))
+    return PIL.Image.fromarray(cv2.cvtColor(rotated, cv2.COLOR_BGR2RGB))
+
+
+def legacy_correct(img):
+    """Luồng cũ trong convert_pdf_to_text, kể cả phép so sánh ảnh ``img_rot == img``."""
+    img_rot = legacy_rotate_table_image(img)
+    if img_rot == img:
+        img_rot = legacy_detect_and_correct_orientation(img)
+    return img_rot
+
+
+def legacy_angle(img):
+    return 0 if legacy_correct(img) is img else -90
+
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1
+        return ImageFont.load_default()
+
+
+def synthetic_text_page(rng: random.Random) -> PIL.Image.Image:
+    img = PIL.Image.new("RGB", A4_SIZE, "white")
+    draw = ImageDraw.Draw(img)
+    font = _font(36)
+    words = ["nhà", "thầu", "hồ", "sơ", "dự", "thầu", "kỹ", "thuật", "gói", "thầu", "bảo", "đảm", "tiến", "độ"]
+    y = 200
+    while y < A4_SIZE[1] - 200:
+        line = " ".join(rng.choice(words) for _ in range(rng.randint(8, 14)))
+        draw.text((180, y), line, fill="black", font=font)
+        y += 60 if rng.random() > 0.15 else 120
+    return img
+
+
+def synthetic_table_page(rng: random.Random) -> PIL.Image.Image:
+    img = PIL.Image.new("RGB", A4_SIZE, "white")
+    draw = ImageDraw.Draw(img)
+    font = _font(30)
+    left, right, top = 150, A4_SIZE[0] - 150, 300
+    columns = [left] + sorted(rng.sample(range(left + 200, right - 200), 4)) + [right]
+    rows = list(range(top, A4_SIZE[1] - 300, 110))
+    for y in rows:
+        draw.line([(left, y), (right, y)], fill="black", width=4)
+    for x in columns:
+        draw.line([(x, rows[0]), (x, rows[-1])], fill="black", width=4)
+    for y in rows[:-1]:
+        for x0, x1 in zip(columns, columns[1:]):
+            draw.text((x0 + 15, y + 35), str(rng.randint(1, 99999)), fill="black", font=font)
+    return img
+
+
+def synthetic_pages(seed: int = 42):
+    rng = random.Random(seed)
+    pages = []
+    for kind, make in (("text", synthetic_text_page), ("table", synthetic_table_page)):
+        for i in range(3):
+            page = make(rng)
+            pages.append((f"{kind}-{i}", page))
+            # Trang bị xoay ngược chiều kim đồng hồ: cần xoay lại theo chiều kim đồng hồ
+            pages.append((f"{kind}-{i}-sideways", page.transpose(PIL.Image.ROTATE_90)))
+    return pages
+
+
+def pdf_pages(paths, max_pages):
+    pages = []
+    for path in paths:
+        with fitz.open(path) as pdf_document:
+            for page_num in range(min(len(pdf_document), max_pages)):
+                pix = pdf_document[page_num].get_pixmap(matrix=fitz.Matrix(ZOOM, ZOOM))
+                pages.append((f"{path}#{page_num + 1}", PIL.Image.open(io.BytesIO(pix.tobytes())).convert("RGB")))
+    return pages
+
+
+def cpu_time(func, img, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.process_time()
+        func(img)
+        timings.append(time.process_time() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", nargs="*", default=[], help="PDF scan mẫu")
+    parser.add_argument("--max-pages", type=int, default=10, help="Số trang tối đa mỗi PDF")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    # Đo CPU time của một luồng, không để OpenCV tự song song hoá
+    cv2.setNumThreads(1)
+
+    pages = pdf_pages(args.pdf, args.max_pages) if args.pdf else synthetic_pages()
+    print(f"{'page':<28} {'legacy':>7} {'thumb':>7} {'legacy ms':>10} {'thumb ms':>9}")
+    legacy_total = new_total = 0.0
+    agreements = 0
+    for name, img in pages:
+        old_angle = legacy_angle(img)
+        decision = detect_orientation(img)
+        agreements += old_angle == decision.angle
+        legacy_ms = cpu_time(legacy_correct, img, args.runs) * 1000
+        new_ms = cpu_time(correct_orientation, img, args.runs) * 1000
+        legacy_total += legacy_ms
+        new_total += new_ms
+        print(f"{name[-28:]:<28} {old_angle:>7} {decision.angle:>7} {legacy_ms:>10.1f} {new_ms:>9.1f}"
+              f"  ({decision.source})")
+    print(f"\nSame decision: {agreements}/{len(pages)} pages")
+    print(f"CPU per page: legacy {legacy_total / len(pages):.1f} ms, "
+          f"thumbnail {new_total / len(pages):.1f} ms ({legacy_total / max(new_total, 1e-9):.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
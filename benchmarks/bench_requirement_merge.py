@@ -0,0 +1,112 @@
+"""
+Benchmark: merging technical requirement trees of overlapping chunks, legacy
+concatenation of ``sub_requirements`` vs. ``merge_requirement_trees``.
+
+Synthetic chunk results repeat the requirements around each chunk boundary
+(chunk overlap), once with a description cut at the boundary and with
+slightly different numbering / spacing. Reports requirement nodes (rows of
+``technical_requirement``), descriptions, JSON size and merge time, and
+checks that the merge is deterministic and loses no requirement.
+
+Usage:
+    python -m benchmarks.bench_requirement_merge [--requirements 400] [--chunks 12] [--runs 5]
+"""
+import argparse
+import copy
+import json
+import random
+import statistics
+import time
+
+from app.utils.requirement_merge import count_requirements, merge_requirement_trees
+
+ITEMS = ["Máy chủ ứng dụng", "Thiết bị lưu trữ", "Bản quyền phần mềm", "Dịch vụ bảo trì", "Thiết bị tường lửa",
+         "Đào tạo chuyển giao", "Hệ thống sao lưu", "Thiết bị chuyển mạch"]
+DETAILS = ["Bộ vi xử lý tối thiểu {n} nhân, tốc độ xung nhịp cơ bản từ 2.{n} GHz trở lên",
+           "Bộ nhớ RAM tối thiểu {m} GB, hỗ trợ mở rộng tối đa {k} GB theo khuyến nghị của hãng sản xuất",
+           "Bảo hành chính hãng tối thiểu {n} năm, hỗ trợ kỹ thuật 24/7 qua điện thoại và email",
+           "Nhà thầu phải cung cấp giấy phép bán hàng của hãng sản xuất hoặc đại lý phân phối cho gói thầu",
+           "Tương thích với hệ thống hiện có của chủ đầu tư, không phát sinh chi phí bản quyền bổ sung"]
+
+
+def build_requirements(count: int, seed: int = 7):
+    rng = random.Random(seed)
+    requirements = []
+    for i in range(count):
+        section, item = divmod(i, 8)
+        details = [{"description_detail": rng.choice(DETAILS).format(n=rng.randint(2, 9), m=8 * rng.randint(1, 8),
+                                                                      k=64 * rng.randint(1, 8))}
+                   for _ in range(rng.randint(1, 4))]
+        requirements.append({
+            "requirement_level_1": {
+                "muc": f"{section + 1}.{item + 1}",
+                "requirement_name": f"Yêu cầu {ITEMS[item]} số {i + 1}",
+                "description": details,
+            }
+        })
+    return requirements
+
+
+def chunk_results(requirements, chunks: int, overlap: int = 2):
+    """Kết quả từng chunk: phần chồng lấn ở biên được bóc tách ở cả hai chunk."""
+    size = len(requirements) // chunks + 1
+    results = []
+    for c in range(chunks):
+        start, end = c * size, min(len(requirements), (c + 1) * size)
+        part = copy.deepcopy(requirements[max(0, start - overlap):end])
+        for requirement in part[:overlap] if c else []:
+            data = requirement["requirement_level_1"]
+            # Lần bóc tách thứ hai: mục có dấu chấm, tên có số thứ tự, mô tả cuối bị cắt ở biên chunk
+            data["muc"] += "."
+            data["requirement_name"] = f"{data['muc']} {data['requirement_name']}  "
+            last = data["description"][-1]
+            last["description_detail"] = last["description_detail"][:len(last["description_detail"]) * 2 // 3]
+        results.append({"requirement_level_0": {"muc": "1.", "requirement_name": "Yêu cầu kỹ thuật",
+                                                "sub_requirements": part}})
+    return results
+
+
+def legacy_merge(results):
+    merged = {"muc": "1.", "requirement_name": "Yêu cầu về kỹ thuật", "sub_requirements": []}
+    for item in results:
+        merged["sub_requirements"].extend(item.get("requirement_level_0", {}).get("sub_requirements", []))
+    return merged
+
+
+def count_descriptions(tree):
+    if isinstance(tree, list):
+        return sum(count_descriptions(item) for item in tree)
+    data = next(iter(tree.values()))
+    return len(data.get("description") or []) + count_descriptions(data.get("sub_requirements") or [])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requirements", type=int, default=400)
+    parser.add_argument("--chunks", type=int, default=12)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    requirements = build_requirements(args.requirements)
+    results = chunk_results(requirements, args.chunks)
+    roots = [r["requirement_level_0"] for r in results]
+
+    timings = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        merged = merge_requirement_trees(roots)
+        timings.append(time.perf_counter() - start)
+    legacy = legacy_merge(results)
+
+    assert merged == merge_requirement_trees(copy.deepcopy(roots)), "merge is not deterministic"
+    assert count_requirements(merged["sub_requirements"]) == len(requirements), "requirements lost or duplicated"
+
+    for name, tree in (("legacy concat", legacy), ("merge engine", merged)):
+        print(f"{name:>14}: {count_requirements(tree['sub_requirements']):5d} requirements, "
+              f"{count_descriptions(tree['sub_requirements']):5d} descriptions, "
+              f"{len(json.dumps(tree, ensure_ascii=False)) / 1024:7.1f} KB")
+    print(f"merge time: {statistics.median(timings) * 1000:.1f} ms (median of {args.runs})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark: end-to-end wall time of the v2 extraction graph, legacy topology
+(Summary HSMT gating every extraction branch) vs. the current topology
+(Summary HSMT as a parallel branch joined at Post-Extraction).
+
+Nodes are replaced by stubs that sleep for a configurable "LLM latency", so no
+network, database or model access is needed.
+
+Usage:
+    python -m benchmarks.bench_v2_graph_topology [--scale 0.5] [--runs 3]
+"""
+import argparse
+import statistics
+import time
+
+from langgraph.graph import END, START, StateGraph
+
+from app.nodes.agentic_proposal_v2.proposal_md_team_v2_0_0 import proposal_md_team_graph_v2_0_0
+from app.nodes.states.state_proposal_v1 import StateProposalV1
+
+# Độ trễ giả lập (giây) cho từng node, ước lượng theo log production
+STUB_LATENCIES = {
+    "PrepareDataDocumentNodeV2m0p0": 0.3,
+    "ClassifyDocumentPdfNodeV2m0p0": 0.05,
+    "SummaryHSMTNodeV2m0p1": 3.0,  # 1 lần gọi 16k token trên toàn bộ HSMT
+    "ExtractionHRMDNodeV2m0p0": 2.0,
+    "ExtractionFinanceMDNodeV2m0p0": 1.5,
+    "ExtractionExperienceMDNodeV2m0p0": 1.5,
+    "ExtractionTechnologyNodeV2m0p0": 4.0,
+    "ExtractionNoticeBidMDNodeV2m0p0": 1.0,
+    "PostExtractionMDNodeV2m0p0": 0.5,
+}
+
+BRANCHES = [
+    "ExtractionHRMDNodeV2m0p0",
+    "ExtractionFinanceMDNodeV2m0p0",
+    "ExtractionExperienceMDNodeV2m0p0",
+    "ExtractionTechnologyNodeV2m0p0",
+    "ExtractionNoticeBidMDNodeV2m0p0",
+]
+
+
+class StubNode:
+    """Node giả lập: ngủ trong `latency` giây và không ghi gì vào state."""
+
+    def __init__(self, name: str, latency: float):
+        self.name = name
+        self.latency = latency
+
+    def __call__(self, state):
+        time.sleep(self.latency)
+        return {}
+
+
+def make_stubs(scale: float):
+    return {name: StubNode(name, latency * scale) for name, latency in STUB_LATENCIES.items()}
+
+
+def legacy_graph(stubs):
+    """Topology cũ: Prepare -> Classify -> Summary -> (5 nhánh) -> Post."""
+    builder = StateGraph(StateProposalV1)
+    for name, stub in stubs.items():
+        builder.add_node(name, stub)
+    builder.add_edge(START, "PrepareDataDocumentNodeV2m0p0")
+    builder.add_edge("PrepareDataDocumentNodeV2m0p0", "ClassifyDocumentPdfNodeV2m0p0")
+    builder.add_edge("ClassifyDocumentPdfNodeV2m0p0", "SummaryHSMTNodeV2m0p1")
+    for branch in BRANCHES:
+        builder.add_edge("SummaryHSMTNodeV2m0p1", branch)
+    builder.add_edge(BRANCHES, "PostExtractionMDNodeV2m0p0")
+    builder.add_edge("PostExtractionMDNodeV2m0p0", END)
+    return builder.compile()
+
+
+def measure(graph, runs: int):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        graph.invoke({"hs_id": "bench", "document_file_md": []})
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=0.5, help="Hệ số nhân độ trễ giả lập")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    legacy = measure(legacy_graph(make_stubs(args.scale)), args.runs)
+    current = measure(proposal_md_team_graph_v2_0_0(node_overrides=make_stubs(args.scale)), args.runs)
+
+    print(f"Stub latencies (x{args.scale}): {STUB_LATENCIES}")
+    print(f"Legacy topology  (summary gates extraction): {legacy:.2f} s")
+    print(f"Current topology (summary as parallel branch): {current:.2f} s")
+    print(f"Reduction: {legacy - current:.2f} s ({(1 - current / legacy) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
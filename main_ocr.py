@@ -0,0 +1,35 @@
+import time
+import traceback
+
+from dotenv import load_dotenv
+
+from app.ocr_sub import ocr_sub
+from app.utils.logger import get_logger
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configure logging using centralized logger
+logger = get_logger("ocr_main")
+
+
+def main():
+    """Main function with retry logic for the distributed OCR worker"""
+    while True:
+        try:
+            logger.info("Starting OCR worker service ")
+            ocr_sub()
+        except Exception as e:
+            logger.error(f"Service failed: {str(e)}")
+            logger.debug(f"Traceback: {traceback.format_exc()}")
+            logger.info("Restarting in 30 seconds...")
+            time.sleep(30)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        logger.critical(f"Fatal error: {str(e)}")
+        logger.debug(f"Traceback: {traceback.format_exc()}")
+        exit(1)